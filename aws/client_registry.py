@@ -0,0 +1,107 @@
+"""
+Process-wide registry of boto3 clients.
+
+Building a client loads the service model and opens a new connection pool,
+so every AWS call in aws/ shares one client per (service, region, endpoint).
+boto3 clients are thread-safe; only their creation goes through the lock
+(boto3 sessions are not).
+"""
+import threading
+from typing import Any, Dict, Optional, Tuple
+import boto3
+from botocore.config import Config
+from config.settings import (
+    AWS_ACCESS_KEY_ID,
+    AWS_SECRET_ACCESS_KEY,
+    AWS_SESSION_TOKEN,
+    AWS_REGION,
+    AWS_ENDPOINT_URL,
+    VERIFY_SSL,
+    AWS_CREDENTIAL_SOURCE,
+    AWS_MAX_POOL_CONNECTIONS,
+    AWS_RETRY_MODE,
+    AWS_MAX_ATTEMPTS,
+    AWS_CONNECT_TIMEOUT_SECONDS,
+    AWS_READ_TIMEOUT_SECONDS,
+)
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_lock = threading.Lock()
+_session: Optional[boto3.session.Session] = None
+_clients: Dict[Tuple[str, str, Optional[str]], Any] = {}
+
+
+def _client_config() -> Config:
+    return Config(
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        retries={"mode": AWS_RETRY_MODE, "total_max_attempts": AWS_MAX_ATTEMPTS},
+        connect_timeout=AWS_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=AWS_READ_TIMEOUT_SECONDS,
+        tcp_keepalive=True,
+    )
+
+
+def _get_session() -> boto3.session.Session:
+    """Session shared by all clients (call with _lock held)."""
+    global _session
+    if _session is None:
+        if AWS_CREDENTIAL_SOURCE == "chain":
+            # Role / web identity credentials are RefreshableCredentials in botocore
+            _session = boto3.session.Session(region_name=AWS_REGION)
+        else:
+            _session = boto3.session.Session(
+                aws_access_key_id=AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                aws_session_token=AWS_SESSION_TOKEN or None,
+                region_name=AWS_REGION,
+            )
+        logger.debug(f"AWS session created (credentials: {AWS_CREDENTIAL_SOURCE})")
+    return _session
+
+
+def get_aws_client(service_name: str, endpoint_url: Optional[str] = AWS_ENDPOINT_URL):
+    """
+    Shared client for an AWS service, created on first use.
+
+    Args:
+        service_name: boto3 service name, e.g. "s3" or "sqs"
+        endpoint_url: Custom endpoint (LocalStack); defaults to AWS_ENDPOINT_URL
+    """
+    key = (service_name, AWS_REGION, endpoint_url)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+
+        client_kwargs: Dict[str, Any] = {"config": _client_config()}
+        if endpoint_url:
+            # LocalStack
+            client_kwargs.update(endpoint_url=endpoint_url, use_ssl=False, verify=False)
+        else:
+            # Use VERIFY_SSL environment variable to control SSL verification
+            client_kwargs["verify"] = VERIFY_SSL
+
+        client = _get_session().client(service_name, **client_kwargs)
+        _clients[key] = client
+        logger.info(
+            f"{service_name.upper()} client initialized (region: {AWS_REGION}, "
+            f"endpoint: {endpoint_url or 'default'}, pool: {AWS_MAX_POOL_CONNECTIONS}, "
+            f"retries: {AWS_RETRY_MODE}/{AWS_MAX_ATTEMPTS}, "
+            f"SSL verify: {client_kwargs['verify']})"
+        )
+        return client
+
+
+def reset_aws_clients() -> None:
+    """Drop cached clients and session, e.g. after static credentials were rotated."""
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
+    logger.info("AWS client registry reset")
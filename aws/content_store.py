@@ -0,0 +1,129 @@
+"""
+Attachment storage with SHA-256 content hashes.
+
+Every stored attachment gets its content hash, recorded on the
+invoice_documents row so downstream OCR can recognise content it has
+already processed. With S3_CONTENT_ADDRESSED the object is stored once
+per content under content_s3_key(hash): resends, reminders and copies to
+other mailboxes reuse the existing object (found through the
+invoice_documents index, else a HEAD request) instead of uploading again.
+"""
+import hashlib
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, Optional
+from aws.push_s3 import (
+    content_s3_key,
+    s3_object_exists,
+    s3_url_for_key,
+    upload_attachment_to_s3,
+    upload_stream_to_s3,
+)
+from config.settings import S3_CONTENT_ADDRESSED, S3_MULTIPART_PART_SIZE_BYTES
+from db.insert_document import find_document_url_by_hash
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Read size when a spooled stream is uploaded
+SPOOL_READ_BYTES = 1024 * 1024
+
+
+def _hashing(chunks: Iterable[bytes], digest) -> Iterator[bytes]:
+    for chunk in chunks:
+        if chunk:
+            digest.update(chunk)
+            yield chunk
+
+
+def _existing_content_url(content_sha256: str) -> Optional[str]:
+    """URL of an object already holding this content, if any."""
+    s3_url = find_document_url_by_hash(content_sha256)
+    if s3_url:
+        return s3_url
+    s3_key = content_s3_key(content_sha256)
+    if s3_object_exists(s3_key):
+        return s3_url_for_key(s3_key)
+    return None
+
+
+def _stored(s3_url: Optional[str], content_sha256: str) -> Optional[Dict[str, Any]]:
+    return {"s3_url": s3_url, "content_sha256": content_sha256} if s3_url else None
+
+
+def store_attachment(attachment_data: bytes, file_name: str, email_id: str,
+                     content_type: str = None) -> Optional[Dict[str, Any]]:
+    """
+    Store decoded attachment bytes.
+
+    Returns:
+        dict: {"s3_url", "content_sha256"}, or None when the upload failed
+    """
+    content_sha256 = hashlib.sha256(attachment_data).hexdigest()
+
+    if not S3_CONTENT_ADDRESSED:
+        return _stored(
+            upload_attachment_to_s3(attachment_data, file_name, email_id, content_type),
+            content_sha256
+        )
+
+    try:
+        existing = _existing_content_url(content_sha256)
+    except Exception as e:
+        logger.warning(f"⚠ Content lookup failed for {file_name}, uploading: {str(e)}")
+        existing = None
+    if existing:
+        logger.info(f"⏭ Attachment content already stored: {file_name} (sha256={content_sha256[:12]}...)")
+        return _stored(existing, content_sha256)
+
+    return _stored(
+        upload_attachment_to_s3(
+            attachment_data, file_name, email_id, content_type, content_s3_key(content_sha256)
+        ),
+        content_sha256
+    )
+
+
+def store_attachment_stream(chunks: Iterable[bytes], file_name: str, email_id: str,
+                            content_type: str = None) -> Optional[Dict[str, Any]]:
+    """
+    Store a streamed attachment, hashing it on the way.
+
+    The content key is only known once the whole stream is hashed, so in
+    content-addressed mode the stream is spooled (to disk beyond one part)
+    and uploaded only when the content is new.
+
+    Returns:
+        dict: {"s3_url", "content_sha256"}, or None when the upload failed
+    """
+    digest = hashlib.sha256()
+
+    if not S3_CONTENT_ADDRESSED:
+        s3_url = upload_stream_to_s3(_hashing(chunks, digest), file_name, email_id, content_type)
+        return _stored(s3_url, digest.hexdigest())
+
+    with tempfile.SpooledTemporaryFile(max_size=S3_MULTIPART_PART_SIZE_BYTES) as spool:
+        for chunk in _hashing(chunks, digest):
+            spool.write(chunk)
+        content_sha256 = digest.hexdigest()
+
+        try:
+            existing = _existing_content_url(content_sha256)
+        except Exception as e:
+            logger.warning(f"⚠ Content lookup failed for {file_name}, uploading: {str(e)}")
+            existing = None
+        if existing:
+            logger.info(
+                f"⏭ Attachment content already stored: {file_name} "
+                f"({spool.tell()} bytes, sha256={content_sha256[:12]}...)"
+            )
+            return _stored(existing, content_sha256)
+
+        spool.seek(0)
+        s3_url = upload_stream_to_s3(
+            iter(lambda: spool.read(SPOOL_READ_BYTES), b""),
+            file_name,
+            email_id,
+            content_type,
+            content_s3_key(content_sha256)
+        )
+        return _stored(s3_url, content_sha256)
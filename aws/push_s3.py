@@ -1,39 +1,226 @@
 from aws.s3_client import get_s3_client
+from botocore.exceptions import ClientError
 from utils.logger import get_logger
-from typing import Optional
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
 import uuid
-from config.settings import S3_BUCKET_NAME  ,AWS_ENDPOINT_URL
+from config.settings import (
+    S3_BUCKET_NAME, AWS_ENDPOINT_URL, S3_MULTIPART_PART_SIZE_BYTES,
+    S3_UPLOAD_CONCURRENCY, S3_STALE_UPLOAD_HOURS
+)
 logger = get_logger(__name__)
 
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+S3_MIN_PART_SIZE_BYTES = 5 * 1024 * 1024
+
+# Prefixes of attachment keys: per email, and content-addressed (SHA-256).
+# Stale multipart cleanup is limited to them.
+ATTACHMENT_KEY_PREFIX = "emails/"
+CONTENT_KEY_PREFIX = "content/sha256/"
+
+
+def _build_s3_key(email_id: str, file_name: str) -> str:
+    file_uuid = str(uuid.uuid4())
+    return f"{ATTACHMENT_KEY_PREFIX}{email_id}/attachments/{file_uuid}_{file_name}"
+
+
+def content_s3_key(content_sha256: str) -> str:
+    """Key shared by every attachment with these bytes."""
+    return f"{CONTENT_KEY_PREFIX}{content_sha256[:2]}/{content_sha256}"
+
+
+def _part_size() -> int:
+    return max(S3_MULTIPART_PART_SIZE_BYTES, S3_MIN_PART_SIZE_BYTES)
+
+
+def s3_url_for_key(s3_key: str) -> str:
+    return f"{AWS_ENDPOINT_URL}/{S3_BUCKET_NAME}/{s3_key}"
+
+
+def s3_object_exists(s3_key: str) -> bool:
+    """HEAD the object; False when it does not exist."""
+    try:
+        get_s3_client().head_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
 
 
 def upload_attachment_to_s3(attachment_data: bytes, file_name: str,
-                            email_id: str, content_type: str = None) -> Optional[str]:
-    """Upload attachment to S3."""
+                            email_id: str, content_type: str = None,
+                            s3_key: str = None) -> Optional[str]:
+    """
+    Upload attachment to S3 (under s3_key, else a new per-email key).
+    One put_object up to one part size; larger files use a parallel
+    multipart upload (see upload_stream_to_s3).
+    """
+    part_size = _part_size()
+    if len(attachment_data) > part_size:
+        parts = (attachment_data[offset:offset + part_size]
+                 for offset in range(0, len(attachment_data), part_size))
+        return upload_stream_to_s3(parts, file_name, email_id, content_type, s3_key)
+
     try:
         logger.info(f"Starting S3 upload for email_id={email_id}, file={file_name}")
         s3_client = get_s3_client()
-        
-        file_uuid = str(uuid.uuid4())
-        s3_key = f"emails/{email_id}/attachments/{file_uuid}_{file_name}"
+
+        s3_key = s3_key or _build_s3_key(email_id, file_name)
         logger.debug(f"S3 key generated: {s3_key}")
         upload_params = {
             'Bucket': S3_BUCKET_NAME,
             'Key': s3_key,
             'Body': attachment_data
         }
-        
+
         if content_type:
             upload_params['ContentType'] = content_type
             logger.debug(f"Content-Type set: {content_type}")
         logger.info(f"Uploading file to S3 bucket={S3_BUCKET_NAME} at key={s3_key}...")
         s3_client.put_object(**upload_params)
-        s3_url = f"{AWS_ENDPOINT_URL}/{S3_BUCKET_NAME}/{s3_key}"
+        s3_url = s3_url_for_key(s3_key)
         logger.info(f"Upload complete for file={file_name}")
-        
+
         logger.debug(f"S3 uploaded: {file_name}")
         return s3_url
-        
+
     except Exception as e:
         logger.error(f"S3 upload error: {str(e)}")
         return None
+
+
+def _iter_parts(chunks: Iterable[bytes], part_size: int) -> Iterator[bytes]:
+    """Regroup a byte stream into parts of part_size (the last one may be smaller)."""
+    buffer = bytearray()
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer.extend(chunk)
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def _upload_part(s3_client, s3_key: str, upload_id: str, part_number: int, body: bytes) -> Dict:
+    """Upload one part; the shared client's retry config retries only this part."""
+    response = s3_client.upload_part(
+        Bucket=S3_BUCKET_NAME,
+        Key=s3_key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=body
+    )
+    logger.debug(f"Uploaded part {part_number} ({len(body)} bytes) for key={s3_key}")
+    return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+
+def upload_stream_to_s3(chunks: Iterable[bytes], file_name: str,
+                        email_id: str, content_type: str = None,
+                        s3_key: str = None) -> Optional[str]:
+    """
+    Upload a stream of byte chunks to S3 with a multipart upload.
+    Up to S3_UPLOAD_CONCURRENCY parts upload in parallel while the stream
+    is read on; at most that many parts (S3_MULTIPART_PART_SIZE_BYTES each)
+    are buffered. A failed part is retried on its own (botocore retries,
+    AWS_MAX_ATTEMPTS); if it still fails the upload is aborted.
+    """
+    s3_client = None
+    upload_id = None
+    concurrency = max(1, S3_UPLOAD_CONCURRENCY)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3-part")
+    try:
+        logger.info(f"Starting S3 streaming upload for email_id={email_id}, file={file_name}")
+        s3_client = get_s3_client()
+
+        s3_key = s3_key or _build_s3_key(email_id, file_name)
+        create_params = {'Bucket': S3_BUCKET_NAME, 'Key': s3_key}
+        if content_type:
+            create_params['ContentType'] = content_type
+        upload_id = s3_client.create_multipart_upload(**create_params)['UploadId']
+        logger.debug(f"Multipart upload created: key={s3_key}, upload_id={upload_id}")
+
+        in_flight: List[Future] = []
+        parts = []
+        total_bytes = 0
+
+        for part_number, body in enumerate(_iter_parts(chunks, _part_size()), start=1):
+            if len(in_flight) >= concurrency:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    parts.append(future.result())
+                in_flight = [f for f in in_flight if f not in done]
+            in_flight.append(executor.submit(_upload_part, s3_client, s3_key, upload_id, part_number, body))
+            total_bytes += len(body)
+
+        # An empty stream still needs one part
+        if not in_flight and not parts:
+            in_flight.append(executor.submit(_upload_part, s3_client, s3_key, upload_id, 1, b""))
+        for future in in_flight:
+            parts.append(future.result())
+        parts.sort(key=lambda part: part['PartNumber'])
+
+        s3_client.complete_multipart_upload(
+            Bucket=S3_BUCKET_NAME,
+            Key=s3_key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        s3_url = s3_url_for_key(s3_key)
+        logger.info(f"Streaming upload complete for file={file_name} ({total_bytes} bytes, {len(parts)} parts)")
+        return s3_url
+
+    except Exception as e:
+        logger.error(f"S3 streaming upload error: {str(e)}")
+        if s3_client and upload_id:
+            # Let queued parts fail fast instead of uploading into an aborted upload
+            executor.shutdown(wait=True, cancel_futures=True)
+            try:
+                s3_client.abort_multipart_upload(Bucket=S3_BUCKET_NAME, Key=s3_key, UploadId=upload_id)
+                logger.debug(f"Aborted multipart upload for key={s3_key}")
+            except Exception as abort_error:
+                logger.warning(f"Failed to abort multipart upload for key={s3_key}: {str(abort_error)}")
+        return None
+
+    finally:
+        executor.shutdown(wait=False)
+
+
+def abort_stale_multipart_uploads(max_age_hours: int = S3_STALE_UPLOAD_HOURS) -> int:
+    """
+    Abort attachment multipart uploads started more than max_age_hours ago.
+    Their parts are billed until aborted - e.g. after a crash mid-upload.
+
+    Returns:
+        int: Number of uploads aborted
+    """
+    aborted = 0
+    try:
+        s3_client = get_s3_client()
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+        paginator = s3_client.get_paginator('list_multipart_uploads')
+        pages = (
+            page
+            for prefix in (ATTACHMENT_KEY_PREFIX, CONTENT_KEY_PREFIX)
+            for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=prefix)
+        )
+        for page in pages:
+            for upload in page.get('Uploads', []):
+                if upload['Initiated'] >= cutoff:
+                    continue
+                try:
+                    s3_client.abort_multipart_upload(
+                        Bucket=S3_BUCKET_NAME, Key=upload['Key'], UploadId=upload['UploadId']
+                    )
+                    aborted += 1
+                    logger.debug(f"Aborted stale multipart upload for key={upload['Key']}")
+                except Exception as e:
+                    logger.warning(f"Failed to abort stale multipart upload for key={upload['Key']}: {str(e)}")
+        if aborted:
+            logger.info(f"✓ Aborted {aborted} stale multipart upload(s) older than {max_age_hours}h")
+    except Exception as e:
+        logger.error(f"Stale multipart upload cleanup error: {str(e)}")
+    return aborted
@@ -1,59 +1,196 @@
 from aws.sqs_client import get_sqs_client
+from botocore.exceptions import ClientError, ConnectTimeoutError, EndpointConnectionError
 from utils.logger import get_logger
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+from config.settings import SQS_BATCH_LINGER_MS, SQS_BATCH_MAX_RETRIES
 import json
+import threading
+import time
 
 logger = get_logger(__name__)
 
-def push_to_sqs_queue(work_id: str, queue_url: str) -> bool:
+# SendMessageBatch accepts at most 10 entries
+SQS_MAX_BATCH_SIZE = 10
+
+# Errors after which SQS certainly did not enqueue the batch: it was never
+# sent, or SQS answered with an error for the whole call
+_NOT_DELIVERED_ERRORS = (ClientError, ConnectTimeoutError, EndpointConnectionError)
+
+
+def _work_id_entry(entry_id: str, work_id: str, is_fifo: bool) -> Dict[str, str]:
+    entry = {'Id': entry_id, 'MessageBody': json.dumps({"work_id": work_id})}
+    if is_fifo:
+        entry['MessageGroupId'] = work_id  # Required for FIFO
+        entry['MessageDeduplicationId'] = work_id  # Prevents duplicates
+    return entry
+
+
+class SqsBatchPublisher:
     """
-    Push ONLY work_id to SQS queue.
-    
-    Args:
-        work_id: The work_id to send
-        queue_url: The SQS queue URL (passed from caller)
-    
-    Returns:
-        bool: True if successful, False otherwise
+    Buffers work_ids for one queue and sends them with SendMessageBatch.
+
+    A batch is sent as soon as 10 work_ids are waiting, or SQS_BATCH_LINGER_MS
+    after the first one arrived. publish() returns a Future resolved with
+    True/False once the work_id was accepted or finally failed. Entries that
+    fail inside a batch are retried on their own; sender faults (invalid
+    message) are not retried. A call that may have reached SQS (e.g. a read
+    timeout) is only resent on FIFO queues, whose deduplication ids drop the
+    copies - a standard queue would deliver them twice.
     """
-    try:
-        logger.info(f"Preparing to push work_id={work_id} to SQS")
-        
-        if not queue_url:
-            logger.error("SQS Queue URL not provided")
-            return False
-        
+
+    def __init__(self, queue_url: str):
+        self.queue_url = queue_url
+        self.is_fifo = queue_url.endswith('.fifo')
+        self._pending: List[Tuple[str, Future]] = []
+        self._first_pending_at = 0.0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="sqs-batch-publisher", daemon=True)
+        self._thread.start()
+
+    def publish(self, work_id: str) -> Future:
+        future: Future = Future()
+        with self._condition:
+            if self._closed:
+                future.set_result(False)
+                logger.error(f"SQS publisher closed - work_id={work_id} not sent")
+                return future
+            if not self._pending:
+                self._first_pending_at = time.monotonic()
+            self._pending.append((work_id, future))
+            self._condition.notify()
+        return future
+
+    def _take_batch(self) -> Optional[List[Tuple[str, Future]]]:
+        """Wait for a full batch or an expired linger; None once closed and drained."""
+        linger = SQS_BATCH_LINGER_MS / 1000
+        with self._condition:
+            while True:
+                if self._pending:
+                    remaining = self._first_pending_at + linger - time.monotonic()
+                    if len(self._pending) >= SQS_MAX_BATCH_SIZE or remaining <= 0 or self._closed:
+                        batch = self._pending[:SQS_MAX_BATCH_SIZE]
+                        self._pending = self._pending[SQS_MAX_BATCH_SIZE:]
+                        # Leftovers keep the older start time and go out next
+                        return batch
+                    self._condition.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._condition.wait()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                self._send(batch)
+            except Exception as e:
+                logger.error(f"SQS batch publish error: {str(e)}", exc_info=True)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(False)
+
+    def _send(self, batch: List[Tuple[str, Future]]) -> None:
         sqs_client = get_sqs_client()
         if not sqs_client:
             logger.error("Failed to get SQS client")
-            return False
-        
-        # MINIMAL PAYLOAD - Only work_id
-        message_body = {"work_id": work_id}
-        
-        logger.debug(f"Message payload: {message_body}")
-        logger.debug(f"Sending message to SQS queue: {queue_url}")
-        
-        # Check if queue is FIFO (ends with .fifo)
-        is_fifo = queue_url.endswith('.fifo')
-        
-        send_params = {
-            'QueueUrl': queue_url,
-            'MessageBody': json.dumps(message_body)
-        }
-        
-        # Add FIFO-specific parameters if needed
-        if is_fifo:
-            send_params['MessageGroupId'] = work_id  # Required for FIFO
-            send_params['MessageDeduplicationId'] = work_id  # Prevents duplicates
-            logger.debug(f"FIFO queue detected - using MessageGroupId={work_id}")
-        
-        response = sqs_client.send_message(**send_params)
-        
-        logger.debug(f"Full SQS response: {response}")
-        logger.info(f"✓ SQS: work_id={work_id}, msg_id={response.get('MessageId')}")
-        
-        return True
-        
-    except Exception as e:
-        logger.error(f"SQS push error for work_id={work_id}: {str(e)}", exc_info=True)
-        return False
\ No newline at end of file
+            for _, future in batch:
+                future.set_result(False)
+            return
+
+        # Entry ids only need to be unique within one call
+        remaining = {str(index): item for index, item in enumerate(batch)}
+        for attempt in range(SQS_BATCH_MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(min(0.1 * 2 ** (attempt - 1), 2.0))
+            try:
+                response = sqs_client.send_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[_work_id_entry(entry_id, work_id, self.is_fifo)
+                             for entry_id, (work_id, _) in remaining.items()]
+                )
+            except Exception as e:
+                # botocore already retried the call itself
+                logger.warning(
+                    f"SendMessageBatch failed (attempt {attempt + 1}) | entries={len(remaining)} | Error: {str(e)}"
+                )
+                if self.is_fifo or isinstance(e, _NOT_DELIVERED_ERRORS):
+                    continue
+                for work_id, future in remaining.values():
+                    logger.error(f"SQS push outcome unknown for work_id={work_id}, not resent (standard queue)")
+                    future.set_result(False)
+                return
+
+            for success in response.get('Successful', []):
+                work_id, future = remaining.pop(success['Id'])
+                logger.info(f"✓ SQS: work_id={work_id}, msg_id={success.get('MessageId')}")
+                future.set_result(True)
+
+            for failure in response.get('Failed', []):
+                if failure.get('SenderFault'):
+                    work_id, future = remaining.pop(failure['Id'])
+                    logger.error(
+                        f"SQS rejected work_id={work_id}: {failure.get('Code')} {failure.get('Message')}"
+                    )
+                    future.set_result(False)
+
+            if not remaining:
+                return
+            logger.warning(f"Retrying {len(remaining)} failed SQS batch entries")
+
+        for work_id, future in remaining.values():
+            logger.error(f"SQS push failed for work_id={work_id} after {SQS_BATCH_MAX_RETRIES} retries")
+            future.set_result(False)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Send everything still buffered, then stop the sender thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+
+_publishers: Dict[str, SqsBatchPublisher] = {}
+_publishers_lock = threading.Lock()
+# Set by close_sqs_publishers - no new publisher threads after shutdown
+_publishers_closed = False
+
+
+def get_sqs_publisher(queue_url: str) -> Optional[SqsBatchPublisher]:
+    """Shared batch publisher for a queue, created on first use; None after shutdown."""
+    with _publishers_lock:
+        if _publishers_closed:
+            return None
+        publisher = _publishers.get(queue_url)
+        if publisher is None:
+            publisher = SqsBatchPublisher(queue_url)
+            _publishers[queue_url] = publisher
+        return publisher
+
+
+def publish_work_id(work_id: str, queue_url: str) -> Future:
+    """Queue a work_id for batched sending; the Future resolves to True when sent."""
+    publisher = get_sqs_publisher(queue_url) if queue_url else None
+    if publisher is None:
+        if queue_url:
+            logger.error(f"SQS publishers closed - work_id={work_id} not sent")
+        else:
+            logger.error("SQS Queue URL not provided")
+        future: Future = Future()
+        future.set_result(False)
+        return future
+    return publisher.publish(work_id)
+
+
+def close_sqs_publishers() -> None:
+    """Flush buffered work_ids on shutdown; later publishes are refused."""
+    global _publishers_closed
+    with _publishers_lock:
+        _publishers_closed = True
+        publishers = list(_publishers.values())
+        _publishers.clear()
+    for publisher in publishers:
+        publisher.close()
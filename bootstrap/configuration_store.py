@@ -1,2 +1,185 @@
+"""
+In-memory tenant configuration.
 
-CONFIG = None
\ No newline at end of file
+Scans and the scheduler only ever read the cached snapshot; the tenant DB
+is queried at startup and then by a background thread, which reloads when
+the tenant_config trigger fires a NOTIFY or TENANT_CONFIG_TTL_SECONDS pass.
+A failed reload keeps the last good configuration.
+"""
+import select
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from psycopg2 import extensions
+from bootstrap.tentant_config import (
+    TENANT_CONFIG_CHANNEL,
+    fetch_tenant_config,
+    install_tenant_config_trigger,
+    tenant_config_trigger_exists,
+)
+from config.settings import (
+    SCHEDULER_INTERVAL_MINUTES,
+    TENANT_CONFIG_INSTALL_TRIGGER,
+    TENANT_CONFIG_LISTEN_ENABLED,
+    TENANT_CONFIG_TTL_SECONDS,
+    USER_EMAIL,
+)
+from db.connections import get_tenant_db
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Delay before reconnecting the LISTEN connection after it dropped
+LISTEN_RETRY_SECONDS = 30
+
+# Latest configuration snapshot (replaced, never mutated)
+CONFIG: Optional[Dict[str, Any]] = None
+
+_refresh_lock = threading.Lock()
+_loaded_at = 0.0
+_stop = threading.Event()
+_listener_thread: Optional[threading.Thread] = None
+
+
+def _fallback_config() -> Optional[Dict[str, Any]]:
+    if not USER_EMAIL:
+        return None
+    return {
+        "email_addresses": [USER_EMAIL],
+        "scan_interval_mins": None,
+        "user_email": USER_EMAIL,
+        "source": "env"
+    }
+
+
+def refresh_config(reason: str) -> bool:
+    """Reload tenant_config into the cache. Returns False when the last good config was kept."""
+    global CONFIG, _loaded_at
+
+    with _refresh_lock:
+        config = fetch_tenant_config()
+        _loaded_at = time.monotonic()
+
+        if config is None:
+            if CONFIG is None:
+                CONFIG = _fallback_config()
+                if CONFIG:
+                    logger.warning(f"⚠ Tenant config unavailable - scanning USER_EMAIL={USER_EMAIL}")
+            else:
+                logger.warning(f"⚠ Tenant config reload failed ({reason}) - keeping the cached config")
+            return False
+
+        config["source"] = "tenant_db"
+        if config != CONFIG:
+            logger.info(
+                f"✓ Tenant config loaded ({reason}) | mailboxes={len(config['email_addresses'])}, "
+                f"interval={config['scan_interval_mins']} mins"
+            )
+        CONFIG = config
+        return True
+
+
+def load_config() -> Optional[Dict[str, Any]]:
+    """Initial load at startup."""
+    refresh_config("startup")
+    return CONFIG
+
+
+def get_config() -> Optional[Dict[str, Any]]:
+    return CONFIG
+
+
+def get_mailboxes() -> List[str]:
+    config = CONFIG
+    return list(config["email_addresses"]) if config else []
+
+
+def get_scan_interval_minutes() -> int:
+    """Tenant scan interval, else SCHEDULER_INTERVAL_MINUTES."""
+    config = CONFIG
+    if config and config.get("scan_interval_mins"):
+        return config["scan_interval_mins"]
+    return SCHEDULER_INTERVAL_MINUTES
+
+
+def _open_listener():
+    """Dedicated autocommit connection LISTENing on the tenant_config channel."""
+    conn = get_tenant_db()
+    if conn is None:
+        return None
+    try:
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = conn.cursor()
+        # Without the trigger changes are only picked up by the TTL reload
+        if TENANT_CONFIG_INSTALL_TRIGGER:
+            try:
+                install_tenant_config_trigger(cursor)
+            except Exception as e:
+                logger.warning(f"⚠ Could not install tenant_config trigger: {str(e)}")
+        elif not tenant_config_trigger_exists(cursor):
+            logger.warning(
+                f"⚠ No tenant_config NOTIFY trigger - changes apply after "
+                f"TENANT_CONFIG_TTL_SECONDS={TENANT_CONFIG_TTL_SECONDS}"
+            )
+        cursor.execute(f"LISTEN {TENANT_CONFIG_CHANNEL}")
+        cursor.close()
+        logger.info(f"Listening for tenant config changes on '{TENANT_CONFIG_CHANNEL}'")
+        return conn
+    except Exception as e:
+        logger.error(f"Tenant config LISTEN setup failed: {str(e)}")
+        conn.close()
+        return None
+
+
+def _listen_loop() -> None:
+    conn = None
+    while not _stop.is_set():
+        remaining = max(0.0, _loaded_at + TENANT_CONFIG_TTL_SECONDS - time.monotonic())
+        try:
+            if conn is None and TENANT_CONFIG_LISTEN_ENABLED:
+                conn = _open_listener()
+                if conn is not None:
+                    # Changes made while we were not listening
+                    refresh_config("listener connected")
+                    continue
+
+            if conn is None:
+                _stop.wait(min(remaining, LISTEN_RETRY_SECONDS) if TENANT_CONFIG_LISTEN_ENABLED else remaining)
+            elif select.select([conn], [], [], remaining) != ([], [], []):
+                conn.poll()
+                if conn.notifies:
+                    # A burst of changes needs only one reload
+                    conn.notifies.clear()
+                    refresh_config("notify")
+                    continue
+
+            if time.monotonic() >= _loaded_at + TENANT_CONFIG_TTL_SECONDS:
+                refresh_config("ttl")
+
+        except Exception as e:
+            logger.warning(f"⚠ Tenant config listener error, reconnecting: {str(e)}")
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+            _stop.wait(LISTEN_RETRY_SECONDS)
+
+    if conn is not None:
+        conn.close()
+    logger.info("Tenant config listener stopped")
+
+
+def start_config_listener() -> None:
+    """Start the background reload thread (LISTEN/NOTIFY + TTL)."""
+    global _listener_thread
+    if _listener_thread is not None and _listener_thread.is_alive():
+        return
+    _stop.clear()
+    _listener_thread = threading.Thread(target=_listen_loop, name="tenant-config-listener", daemon=True)
+    _listener_thread.start()
+
+
+def stop_config_listener() -> None:
+    _stop.set()
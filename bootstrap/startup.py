@@ -2,9 +2,9 @@ from typing import Optional, Dict, Any
 from utils.logger import get_logger
 from aws.check_s3 import ensure_s3_bucket_exists
 from aws.check_sqs import ensure_sqs_queue_exists
-from config.settings import S3_BUCKET_NAME
-from bootstrap.tentant_config import fetch_tenant_config
-from bootstrap.configuration_store import CONFIG
+from config.settings import S3_BUCKET_NAME, SCHEMA_CHECK_MODE
+from bootstrap.configuration_store import load_config
+from db.schema import apply_migrations, verify_hot_query_plans
 
 logger = get_logger(__name__)
 
@@ -13,7 +13,6 @@ def check_config() -> bool:
     Perform startup checks and load runtime configuration.
     Verifies S3, SQS, and tenant config availability.
     """
-    global CONFIG
     logger.info("SERVICE STARTUP CHECK — INITIALIZING DEPENDENCIES")
 
     # ---- S3 (blocking) ----
@@ -30,17 +29,36 @@ def check_config() -> bool:
         return False
     logger.info("SQS queue check passed")
 
+    # ---- Scanner schema migrations (blocking) ----
+    logger.info("Applying scanner schema migrations...")
+    if not apply_migrations():
+        logger.error("Startup check failed — scanner schema migration failed")
+        return False
+    logger.info("Scanner schema migrations passed")
+
+    # ---- Hot query plans (blocking only in strict mode) ----
+    if SCHEMA_CHECK_MODE != "off":
+        logger.info(f"Checking hot query plans (mode={SCHEMA_CHECK_MODE})...")
+        if not verify_hot_query_plans():
+            if SCHEMA_CHECK_MODE == "strict":
+                logger.error("Startup check failed — hot query would seq scan in strict mode")
+                return False
+            logger.warning("Hot query plan check failed — see warnings above")
+        else:
+            logger.info("✓ Hot queries are index-backed")
+
     # ---- Tenant config (blocking) ----
     logger.info("Loading tenant configuration...")
-    CONFIG = fetch_tenant_config()
+    config = load_config()
 
-    if not CONFIG:
+    if not config:
         logger.error("Startup check failed — tenant configuration missing or invalid")
         return False
 
     # ---- Summary ----
     logger.info("Startup configuration loaded successfully")
-    logger.info(f"Scan interval (mins)  : {CONFIG['scan_interval_mins']}")
+    logger.info(f"Mailboxes             : {', '.join(config['email_addresses'])} ({config['source']})")
+    logger.info(f"Scan interval (mins)  : {config['scan_interval_mins'] or 'default'}")
     logger.info(f"S3 bucket             : {S3_BUCKET_NAME}")
 
     logger.info("SERVICE READY — ALL REQUIRED DEPENDENCIES AVAILABLE")
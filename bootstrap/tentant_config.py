@@ -1,53 +1,104 @@
-from db.connections import get_tenant_db
-from typing import Optional ,Dict,Any
+from db.connections import tenant_connection
+from typing import Optional ,Dict,Any,List
 from utils.logger import get_logger
 logger=get_logger(__name__)
+
+# Channel notified by the tenant_config trigger on every change
+TENANT_CONFIG_CHANNEL = "tenant_config_changed"
+
+TENANT_CONFIG_QUERY = """
+    SELECT invoice_email_addresses, email_scan_interval_mins
+    FROM public.tenant_config
+    WHERE is_active = true
+"""
+
+# Statement-level trigger: one NOTIFY per change, whatever the number of rows.
+# Normally created by the tenant DB owner (see readme); the service only
+# installs it with TENANT_CONFIG_INSTALL_TRIGGER=true
+TENANT_CONFIG_TRIGGER = f"""
+    CREATE OR REPLACE FUNCTION notify_tenant_config_changed() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{TENANT_CONFIG_CHANNEL}', TG_OP);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER tenant_config_changed
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.tenant_config
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_tenant_config_changed();
+"""
+
+
+def _email_addresses(value: Any) -> List[str]:
+    """invoice_email_addresses may be an array or a comma-separated string."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [address.strip() for address in value if address and address.strip()]
+
+
 def fetch_tenant_config() -> Optional[Dict[str, Any]]:
-    # """Fetch tenant configuration."""
-    # conn = None
-    # try:
-    #     conn = get_tenant_db()
-    #     cursor = conn.cursor()
-        
-    #     query = """
-    #         SELECT invoice_email_addresses, email_scan_interval_mins
-    #         FROM public.tenant_config
-    #         WHERE is_active = true
-    #         LIMIT 1
-    #     """
-        
-    #     cursor.execute(query)
-    #     row = cursor.fetchone()
-    #     cursor.close()
-        
-    #     if row:
-    #         user_email = row[0]  
-    #         if not user_email:
-    #             logger.error("USER_EMAIL missing in tenant_config table!")
-    #             return None
-            
-    #         config = {
-    #             "email_addresses": row[0] if row[0] else [],
-    #             "scan_interval_mins": row[1],
-    #             "user_email": user_email
-    #         }
-            
-    #         logger.info(f"Config: {config['user_email']}, Interval: {config['scan_interval_mins']} mins")
-    #         return config
-    #     else:
-    #         logger.warning("No active tenant config")
-    #         return None
-        
-    # except Exception as e:
-    #     logger.error(f"Config error: {str(e)}")
-    #     return None
-    # finally:
-    #     if conn:
-    #         conn.close()
-
-    return  {
-                "email_addresses": [],
-                "scan_interval_mins": 10,
-                "user_email": "SprintAPtest1@mindsprint.com"
-            }
+    """
+    Fetch the active tenant configuration.
+
+    Mailboxes of all active rows are merged; the shortest scan interval wins.
+
+    Returns:
+        dict: email_addresses, user_email (first mailbox), scan_interval_mins,
+              or None when there is no usable active row or the query failed
+    """
+    try:
+        with tenant_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(TENANT_CONFIG_QUERY)
+            rows = cursor.fetchall()
+            cursor.close()
+
+        if not rows:
+            logger.warning("No active tenant config")
+            return None
+
+        email_addresses: List[str] = []
+        intervals = []
+        for addresses, interval in rows:
+            for address in _email_addresses(addresses):
+                if address.lower() not in (a.lower() for a in email_addresses):
+                    email_addresses.append(address)
+            if interval and interval > 0:
+                intervals.append(int(interval))
+
+        if not email_addresses:
+            logger.error("USER_EMAIL missing in tenant_config table!")
+            return None
+
+        config = {
+            "email_addresses": email_addresses,
+            "scan_interval_mins": min(intervals) if intervals else None,
+            "user_email": email_addresses[0]
+        }
+
+        logger.info(f"Config: {', '.join(email_addresses)}, Interval: {config['scan_interval_mins']} mins")
+        return config
+
+    except Exception as e:
+        logger.error(f"Config error: {str(e)}")
+        return None
+
+
+def tenant_config_trigger_exists(cursor) -> bool:
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_trigger "
+        "WHERE tgname = 'tenant_config_changed' AND tgrelid = 'public.tenant_config'::regclass)"
+    )
+    return cursor.fetchone()[0]
+
 
+def install_tenant_config_trigger(cursor) -> None:
+    """
+    Create the NOTIFY trigger on tenant_config unless it already exists.
+    Needs owner rights on the tenant DB - only run with TENANT_CONFIG_INSTALL_TRIGGER.
+    """
+    if not tenant_config_trigger_exists(cursor):
+        cursor.execute(TENANT_CONFIG_TRIGGER)
+        logger.info(f"✓ tenant_config NOTIFY trigger installed (channel={TENANT_CONFIG_CHANNEL})")
@@ -7,6 +7,34 @@ CLIENT_ID = os.getenv("GRAPH_CLIENT_ID")
 CLIENT_SECRET = os.getenv("GRAPH_CLIENT_SECRET")
 TENANT_ID = os.getenv("GRAPH_TENANT_ID")
 GRAPH_API_ENDPOINT = os.getenv("GRAPH_API_ENDPOINT", "https://graph.microsoft.com/v1.0")
+# Re-acquire the Graph token this many seconds before it expires (at most 300 - MSAL renews no earlier)
+GRAPH_TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("GRAPH_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+# Optional file path to persist the MSAL token cache across restarts
+GRAPH_TOKEN_CACHE_PATH = os.getenv("GRAPH_TOKEN_CACHE_PATH")
+# Graph transport: retries with Retry-After / jittered exponential backoff, timeouts
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "5"))
+GRAPH_BACKOFF_BASE_SECONDS = float(os.getenv("GRAPH_BACKOFF_BASE_SECONDS", "1"))
+GRAPH_BACKOFF_MAX_SECONDS = float(os.getenv("GRAPH_BACKOFF_MAX_SECONDS", "60"))
+# Server-mandated Retry-After is honored in full up to this sanity cap
+GRAPH_RETRY_AFTER_MAX_SECONDS = float(os.getenv("GRAPH_RETRY_AFTER_MAX_SECONDS", "900"))
+GRAPH_CONNECT_TIMEOUT_SECONDS = float(os.getenv("GRAPH_CONNECT_TIMEOUT_SECONDS", "10"))
+GRAPH_READ_TIMEOUT_SECONDS = float(os.getenv("GRAPH_READ_TIMEOUT_SECONDS", "60"))
+# Graph transport: AIMD concurrency window (in-flight requests)
+GRAPH_CONCURRENCY_INITIAL = int(os.getenv("GRAPH_CONCURRENCY_INITIAL", "4"))
+GRAPH_CONCURRENCY_MIN = int(os.getenv("GRAPH_CONCURRENCY_MIN", "1"))
+GRAPH_CONCURRENCY_MAX = int(os.getenv("GRAPH_CONCURRENCY_MAX", "16"))
+# How long a mailbox's folder name -> id map is cached
+FOLDER_CACHE_TTL_SECONDS = int(os.getenv("FOLDER_CACHE_TTL_SECONDS", "3600"))
+# Retries for throttled/failed items inside a Graph $batch call
+GRAPH_BATCH_MAX_RETRIES = int(os.getenv("GRAPH_BATCH_MAX_RETRIES", "3"))
+# Message listing: messages per page (Graph max 1000) and optional comma-separated $select override
+GRAPH_MESSAGE_PAGE_SIZE = int(os.getenv("GRAPH_MESSAGE_PAGE_SIZE", "100"))
+GRAPH_MESSAGE_SELECT = os.getenv("GRAPH_MESSAGE_SELECT")
+# Expand attachment metadata (no bytes) into listed messages instead of a separate /attachments call
+# (timestamp listings and push fetches; messages/delta does not support $expand)
+GRAPH_EXPAND_ATTACHMENTS = os.getenv("GRAPH_EXPAND_ATTACHMENTS", "true").lower() in ('true', '1', 'yes')
+# Sync mode: "delta" (Graph messages/delta with a stored deltaLink) or "timestamp"
+GRAPH_SYNC_MODE = os.getenv("GRAPH_SYNC_MODE", "delta").lower()
 
 # Main Database Configuration
 DB_HOST = os.getenv("DB_HOST")
@@ -22,6 +50,43 @@ TENANT_DB_NAME = os.getenv("TENANT_DB_NAME", "tenant_db")
 TENANT_DB_USER = os.getenv("TENANT_DB_USER")
 TENANT_DB_PASSWORD = os.getenv("TENANT_DB_PASSWORD")
 
+# Tenant configuration cache (tenant_config rows, reloaded on LISTEN/NOTIFY or after the TTL)
+TENANT_CONFIG_TTL_SECONDS = int(os.getenv("TENANT_CONFIG_TTL_SECONDS", "300"))
+TENANT_CONFIG_LISTEN_ENABLED = os.getenv("TENANT_CONFIG_LISTEN_ENABLED", "true").lower() in ('true', '1', 'yes')
+# Let the service create the tenant_config NOTIFY trigger itself (DDL on the shared tenant DB, needs owner rights)
+TENANT_CONFIG_INSTALL_TRIGGER = os.getenv("TENANT_CONFIG_INSTALL_TRIGGER", "false").lower() in ('true', '1', 'yes')
+# Mailbox scanned when the tenant DB has no active configuration (or is unreachable at startup);
+# unset, a missing tenant config fails the startup check
+USER_EMAIL = os.getenv("USER_EMAIL", "")
+# Mail folder scanned (and watched in push mode) in every configured mailbox
+SCAN_FOLDER_NAME = os.getenv("SCAN_FOLDER_NAME", "Inbox")
+
+# Connection pools (one per database)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "12"))
+# How long a caller waits for a free pooled connection
+DB_POOL_CHECKOUT_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_CHECKOUT_TIMEOUT_SECONDS", "30"))
+# Pooled connections idle longer than this are probed with SELECT 1 on checkout
+DB_POOL_HEALTHCHECK_IDLE_SECONDS = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE_SECONDS", "30"))
+
+# Hot query plan check after the (always blocking) migrations: "off", "warn"
+# or "strict" (refuse to start when a hot query would seq scan)
+SCHEMA_CHECK_MODE = os.getenv("SCHEMA_CHECK_MODE", "warn").lower()
+
+# Monthly range partitioning of invoice_emails on received_at (converts the table online at startup)
+INVOICE_EMAILS_PARTITIONING = os.getenv("INVOICE_EMAILS_PARTITIONING", "false").lower() in ('true', '1', 'yes')
+# Future monthly partitions kept created ahead of time (checked daily)
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+
+# In-memory seen-message filter (Bloom filter over invoice_emails.email_message_id).
+# Only knows this process's inserts - enable only when one scanner instance writes invoice_emails
+SEEN_FILTER_ENABLED = os.getenv("SEEN_FILTER_ENABLED", "false").lower() in ('true', '1', 'yes')
+# Ids per filter generation; memory is about 1.2 bytes per id at 1% false positives (two generations kept)
+SEEN_FILTER_CAPACITY = int(os.getenv("SEEN_FILTER_CAPACITY", "500000"))
+SEEN_FILTER_FALSE_POSITIVE_RATE = float(os.getenv("SEEN_FILTER_FALSE_POSITIVE_RATE", "0.01"))
+# Days of invoice_emails loaded at startup (should cover the scan lookback window)
+SEEN_FILTER_WARM_DAYS = int(os.getenv("SEEN_FILTER_WARM_DAYS", "8"))
+
 # AWS Configuration (LocalStack)
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID", "test")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY", "test")
@@ -30,12 +95,40 @@ AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 AWS_ENDPOINT_URL = os.getenv("AWS_ENDPOINT_URL")
 AWS_ACCOUNT_ID = os.getenv("AWS_ACCOUNT_ID")
 VERIFY_SSL = os.getenv("VERIFY_SSL", "true").lower() in ('true', '1', 'yes')
+# "static" uses the keys above; "chain" uses the boto3 credential chain
+# (instance/container role, web identity, SSO), whose credentials refresh automatically
+AWS_CREDENTIAL_SOURCE = os.getenv("AWS_CREDENTIAL_SOURCE", "static").lower()
+# Shared AWS clients: HTTP connections per client, botocore retry mode/attempts and timeouts
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "32"))
+AWS_RETRY_MODE = os.getenv("AWS_RETRY_MODE", "standard")
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "5"))
+AWS_CONNECT_TIMEOUT_SECONDS = float(os.getenv("AWS_CONNECT_TIMEOUT_SECONDS", "5"))
+AWS_READ_TIMEOUT_SECONDS = float(os.getenv("AWS_READ_TIMEOUT_SECONDS", "60"))
 
 # S3 Configuration
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME", "invoice-attachments")
+# Attachments larger than this are streamed from Graph into a multipart upload
+ATTACHMENT_STREAM_THRESHOLD_BYTES = int(os.getenv("ATTACHMENT_STREAM_THRESHOLD_BYTES", str(8 * 1024 * 1024)))
+# Attachment bytes (by reported size) fetched per $batch call; each group is uploaded and released before the next
+ATTACHMENT_BATCH_MAX_BYTES = int(os.getenv("ATTACHMENT_BATCH_MAX_BYTES", str(4 * 1024 * 1024)))
+# Multipart part size (S3 minimum is 5 MiB); in-memory attachments larger than one part are uploaded in parts too
+S3_MULTIPART_PART_SIZE_BYTES = int(os.getenv("S3_MULTIPART_PART_SIZE_BYTES", str(8 * 1024 * 1024)))
+# Parts uploaded in parallel per multipart upload (also bounds the parts buffered in memory)
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
+# Multipart uploads left incomplete for longer than this are aborted at startup
+S3_STALE_UPLOAD_HOURS = int(os.getenv("S3_STALE_UPLOAD_HOURS", "24"))
+# Store attachments once per content under content/sha256/ keys; uploads of known content are skipped
+S3_CONTENT_ADDRESSED = os.getenv("S3_CONTENT_ADDRESSED", "false").lower() in ('true', '1', 'yes')
+# Attachments decoded and uploaded in parallel: across all emails, and within one email
+ATTACHMENT_WORKERS = int(os.getenv("ATTACHMENT_WORKERS", "8"))
+ATTACHMENT_WORKERS_PER_EMAIL = int(os.getenv("ATTACHMENT_WORKERS_PER_EMAIL", "4"))
 
 # SQS Configuration
 SQS_QUEUE_NAME = os.getenv("SQS_QUEUE_NAME")
+# work_ids are sent with SendMessageBatch (10 per call); a partial batch waits at most this long
+SQS_BATCH_LINGER_MS = int(os.getenv("SQS_BATCH_LINGER_MS", "50"))
+# Retries of the entries SQS reports as failed in a batch (not sender faults)
+SQS_BATCH_MAX_RETRIES = int(os.getenv("SQS_BATCH_MAX_RETRIES", "3"))
 
 # Construct SQS Queue URL from components
 if SQS_QUEUE_NAME:
@@ -50,3 +143,27 @@ else:
 
 # Scheduler Configuration
 SCHEDULER_INTERVAL_MINUTES = int(os.getenv("SCHEDULER_INTERVAL_MINUTES", "60"))
+# Days of email_scan_history kept (0 keeps everything)
+SCAN_HISTORY_RETENTION_DAYS = int(os.getenv("SCAN_HISTORY_RETENTION_DAYS", "90"))
+# Failed scans an email may hold the watermark (and deltaLink) for before it is given up on (0: never)
+SCAN_EMAIL_MAX_ATTEMPTS = int(os.getenv("SCAN_EMAIL_MAX_ATTEMPTS", "5"))
+# Scan engine: "async" (concurrent per-message processing) or "sync"
+SCAN_ENGINE = os.getenv("SCAN_ENGINE", "async").lower()
+# Messages processed concurrently by the async engine
+SCAN_MAX_CONCURRENCY = int(os.getenv("SCAN_MAX_CONCURRENCY", "8"))
+# On shutdown, running scans get this long to finish before they are cancelled
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "30"))
+
+# Push mode (Graph change notifications)
+PUSH_MODE_ENABLED = os.getenv("PUSH_MODE_ENABLED", "false").lower() in ('true', '1', 'yes')
+# Public HTTPS URL of the /notifications endpoint registered with Graph
+GRAPH_NOTIFICATION_URL = os.getenv("GRAPH_NOTIFICATION_URL")
+# Shared secret echoed back by Graph in every notification
+GRAPH_NOTIFICATION_CLIENT_STATE = os.getenv("GRAPH_NOTIFICATION_CLIENT_STATE")
+GRAPH_SUBSCRIPTION_LIFETIME_MINUTES = int(os.getenv("GRAPH_SUBSCRIPTION_LIFETIME_MINUTES", "4230"))
+GRAPH_SUBSCRIPTION_RENEW_BEFORE_MINUTES = int(os.getenv("GRAPH_SUBSCRIPTION_RENEW_BEFORE_MINUTES", "120"))
+GRAPH_SUBSCRIPTION_CHECK_MINUTES = int(os.getenv("GRAPH_SUBSCRIPTION_CHECK_MINUTES", "30"))
+# Polling interval while push mode is active (safety net for missed notifications)
+PUSH_SAFETY_POLL_INTERVAL_MINUTES = int(os.getenv("PUSH_SAFETY_POLL_INTERVAL_MINUTES", "360"))
+# Notified message ids processed together (one $batch fetch)
+PUSH_BATCH_SIZE = int(os.getenv("PUSH_BATCH_SIZE", "20"))
@@ -1,4 +1,5 @@
-from db.connections import get_guident_db
+from typing import List, Optional, Set
+from db.connections import guident_connection
 from utils.logger import get_logger
 logger=get_logger(__name__)
 def check_email(email_message_id: str) -> bool:
@@ -11,34 +12,68 @@ def check_email(email_message_id: str) -> bool:
     Returns:
         bool: True if email exists, False otherwise.
     """
-    conn = None
     try:
         logger.debug(f"Checking existence of email_message_id: {email_message_id[:50]}...")
-        conn = get_guident_db()
-        if not conn:
-            logger.error("Database connection not available. Cannot check email.")
-            return False
-        cursor = conn.cursor()
-        
-        query = "SELECT EXISTS(SELECT 1 FROM invoice_emails WHERE email_message_id = %s)"
-        cursor.execute(query, (email_message_id[:255],))
-        result = cursor.fetchone()
-        exists = result[0] if result else False
-        
-        if exists:
-            logger.info(f"Email already exists in DB: {email_message_id[:50]}...")
-        else:
-            logger.info(f"Email does not exist in DB, can process: {email_message_id[:50]}...")
-        cursor.close()
-        return exists
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            
+            query = "SELECT EXISTS(SELECT 1 FROM invoice_emails WHERE email_message_id = %s)"
+            cursor.execute(query, (email_message_id[:255],))
+            result = cursor.fetchone()
+            exists = result[0] if result else False
+            
+            if exists:
+                logger.info(f"Email already exists in DB: {email_message_id[:50]}...")
+            else:
+                logger.info(f"Email does not exist in DB, can process: {email_message_id[:50]}...")
+            cursor.close()
+            return exists
         
     except Exception as e:
         logger.error(f"Error checking email in DB: {str(e)}", exc_info=True)
         return False
-    finally:
-        if conn:
-            try:
-                conn.close()
-                logger.debug("Database connection closed successfully")
-            except Exception as e:
-                logger.warning(f"Error closing DB connection: {str(e)}", exc_info=True)
+
+
+def check_emails_exist(email_message_ids: List[str], received_from: Optional[str] = None,
+                       received_to: Optional[str] = None) -> Set[str]:
+    """
+    Bulk duplicate check for one Graph page.
+    
+    Args:
+        email_message_ids (List[str]): Graph email message IDs.
+        received_from (str, optional): Earliest receivedDateTime of the page.
+        received_to (str, optional): Latest receivedDateTime of the page.
+            With both bounds the lookup only touches the invoice_emails
+            partitions covering the page.
+        
+    Returns:
+        Set[str]: The IDs already stored (empty on error, so the page is treated as new).
+    """
+    if not email_message_ids:
+        return set()
+    
+    try:
+        logger.debug(f"Checking existence of {len(email_message_ids)} email_message_id(s)")
+        # Stored ids are truncated to 255 characters - compare the same way
+        truncated = {email_message_id[:255]: email_message_id for email_message_id in email_message_ids}
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            
+            query = "SELECT email_message_id FROM invoice_emails WHERE email_message_id = ANY(%s)"
+            params = [list(truncated)]
+            if received_from and received_to:
+                query += " AND received_at BETWEEN %s AND %s"
+                params += [received_from, received_to]
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            cursor.close()
+        
+        existing = {truncated[row[0]] for row in rows if row[0] in truncated}
+        logger.info(
+            f"Bulk duplicate check: {len(existing)}/{len(email_message_ids)} email(s) already in DB"
+        )
+        return existing
+        
+    except Exception as e:
+        logger.error(f"Error bulk checking emails in DB: {str(e)}", exc_info=True)
+        return set()
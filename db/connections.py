@@ -1,5 +1,11 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
 import psycopg2
 from psycopg2 import OperationalError, InterfaceError
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
 from utils.logger import get_logger
 from config.settings import *
 
@@ -47,3 +53,204 @@ def get_tenant_db():
     except Exception as e:
         logger.error(f"Unexpected error connecting to Tenant DB: {str(e)}", exc_info=True)
     return None
+
+
+class DatabasePool:
+    """
+    Thread-safe psycopg2 pool for one database.
+
+    ThreadedConnectionPool raises as soon as maxconn connections are out;
+    a semaphore makes callers wait (up to DB_POOL_CHECKOUT_TIMEOUT_SECONDS)
+    instead. Connections idle for longer than DB_POOL_HEALTHCHECK_IDLE_SECONDS
+    are probed with SELECT 1 on checkout and replaced when dead.
+    """
+
+    def __init__(self, name: str, min_size: int, max_size: int, **connect_kwargs):
+        self.name = name
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self._connect_kwargs = connect_kwargs
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._last_used: Dict[int, float] = {}
+        self._metrics = {
+            "checkouts": 0,
+            "in_use": 0,
+            "wait_seconds_total": 0.0,
+            "wait_timeouts": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+        }
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        with self._lock:
+            if self._pool is None:
+                logger.info(
+                    f"Creating {self.name} DB pool at {self._connect_kwargs.get('host')}:"
+                    f"{self._connect_kwargs.get('port')}/{self._connect_kwargs.get('database')} | "
+                    f"min={self.min_size}, max={self.max_size}"
+                )
+                self._pool = ThreadedConnectionPool(self.min_size, self.max_size, **self._connect_kwargs)
+            return self._pool
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        with self._lock:
+            last_used = self._last_used.get(id(conn))
+        # Freshly opened connections need no probe
+        if last_used is None or time.monotonic() - last_used < DB_POOL_HEALTHCHECK_IDLE_SECONDS:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"{self.name} DB pooled connection failed health check: {str(e)}")
+            return False
+
+    def _discard(self, pool: ThreadedConnectionPool, conn) -> None:
+        # id(conn) can be reused by a later connection once this one is gone
+        with self._lock:
+            self._last_used.pop(id(conn), None)
+            self._metrics["discarded"] += 1
+        try:
+            pool.putconn(conn, close=True)
+        except Exception:
+            pass
+
+    def getconn(self):
+        wait_start = time.perf_counter()
+        if not self._slots.acquire(timeout=DB_POOL_CHECKOUT_TIMEOUT_SECONDS):
+            with self._lock:
+                self._metrics["wait_timeouts"] += 1
+            raise OperationalError(
+                f"{self.name} DB pool exhausted - no connection within "
+                f"{DB_POOL_CHECKOUT_TIMEOUT_SECONDS}s (max={self.max_size})"
+            )
+        waited = time.perf_counter() - wait_start
+
+        try:
+            pool = self._get_pool()
+            # Every dead idle connection is replaced by a fresh one at most once
+            for _ in range(self.max_size + 1):
+                conn = pool.getconn()
+                if self._is_healthy(conn):
+                    break
+                with self._lock:
+                    self._metrics["health_check_failures"] += 1
+                self._discard(pool, conn)
+            else:
+                raise OperationalError(f"{self.name} DB pool could not provide a healthy connection")
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._metrics["checkouts"] += 1
+            self._metrics["in_use"] += 1
+            self._metrics["wait_seconds_total"] += waited
+        return conn
+
+    def putconn(self, conn) -> None:
+        pool = self._pool
+        try:
+            if conn.closed:
+                self._discard(pool, conn)
+                return
+            # Never hand out a connection with an open transaction
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    self._discard(pool, conn)
+                    return
+            with self._lock:
+                self._last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn)
+            # The pool closes connections returned beyond min_size
+            if conn.closed:
+                with self._lock:
+                    self._last_used.pop(id(conn), None)
+        finally:
+            with self._lock:
+                self._metrics["in_use"] -= 1
+            self._slots.release()
+
+    def closeall(self) -> None:
+        with self._lock:
+            if self._pool is not None and not self._pool.closed:
+                self._pool.closeall()
+                logger.info(f"{self.name} DB pool closed")
+            self._pool = None
+            self._last_used.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["max_size"] = self.max_size
+        metrics["open"] = len(self._pool._pool) + len(self._pool._used) if self._pool else 0
+        metrics["avg_wait_ms"] = round(
+            1000 * metrics["wait_seconds_total"] / metrics["checkouts"], 2
+        ) if metrics["checkouts"] else 0.0
+        return metrics
+
+
+_guident_pool = DatabasePool(
+    "Guident", DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+    host=DB_HOST, port=DB_PORT, database=DB_NAME, user=DB_USER, password=DB_PASSWORD
+)
+
+_tenant_pool = DatabasePool(
+    "Tenant", DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+    host=TENANT_DB_HOST, port=TENANT_DB_PORT, database=TENANT_DB_NAME,
+    user=TENANT_DB_USER, password=TENANT_DB_PASSWORD
+)
+
+
+@contextmanager
+def _pooled_connection(pool: DatabasePool):
+    conn = pool.getconn()
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            try:
+                conn.rollback()
+                logger.debug("Database transaction rolled back due to error")
+            except Exception:
+                pass
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def guident_connection():
+    """
+    Pooled connection to the main Guident database.
+
+    Usage:
+        with guident_connection() as conn:
+            ...
+            conn.commit()
+
+    Uncommitted work is rolled back when the block exits.
+    """
+    return _pooled_connection(_guident_pool)
+
+
+def tenant_connection():
+    """Pooled connection to the tenant database (see guident_connection)."""
+    return _pooled_connection(_tenant_pool)
+
+
+def get_pool_metrics() -> Dict[str, Dict[str, Any]]:
+    return {"guident": _guident_pool.metrics(), "tenant": _tenant_pool.metrics()}
+
+
+def close_db_pools() -> None:
+    _guident_pool.closeall()
+    _tenant_pool.closeall()
@@ -0,0 +1,32 @@
+from db.connections import guident_connection
+from utils.logger import get_logger
+from typing import Optional
+logger = get_logger(__name__)
+
+
+def get_delta_link_from_db(email_account: str, folder_name: str) -> Optional[str]:
+    """Get the stored Graph deltaLink for a mailbox folder."""
+    logger.info(f"Fetching delta link for email account: {email_account}, folder: {folder_name}")
+    try:
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+
+            query = """
+                SELECT delta_link
+                FROM email_scanner_state
+                WHERE email_account = %s AND folder_name = %s AND delta_link IS NOT NULL
+            """
+
+            cursor.execute(query, (email_account, folder_name))
+            result = cursor.fetchone()
+            cursor.close()
+        if result and result[0]:
+            logger.info(f"Delta link found for {email_account}/{folder_name}")
+            return result[0]
+        logger.info(f"No delta link found for {email_account}/{folder_name}")
+        return None
+
+    except Exception as e:
+        logger.error(f"Error fetching delta link for {email_account}: {str(e)}", exc_info=True)
+        return None
+
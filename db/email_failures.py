@@ -0,0 +1,42 @@
+from db.connections import guident_connection
+from psycopg2.extras import execute_values
+from typing import Dict, Iterable
+from utils.logger import get_logger
+logger = get_logger(__name__)
+
+
+def record_email_failures(email_account: str, folder_name: str, email_ids: Iterable[str]) -> Dict[str, int]:
+    """
+    Count one more failed scan for each email.
+
+    Returns:
+        dict: email_message_id -> failed scans so far (empty on a DB error,
+              so the emails keep holding the watermark)
+    """
+    rows = [(email_account, folder_name, email_id) for email_id in set(email_ids)]
+    if not rows:
+        return {}
+
+    try:
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            returned = execute_values(
+                cursor,
+                """
+                INSERT INTO email_scan_failures AS f (email_account, folder_name, email_message_id)
+                VALUES %s
+                ON CONFLICT (email_account, folder_name, email_message_id) DO UPDATE
+                SET attempts = f.attempts + 1, last_failed_at = CURRENT_TIMESTAMP
+                RETURNING email_message_id, attempts
+                """,
+                rows,
+                page_size=len(rows),
+                fetch=True
+            )
+            conn.commit()
+            cursor.close()
+        return dict(returned)
+
+    except Exception as e:
+        logger.error(f"Error recording email failures for {email_account}/{folder_name}: {str(e)}", exc_info=True)
+        return {}
@@ -1,27 +1,24 @@
 
-from db.connections import *
+from db.connections import guident_connection
 from utils.logger import get_logger
 from typing import Optional
 logger=get_logger(__name__)
-def get_last_processed_timestamp_from_db(email_account: str) -> Optional[str]:
-    """Get last processed timestamp."""
-    conn = None
-    logger.info(f"Fetching last processed timestamp for email account: {email_account}")
+def get_last_processed_timestamp_from_db(email_account: str, folder_name: str = "Inbox") -> Optional[str]:
+    """Get last processed timestamp from the mailbox folder's checkpoint row."""
+    logger.info(f"Fetching last processed timestamp for email account: {email_account}, folder: {folder_name}")
     try:
-        conn = get_guident_db()
-        cursor = conn.cursor()
-        
-        query = """
-            SELECT last_processed_timestamp
-            FROM email_scanner_state
-            WHERE email_account = %s
-            ORDER BY last_processed_timestamp DESC
-            LIMIT 1
-        """
-        
-        cursor.execute(query, (email_account,))
-        result = cursor.fetchone()
-        cursor.close()
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            
+            query = """
+                SELECT last_processed_timestamp
+                FROM email_scanner_state
+                WHERE email_account = %s AND folder_name = %s
+            """
+            
+            cursor.execute(query, (email_account, folder_name))
+            result = cursor.fetchone()
+            cursor.close()
         logger.debug(f"Query executed. Result fetched: {result}")
         if result and result[0]:
             timestamp = result[0]
@@ -34,7 +31,3 @@ def get_last_processed_timestamp_from_db(email_account: str) -> Optional[str]:
     except Exception as e:
         logger.error(f"Error fetching last processed timestamp for {email_account}: {str(e)}", exc_info=True)
         return None
-    finally:
-        if conn:
-            conn.close()
-            logger.debug("Database connection closed.")
\ No newline at end of file
@@ -1,48 +1,112 @@
 from utils.logger import get_logger 
-from db.connections import get_guident_db
-from typing import Optional
+from db.connections import guident_connection
+from psycopg2.extras import execute_values
+from typing import Any, Dict, List, Optional, Tuple
 from utils.document_type import get_document_type_from_filename
 import uuid
 logger= get_logger(__name__)
+
+INSERT_DOCUMENT_COLUMNS = """
+    INSERT INTO invoice_documents
+    (document_id, work_id, file_name, file_size, document_type,
+     is_primary, s3_url, ocr_status, content_sha256, uploaded_at)
+"""
+DOCUMENT_VALUES_TEMPLATE = "(%s::uuid, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)"
+
+
+def build_document_row(work_id: str, file_name: str, file_size: int,
+                       content_type: str, s3_url: str, content_sha256: str = None) -> Tuple:
+    """Column values of one invoice_documents row (document_id first)."""
+    document_type = get_document_type_from_filename(file_name)
+    document_id = str(uuid.uuid4())
+    is_primary = (document_type == 'INVOICE' and 'pdf' in (content_type or '').lower())
+    logger.debug(f"Generated document_id={document_id}, is_primary={is_primary}")
+    return (document_id, work_id, file_name, file_size, document_type, is_primary, s3_url, 'PENDING',
+            content_sha256)
+
+
+def insert_documents(cursor, work_id: str, documents: List[Dict[str, Any]]) -> List[str]:
+    """
+    Insert all documents of an email with one statement on the caller's
+    cursor (the caller owns the transaction).
+
+    Args:
+        documents: dicts with file_name, file_size, content_type, s3_url
+                   and optionally content_sha256
+
+    Returns:
+        List[str]: document_ids in input order
+    """
+    return insert_page_documents(cursor, {work_id: documents}).get(work_id, [])
+
+
+def insert_page_documents(cursor, documents_by_work_id: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[str]]:
+    """
+    Insert the documents of many emails with one statement on the caller's cursor.
+
+    Returns:
+        dict: work_id -> document_ids in input order
+    """
+    rows = []
+    document_ids: Dict[str, List[str]] = {}
+    for work_id, documents in documents_by_work_id.items():
+        for d in documents:
+            row = build_document_row(work_id, d["file_name"], d["file_size"], d["content_type"],
+                                     d["s3_url"], d.get("content_sha256"))
+            rows.append(row)
+            document_ids.setdefault(work_id, []).append(row[0])
+
+    if rows:
+        execute_values(
+            cursor,
+            INSERT_DOCUMENT_COLUMNS + " VALUES %s",
+            rows,
+            template=DOCUMENT_VALUES_TEMPLATE,
+            page_size=len(rows)
+        )
+        logger.debug(f"Inserted {len(rows)} document row(s) for {len(document_ids)} email(s)")
+    return document_ids
+
+
 def insert_document_to_database(work_id: str, file_name: str, file_size: int,
-                                content_type: str, s3_url: str) -> Optional[str]:
+                                content_type: str, s3_url: str,
+                                content_sha256: str = None) -> Optional[str]:
     """Insert document metadata."""
-    conn = None
     logger.info(f"Inserting document for work_id={work_id}, file_name={file_name}")
     try:
-        conn = get_guident_db()
-        cursor = conn.cursor()
-        
-        document_type = get_document_type_from_filename(file_name)
-        
-        insert_query = """
-            INSERT INTO invoice_documents
-            (document_id, work_id, file_name, file_size, document_type,
-             is_primary, s3_url, ocr_status, uploaded_at)
-            VALUES (%s::uuid, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-        """
-        
-        document_id = str(uuid.uuid4())
-        is_primary = (document_type == 'INVOICE' and 'pdf' in content_type.lower())
-        logger.debug(f"Generated document_id={document_id}, is_primary={is_primary}")
-        cursor.execute(insert_query, (
-            document_id, work_id, file_name, file_size,
-            document_type, is_primary, s3_url, 'PENDING'
-        ))
-        
-        conn.commit()
-        cursor.close()
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            
+            row = build_document_row(work_id, file_name, file_size, content_type, s3_url, content_sha256)
+            cursor.execute(
+                INSERT_DOCUMENT_COLUMNS + " VALUES " + DOCUMENT_VALUES_TEMPLATE,
+                row
+            )
+            document_id = row[0]
+            
+            conn.commit()
+            cursor.close()
         logger.info(f"Document inserted successfully: {file_name} (document_id={document_id})")
         
         return document_id
         
     except Exception as e:
         logger.error(f"Error inserting document for work_id={work_id}, file_name={file_name}: {str(e)}", exc_info=True)
-        if conn:
-            conn.rollback()
-            logger.debug("Database transaction rolled back due to error.")
         return None
-    finally:
-        if conn:
-            conn.close()
-            logger.debug("Database connection closed.")
+
+
+def find_document_url_by_hash(content_sha256: str) -> Optional[str]:
+    """s3_url of a stored document with the same content, if any."""
+    try:
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT s3_url FROM invoice_documents WHERE content_sha256 = %s LIMIT 1",
+                (content_sha256,)
+            )
+            row = cursor.fetchone()
+            cursor.close()
+        return row[0] if row else None
+    except Exception as e:
+        logger.error(f"Error looking up document by content hash: {str(e)}", exc_info=True)
+        return None
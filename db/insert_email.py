@@ -1,71 +1,209 @@
-from utils.logger import get_logger 
-from typing import Any,Dict,Optional
-from db.connections import get_guident_db
+from utils.logger import get_logger
+from typing import Any,Dict,List,Optional,Tuple
+from db.connections import guident_connection
+from db.insert_document import insert_documents, insert_page_documents
+from psycopg2.extras import execute_values
 from utils.generate_work_id import generate_work_id
 logger= get_logger(__name__)
+
+INSERT_EMAIL_COLUMNS = """
+    INSERT INTO invoice_emails
+    (email_message_id, email_thread_id, subject, received_from_email,
+     received_from_name, received_to_email, cc_emails, body_text, body_html,
+     sent_at, received_at, processing_status, has_attachments,
+     attachment_count, work_id, entity_id)
+"""
+EMAIL_VALUES_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::uuid)"
+INSERT_EMAIL_QUERY = INSERT_EMAIL_COLUMNS + " VALUES " + EMAIL_VALUES_TEMPLATE
+# Rows stored concurrently (another replica, an overlapping round) are skipped
+# and missing from RETURNING; the unique index also works once partitioned
+EMAIL_ON_CONFLICT = " ON CONFLICT (email_message_id, received_at) DO NOTHING RETURNING email_message_id, work_id"
+
+
+def build_email_row(email_data: Dict[str, Any], entity_id: str, work_id: str,
+                    attachment_count: int) -> Tuple:
+    """Column values of one invoice_emails row, in INSERT_EMAIL_QUERY order."""
+    cc_emails = []
+    if email_data.get("graph_message", {}).get("ccRecipients"):
+        cc_emails = [cc.get("emailAddress", {}).get("address", "")
+                    for cc in email_data["graph_message"]["ccRecipients"]]
+
+    logger.debug(
+        f"Inserting email: id={email_data.get('id', '')[:30]}, "
+        f"subject='{email_data.get('subject', '')[:50]}', "
+        f"from={email_data.get('sender_email', '')}, "
+        f"to={(email_data.get('recipient_mailbox', [''])[0])}, "
+        f"has_attachments={email_data.get('has_attachments', False)}"
+    )
+    return (
+        email_data.get("id", ""),
+        email_data.get("conversation_id", "")[:255],
+        email_data.get("subject", "")[:500] if email_data.get("subject") else "",
+        email_data.get("sender_email", "")[:255],
+        email_data.get("sender", "")[:255],
+        (email_data.get("recipient_mailbox", [""])[0])[:255] if email_data.get("recipient_mailbox") else "",
+        cc_emails,
+        email_data.get("body", ""),
+        email_data.get("body", ""),
+        email_data.get("received_time"),
+        email_data.get("received_time"),
+        "RECEIVED",
+        email_data.get("has_attachments", False),
+        attachment_count,
+        work_id,
+        entity_id
+    )
+
+
 def insert_email_to_database(email_data: Dict[str, Any], entity_id: str) -> Optional[str]:
     """Insert email and return work_id."""
-    conn = None
+    work_id = None
     logger.debug(f"Starting insert_email_to_database for entity_id={entity_id}")
 
     try:
-        conn = get_guident_db()
-        cursor = conn.cursor()
-        
-        cc_emails = []
-        if email_data.get("graph_message", {}).get("ccRecipients"):
-            cc_emails = [cc.get("emailAddress", {}).get("address", "") 
-                        for cc in email_data["graph_message"]["ccRecipients"]]
-        
-        work_id = generate_work_id()
-        logger.debug(
-            f"Inserting email: id={email_data.get('id', '')[:30]}, "
-            f"subject='{email_data.get('subject', '')[:50]}', "
-            f"from={email_data.get('sender_email', '')}, "
-            f"to={(email_data.get('recipient_mailbox', [''])[0])}, "
-            f"has_attachments={email_data.get('has_attachments', False)}"
-        )        
-        insert_query = """
-            INSERT INTO invoice_emails
-            (email_message_id, email_thread_id, subject, received_from_email,
-             received_from_name, received_to_email, cc_emails, body_text, body_html,
-             sent_at, received_at, processing_status, has_attachments,
-             attachment_count, work_id, entity_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::uuid)
-        """
-        
-        cursor.execute(insert_query, (
-            email_data.get("id", ""),
-            email_data.get("conversation_id", "")[:255],
-            email_data.get("subject", "")[:500] if email_data.get("subject") else "",
-            email_data.get("sender_email", "")[:255],
-            email_data.get("sender", "")[:255],
-            (email_data.get("recipient_mailbox", [""])[0])[:255] if email_data.get("recipient_mailbox") else "",
-            cc_emails,
-            email_data.get("body", ""),
-            email_data.get("body", ""),
-            email_data.get("received_time"),
-            email_data.get("received_time"),
-            "RECEIVED",
-            email_data.get("has_attachments", False),
-            email_data.get("attachment_count", 0),
-            work_id,
-            entity_id
-        ))
-        
-        conn.commit()
-        cursor.close()
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+
+            work_id = generate_work_id()
+            cursor.execute(INSERT_EMAIL_QUERY, build_email_row(
+                email_data, entity_id, work_id, email_data.get("attachment_count", 0)
+            ))
+
+            conn.commit()
+            cursor.close()
         logger.info(f"Email stored successfully: work_id={work_id}")
-        
+
         return work_id
-        
+
     except Exception as e:
         logger.error(f"Email insert error for work_id={work_id}: {str(e)}", exc_info=True)
-        if conn:
-            conn.rollback()
         return None
-    finally:
-        if conn:
-            conn.close()
-            logger.debug("Database connection closed")
 
+
+def insert_email_with_documents(email_data: Dict[str, Any], entity_id: str,
+                                documents: List[Dict[str, Any]]) -> Optional[Tuple[str, List[str]]]:
+    """
+    Store an email and its documents as one unit of work: one connection,
+    one multi-row document insert, one commit. attachment_count is the
+    number of documents written in the same transaction.
+
+    Args:
+        email_data: Email dict (see service.scan_steps.build_email_data)
+        entity_id: Entity ID of the scan
+        documents: Uploaded attachments - dicts with file_name, file_size,
+                   content_type, s3_url
+
+    Returns:
+        tuple: (work_id, document_ids); work_id is None when the email was
+               already stored (see EMAIL_ON_CONFLICT). None when the
+               transaction failed
+    """
+    work_id = None
+    logger.debug(
+        f"Starting insert_email_with_documents for entity_id={entity_id}, "
+        f"documents={len(documents)}"
+    )
+
+    try:
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+
+            work_id = generate_work_id()
+            cursor.execute(INSERT_EMAIL_QUERY + EMAIL_ON_CONFLICT, build_email_row(
+                email_data, entity_id, work_id, len(documents)
+            ))
+            if cursor.fetchone() is None:
+                conn.commit()
+                cursor.close()
+                logger.debug(f"Email already stored: id={email_data.get('id', '')[:30]}...")
+                return None, []
+            document_ids = insert_documents(cursor, work_id, documents)
+
+            conn.commit()
+            cursor.close()
+        logger.info(
+            f"Email stored successfully: work_id={work_id}, documents={len(document_ids)}"
+        )
+
+        return work_id, document_ids
+
+    except Exception as e:
+        logger.error(
+            f"Email unit-of-work insert error for work_id={work_id}: {str(e)} "
+            f"(transaction rolled back)",
+            exc_info=True
+        )
+        return None
+
+
+def insert_emails_with_documents(entries: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]],
+                                 entity_id: str) -> Optional[Dict[str, Tuple[str, List[str]]]]:
+    """
+    Bulk-store the new emails of one Graph page and all their documents in
+    one transaction: one multi-row email insert, one multi-row document
+    insert, one commit.
+
+    Emails that already exist are skipped with EMAIL_ON_CONFLICT (requires
+    the unique index created by db.schema) and are missing from the result.
+
+    Args:
+        entries: (email_data, documents) pairs - see insert_email_with_documents
+        entity_id: Entity ID of the scan
+
+    Returns:
+        dict: email_message_id -> (work_id, document_ids) for the inserted emails,
+              or None when the transaction failed
+    """
+    if not entries:
+        return {}
+
+    logger.debug(f"Starting insert_emails_with_documents for entity_id={entity_id}, emails={len(entries)}")
+
+    try:
+        rows = []
+        documents_by_email: Dict[str, List[Dict[str, Any]]] = {}
+        for email_data, documents in entries:
+            email_id = email_data.get("id", "")
+            if email_id in documents_by_email:
+                continue
+            documents_by_email[email_id] = documents
+            rows.append(build_email_row(email_data, entity_id, generate_work_id(), len(documents)))
+
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+
+            returned = execute_values(
+                cursor,
+                INSERT_EMAIL_COLUMNS + " VALUES %s" + EMAIL_ON_CONFLICT,
+                rows,
+                template=EMAIL_VALUES_TEMPLATE,
+                page_size=len(rows),
+                fetch=True
+            )
+
+            work_ids = {email_id: work_id for email_id, work_id in returned}
+            document_ids = insert_page_documents(cursor, {
+                work_id: documents_by_email[email_id] for email_id, work_id in work_ids.items()
+            })
+            stored = {
+                email_id: (work_id, document_ids.get(work_id, []))
+                for email_id, work_id in work_ids.items()
+            }
+
+            conn.commit()
+            cursor.close()
+
+        logger.info(
+            f"Page stored successfully: emails={len(stored)}/{len(rows)}, "
+            f"documents={sum(len(d) for _, d in stored.values())}, "
+            f"already_present={len(rows) - len(stored)}"
+        )
+        return stored
+
+    except Exception as e:
+        logger.error(
+            f"Bulk email insert error for entity_id={entity_id}: {str(e)} "
+            f"(transaction rolled back)",
+            exc_info=True
+        )
+        return None
@@ -0,0 +1,202 @@
+"""
+Optional monthly range partitioning of invoice_emails on received_at.
+
+migrate_invoice_emails_to_partitions() converts the existing table online:
+the old table becomes the first partition (everything before the next
+month boundary), attached through a validated CHECK constraint so no
+rows are copied or re-scanned under an exclusive lock. New months get
+their own partitions from ensure_invoice_email_partitions(), which the
+service runs at startup and then daily.
+
+Unique indexes on a partitioned table must contain the partition key, so
+the bulk insert arbitrates on (email_message_id, received_at) and the
+duplicate checks filter on the page's received_at range, which lets the
+planner prune to the partitions that page can hit.
+"""
+from datetime import date
+from typing import Optional
+from db.connections import guident_connection
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+LEGACY_TABLE = "invoice_emails_legacy"
+LEGACY_RANGE_CONSTRAINT = "invoice_emails_legacy_received_range"
+
+
+def _month_start(day: date, months_ahead: int = 0) -> date:
+    month_index = day.year * 12 + day.month - 1 + months_ahead
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"invoice_emails_p{month:%Y%m}"
+
+
+def is_invoice_emails_partitioned(cursor) -> bool:
+    cursor.execute(
+        """
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = 'invoice_emails' AND c.relnamespace = 'public'::regnamespace
+        )
+        """
+    )
+    return cursor.fetchone()[0]
+
+
+def _migration_blocker(cursor) -> Optional[str]:
+    """Reason the table cannot be converted in place, if any."""
+    cursor.execute(
+        """
+        SELECT conrelid::regclass::text, conname FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = 'public.invoice_emails'::regclass
+        """
+    )
+    foreign_keys = cursor.fetchall()
+    if foreign_keys:
+        # Existing foreign keys would keep pointing at the legacy partition only
+        return f"foreign keys reference invoice_emails: {', '.join(f'{t}.{c}' for t, c in foreign_keys)}"
+
+    cursor.execute(
+        """
+        SELECT conname FROM pg_constraint
+        WHERE contype IN ('p', 'u') AND conrelid = 'public.invoice_emails'::regclass
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_attribute a
+              WHERE a.attrelid = conrelid AND a.attname = 'received_at' AND a.attnum = ANY(conkey)
+          )
+        """
+    )
+    keys = [row[0] for row in cursor.fetchall()]
+    if keys:
+        # Kept on the legacy partition, but the parent cannot enforce them
+        logger.warning(
+            f"⚠ Constraints without received_at stay on the legacy partition only: {', '.join(keys)}"
+        )
+
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM invoice_emails WHERE received_at IS NULL)")
+    if cursor.fetchone()[0]:
+        return "invoice_emails has rows without received_at"
+
+    return None
+
+
+def migrate_invoice_emails_to_partitions() -> bool:
+    """
+    Convert invoice_emails to a table partitioned by month on received_at.
+
+    The slow part (validating the legacy range constraint) only takes a
+    SHARE UPDATE EXCLUSIVE lock, so scans keep inserting meanwhile. The
+    swap itself - rename, create parent, attach - is one short transaction.
+    """
+    boundary = _month_start(date.today(), 1)
+
+    try:
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+
+            if is_invoice_emails_partitioned(cursor):
+                conn.rollback()
+                logger.info("invoice_emails is already partitioned")
+                return True
+
+            blocker = _migration_blocker(cursor)
+            if blocker:
+                conn.rollback()
+                logger.error(f"✗ Cannot partition invoice_emails online - {blocker}")
+                return False
+
+            logger.info(f"Partitioning invoice_emails | legacy partition up to {boundary}")
+
+            # 1. Range constraint that lets ATTACH skip its validation scan
+            cursor.execute(
+                f"""
+                ALTER TABLE invoice_emails DROP CONSTRAINT IF EXISTS {LEGACY_RANGE_CONSTRAINT};
+                ALTER TABLE invoice_emails ADD CONSTRAINT {LEGACY_RANGE_CONSTRAINT}
+                    CHECK (received_at IS NOT NULL AND received_at < %s) NOT VALID
+                """,
+                (boundary,)
+            )
+            conn.commit()
+            cursor.execute(f"ALTER TABLE invoice_emails VALIDATE CONSTRAINT {LEGACY_RANGE_CONSTRAINT}")
+            conn.commit()
+
+            # 2. Swap in the partitioned parent
+            cursor.execute("SET LOCAL lock_timeout = '10s'")
+            cursor.execute(f"ALTER TABLE invoice_emails RENAME TO {LEGACY_TABLE}")
+            cursor.execute(
+                f"""
+                CREATE TABLE invoice_emails (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS INCLUDING GENERATED)
+                PARTITION BY RANGE (received_at)
+                """
+            )
+            cursor.execute(
+                f"ALTER TABLE invoice_emails ATTACH PARTITION {LEGACY_TABLE} "
+                f"FOR VALUES FROM (MINVALUE) TO (%s)",
+                (boundary,)
+            )
+            # Matches (and adopts) the legacy table's indexes of the same shape
+            cursor.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_invoice_emails_part_message_received "
+                "ON invoice_emails (email_message_id, received_at)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS ix_invoice_emails_part_received_at "
+                "ON invoice_emails (received_at) INCLUDE (email_message_id)"
+            )
+            conn.commit()
+            cursor.close()
+
+        logger.info(f"✓ invoice_emails partitioned | legacy rows kept in {LEGACY_TABLE}")
+        return True
+
+    except Exception as e:
+        logger.error(f"invoice_emails partitioning error: {str(e)}", exc_info=True)
+        return False
+
+
+def ensure_invoice_email_partitions(months_ahead: int) -> int:
+    """
+    Create the monthly partitions from the current month to months_ahead
+    months out. Months still covered by the legacy partition are skipped.
+
+    Returns:
+        int: Number of partitions created
+    """
+    created = 0
+    try:
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            if not is_invoice_emails_partitioned(cursor):
+                conn.rollback()
+                return 0
+            conn.commit()
+
+            today = date.today()
+            for offset in range(0, months_ahead + 1):
+                month, next_month = _month_start(today, offset), _month_start(today, offset + 1)
+                name = _partition_name(month)
+                cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f"public.{name}",))
+                if cursor.fetchone()[0]:
+                    conn.commit()
+                    continue
+                try:
+                    cursor.execute(
+                        f"CREATE TABLE {name} PARTITION OF invoice_emails FOR VALUES FROM (%s) TO (%s)",
+                        (month, next_month)
+                    )
+                    conn.commit()
+                    created += 1
+                    logger.info(f"✓ Created partition {name} [{month}, {next_month})")
+                except Exception as e:
+                    # Overlaps the legacy partition - that month is already covered
+                    conn.rollback()
+                    logger.debug(f"Partition {name} not created: {str(e).strip()}")
+            cursor.close()
+
+    except Exception as e:
+        logger.error(f"invoice_emails partition maintenance error: {str(e)}", exc_info=True)
+
+    return created
@@ -0,0 +1,81 @@
+from db.connections import guident_connection
+from utils.logger import get_logger
+from typing import Any, Dict, Optional
+logger = get_logger(__name__)
+
+# Checkpoint statuses a scan resumes from (it did not finish its last round)
+RESUMABLE_STATUSES = ("running", "error")
+
+
+def get_scan_resume_state(email_account: str, folder_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Status and resume link of a mailbox folder's checkpoint.
+
+    Returns:
+        dict: {"status", "resume_link"}, or None when there is no checkpoint
+    """
+    try:
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT status, resume_link
+                FROM email_scanner_state
+                WHERE email_account = %s AND folder_name = %s
+                """,
+                (email_account, folder_name)
+            )
+            row = cursor.fetchone()
+            cursor.close()
+        if not row:
+            return None
+        return {"status": row[0], "resume_link": row[1]}
+
+    except Exception as e:
+        logger.error(f"Error fetching scan resume state for {email_account}/{folder_name}: {str(e)}", exc_info=True)
+        return None
+
+
+def save_scan_checkpoint(scanner_id: str, entity_id: str, email_account: str, folder_name: str,
+                         last_processed_timestamp: Optional[str], last_processed_email_id: Optional[str],
+                         resume_link: Optional[str]) -> bool:
+    """
+    Durably record the progress of a running scan after a page is fully processed.
+    The row is marked 'running' until save_scan_state writes the final status;
+    scan_count and the history table are only touched by the final write.
+    """
+    try:
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO email_scanner_state AS s
+                (scanner_id, entity_id, email_account, folder_name, last_processed_timestamp,
+                 last_processed_email_id, scan_count, last_scan_at, status, resume_link)
+                VALUES (%s::uuid, %s::uuid, %s, %s, %s, %s, 0, CURRENT_TIMESTAMP, 'running', %s)
+                ON CONFLICT (email_account, folder_name) DO UPDATE
+                SET last_processed_email_id = CASE
+                        WHEN EXCLUDED.last_processed_timestamp IS NOT NULL
+                         AND (s.last_processed_timestamp IS NULL
+                              OR EXCLUDED.last_processed_timestamp >= s.last_processed_timestamp)
+                        THEN EXCLUDED.last_processed_email_id
+                        ELSE s.last_processed_email_id END,
+                    last_processed_timestamp = GREATEST(s.last_processed_timestamp, EXCLUDED.last_processed_timestamp),
+                    status = 'running',
+                    resume_link = EXCLUDED.resume_link,
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                (scanner_id, entity_id, email_account, folder_name, last_processed_timestamp,
+                 last_processed_email_id, resume_link)
+            )
+            conn.commit()
+            cursor.close()
+        logger.debug(
+            f"Scan checkpoint saved for {email_account}/{folder_name} | "
+            f"watermark={last_processed_timestamp}, resume_link={'yes' if resume_link else 'no'}"
+        )
+        return True
+
+    except Exception as e:
+        logger.error(f"Error saving scan checkpoint for {email_account}/{folder_name}: {str(e)}", exc_info=True)
+        return False
@@ -0,0 +1,34 @@
+from db.connections import guident_connection
+from utils.logger import get_logger
+logger = get_logger(__name__)
+
+
+def prune_scan_history(retention_days: int) -> int:
+    """
+    Delete email_scan_history rows (and email_scan_failures counts) older
+    than retention_days. Returns history rows deleted.
+    """
+    if retention_days <= 0:
+        return 0
+
+    try:
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM email_scan_history WHERE scanned_at < CURRENT_TIMESTAMP - make_interval(days => %s)",
+                (retention_days,)
+            )
+            deleted = cursor.rowcount
+            cursor.execute(
+                "DELETE FROM email_scan_failures WHERE last_failed_at < CURRENT_TIMESTAMP - make_interval(days => %s)",
+                (retention_days,)
+            )
+            conn.commit()
+            cursor.close()
+        if deleted:
+            logger.info(f"✓ Pruned {deleted} scan history row(s) older than {retention_days} days")
+        return deleted
+
+    except Exception as e:
+        logger.error(f"Error pruning scan history: {str(e)}", exc_info=True)
+        return 0
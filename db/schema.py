@@ -0,0 +1,334 @@
+import json
+from typing import Any, Dict, List, NamedTuple
+from db.connections import guident_connection
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Session advisory lock serializing migrations across service instances
+MIGRATION_LOCK_KEY = 7_412_530_118
+
+MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS scanner_schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class ConcurrentIndex(NamedTuple):
+    """
+    Index on a live table, built with CREATE INDEX CONCURRENTLY outside the
+    migration transaction so scans keep writing while it builds.
+    """
+    name: str
+    table: str
+    columns: str
+    include: str = ""
+    unique: bool = False
+
+
+# Versioned, append-only migrations: (version, description, statements).
+# Statements are SQL strings or ConcurrentIndex entries, and all of them
+# are idempotent, so databases that already ran the pre-versioning schema
+# statements migrate cleanly. Never change what an applied migration
+# creates - add a new version instead.
+MIGRATIONS = [
+    (1, "email_scanner_state folder_name and delta_link", [
+        "ALTER TABLE email_scanner_state ADD COLUMN IF NOT EXISTS folder_name VARCHAR(255)",
+        "ALTER TABLE email_scanner_state ADD COLUMN IF NOT EXISTS delta_link TEXT",
+    ]),
+    (2, "unique email_message_id (dedup lookups, bulk insert arbiter)", [
+        ConcurrentIndex("ux_invoice_emails_email_message_id", "invoice_emails", "email_message_id", unique=True),
+    ]),
+    (3, "email_scan_history", [
+        """
+        CREATE TABLE IF NOT EXISTS email_scan_history (
+            history_id BIGSERIAL PRIMARY KEY,
+            scanner_id UUID NOT NULL,
+            entity_id UUID,
+            email_account VARCHAR(255) NOT NULL,
+            folder_name VARCHAR(255),
+            last_processed_timestamp TIMESTAMP,
+            last_processed_email_id TEXT,
+            emails_processed INTEGER NOT NULL DEFAULT 0,
+            status VARCHAR(50),
+            scanned_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_email_scan_history_scanned_at ON email_scan_history (scanned_at)",
+    ]),
+    # Compact email_scanner_state to one row per (email_account, folder_name):
+    # old rows move to email_scan_history, the newest row of each folder keeps
+    # the highest watermark, the summed scan_count and the latest deltaLink.
+    # Rows written before folder_name existed all came from Inbox scans.
+    (4, "compact email_scanner_state to one checkpoint per mailbox folder", [
+    """
+        UPDATE email_scanner_state SET folder_name = 'Inbox' WHERE folder_name IS NULL;
+
+        INSERT INTO email_scan_history
+            (scanner_id, entity_id, email_account, folder_name, last_processed_timestamp,
+             last_processed_email_id, emails_processed, status, scanned_at)
+        SELECT s.scanner_id, s.entity_id, s.email_account, s.folder_name, s.last_processed_timestamp,
+               s.last_processed_email_id, COALESCE(s.scan_count, 0), s.status,
+               COALESCE(s.last_scan_at, CURRENT_TIMESTAMP)
+        FROM email_scanner_state s
+        WHERE NOT EXISTS (SELECT 1 FROM email_scan_history h WHERE h.scanner_id = s.scanner_id);
+
+        WITH ranked AS (
+            SELECT scanner_id, email_account, folder_name,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY email_account, folder_name
+                       ORDER BY last_scan_at DESC NULLS LAST, last_processed_timestamp DESC NULLS LAST
+                   ) AS rn
+            FROM email_scanner_state
+        ),
+        totals AS (
+            SELECT email_account, folder_name,
+                   SUM(COALESCE(scan_count, 0)) AS scan_count,
+                   (ARRAY_AGG(last_processed_timestamp ORDER BY last_processed_timestamp DESC NULLS LAST))[1] AS last_processed_timestamp,
+                   (ARRAY_AGG(last_processed_email_id ORDER BY last_processed_timestamp DESC NULLS LAST))[1] AS last_processed_email_id,
+                   (ARRAY_AGG(delta_link ORDER BY last_scan_at DESC NULLS LAST) FILTER (WHERE delta_link IS NOT NULL))[1] AS delta_link
+            FROM email_scanner_state
+            GROUP BY email_account, folder_name
+            HAVING COUNT(*) > 1
+        )
+        UPDATE email_scanner_state s
+        SET scan_count = t.scan_count,
+            last_processed_timestamp = t.last_processed_timestamp,
+            last_processed_email_id = t.last_processed_email_id,
+            delta_link = COALESCE(t.delta_link, s.delta_link)
+        FROM ranked r
+        JOIN totals t ON t.email_account = r.email_account AND t.folder_name = r.folder_name
+        WHERE r.rn = 1 AND s.scanner_id = r.scanner_id;
+
+        DELETE FROM email_scanner_state s
+        USING (
+            SELECT scanner_id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY email_account, folder_name
+                       ORDER BY last_scan_at DESC NULLS LAST, last_processed_timestamp DESC NULLS LAST
+                   ) AS rn
+            FROM email_scanner_state
+        ) r
+        WHERE s.scanner_id = r.scanner_id AND r.rn > 1;
+        """,
+    ]),
+    (5, "unique checkpoint per mailbox folder (upsert arbiter)", [
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_email_scanner_state_account_folder ON email_scanner_state (email_account, folder_name)",
+    ]),
+    (6, "email_scanner_state resume_link", [
+        # nextLink of the last fully processed delta page, so an interrupted round can resume
+        "ALTER TABLE email_scanner_state ADD COLUMN IF NOT EXISTS resume_link TEXT",
+    ]),
+    (7, "covering index for the seen-message filter warm-up", [
+        ConcurrentIndex("ix_invoice_emails_received_at", "invoice_emails", "received_at", include="email_message_id"),
+    ]),
+    (8, "unique (email_message_id, received_at) - insert arbiter that survives partitioning", [
+        # A unique index on a partitioned table must contain the partition key
+        ConcurrentIndex(
+            "ux_invoice_emails_message_received", "invoice_emails", "email_message_id, received_at", unique=True
+        ),
+    ]),
+    (9, "invoice_documents content_sha256 (content-addressed attachments)", [
+        "ALTER TABLE invoice_documents ADD COLUMN IF NOT EXISTS content_sha256 CHAR(64)",
+        ConcurrentIndex("ix_invoice_documents_content_sha256", "invoice_documents", "content_sha256", include="s3_url"),
+    ]),
+    (10, "email_scan_failures (failed scans per email, caps watermark holds)", [
+        """
+        CREATE TABLE IF NOT EXISTS email_scan_failures (
+            email_account VARCHAR(255) NOT NULL,
+            folder_name VARCHAR(255) NOT NULL,
+            email_message_id TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            last_failed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (email_account, folder_name, email_message_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_email_scan_failures_last_failed_at ON email_scan_failures (last_failed_at)",
+    ]),
+]
+
+# Hot queries that must be served by an index: (name, table, query, params).
+# Planned with enable_seqscan off, so a Seq Scan in the plan means no usable
+# index exists (not just that the table is still small).
+HOT_QUERIES = [
+    (
+        "duplicate check",
+        "invoice_emails",
+        "SELECT email_message_id FROM invoice_emails WHERE email_message_id = ANY(%s) "
+        "AND received_at BETWEEN CURRENT_TIMESTAMP AND CURRENT_TIMESTAMP",
+        (["probe"],),
+    ),
+    (
+        "seen-filter warm-up",
+        "invoice_emails",
+        "SELECT email_message_id FROM invoice_emails WHERE received_at >= CURRENT_TIMESTAMP",
+        None,
+    ),
+    (
+        "attachment content lookup",
+        "invoice_documents",
+        "SELECT s3_url FROM invoice_documents WHERE content_sha256 = %s LIMIT 1",
+        ("0" * 64,),
+    ),
+    (
+        "scanner checkpoint",
+        "email_scanner_state",
+        "SELECT last_processed_timestamp, status, resume_link, delta_link FROM email_scanner_state "
+        "WHERE email_account = %s AND folder_name = %s",
+        ("probe", "Inbox"),
+    ),
+]
+
+
+def _check_no_duplicates(cursor, index: ConcurrentIndex) -> None:
+    """Refuse to build a unique index over rows that would violate it."""
+    cursor.execute(
+        f"SELECT {index.columns} FROM {index.table} GROUP BY {index.columns} HAVING COUNT(*) > 1 LIMIT 3"
+    )
+    duplicates = cursor.fetchall()
+    if duplicates:
+        raise RuntimeError(
+            f"{index.table} has duplicate ({index.columns}) rows, e.g. {duplicates} - "
+            f"remove the duplicates before {index.name} can be built"
+        )
+
+
+def _build_index_concurrently(conn, cursor, index: ConcurrentIndex) -> None:
+    """
+    Build the index without blocking writes. A build interrupted earlier
+    leaves an INVALID index behind, which is dropped and rebuilt.
+    """
+    cursor.execute(
+        "SELECT (SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)), "
+        "(SELECT relkind FROM pg_class WHERE oid = to_regclass(%s))",
+        (index.name, index.table)
+    )
+    valid, relkind = cursor.fetchone()
+    if valid:
+        logger.debug(f"Index {index.name} already exists")
+        return
+    if index.unique:
+        _check_no_duplicates(cursor, index)
+    conn.commit()
+
+    create = (
+        f"CREATE {'UNIQUE ' if index.unique else ''}INDEX "
+        f"{'' if relkind == 'p' else 'CONCURRENTLY '}IF NOT EXISTS {index.name} "
+        f"ON {index.table} ({index.columns})"
+        f"{f' INCLUDE ({index.include})' if index.include else ''}"
+    )
+    if relkind == 'p':
+        # Partitioned tables do not support CONCURRENTLY (partitions.py builds their indexes)
+        cursor.execute(create)
+        return
+
+    # CONCURRENTLY cannot run inside a transaction block
+    conn.autocommit = True
+    try:
+        if valid is False:
+            logger.warning(f"⚠ Dropping invalid index {index.name} left by an interrupted build")
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}")
+        logger.info(f"Building index {index.name} concurrently on {index.table}")
+        cursor.execute(create)
+    finally:
+        conn.autocommit = False
+
+
+def apply_migrations() -> bool:
+    """
+    Apply pending migrations in order, one transaction per version (indexes
+    on live tables are built concurrently, outside it). Later versions may
+    depend on earlier ones, so the first failure stops the run; startup
+    treats that as fatal.
+    """
+    logger.info("Applying scanner schema migrations")
+    try:
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+            try:
+                cursor.execute(MIGRATIONS_TABLE)
+                conn.commit()
+
+                cursor.execute("SELECT version FROM scanner_schema_migrations")
+                applied = {row[0] for row in cursor.fetchall()}
+                conn.commit()
+
+                pending = [m for m in MIGRATIONS if m[0] not in applied]
+                if not pending:
+                    logger.info(f"Scanner schema is up to date (version {MIGRATIONS[-1][0]})")
+                    return True
+
+                for version, description, statements in pending:
+                    logger.info(f"Applying migration {version}: {description}")
+                    try:
+                        for statement in statements:
+                            if isinstance(statement, ConcurrentIndex):
+                                _build_index_concurrently(conn, cursor, statement)
+                                continue
+                            logger.debug(f"Applying schema statement: {statement.strip()[:120]}")
+                            cursor.execute(statement)
+                        cursor.execute(
+                            "INSERT INTO scanner_schema_migrations (version, description) VALUES (%s, %s)",
+                            (version, description)
+                        )
+                        conn.commit()
+                    except Exception as e:
+                        conn.rollback()
+                        blocked = [m[0] for m in pending if m[0] > version]
+                        logger.error(
+                            f"✗ Migration {version} failed: {description} | Error: {str(e)} | "
+                            f"schema stays at the previous version, not applied: {[version] + blocked}"
+                        )
+                        return False
+                    logger.info(f"✓ Migration {version} applied")
+                return True
+            finally:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+                conn.commit()
+                cursor.close()
+
+    except Exception as e:
+        logger.error(f"Scanner schema migration error: {str(e)}", exc_info=True)
+        return False
+
+
+def _seq_scans(plan: Dict[str, Any]) -> List[str]:
+    """Relations read by Seq Scan nodes anywhere in an EXPLAIN (FORMAT JSON) plan."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def verify_hot_query_plans() -> bool:
+    """EXPLAIN each hot query; False when any would need a sequential scan."""
+    ok = True
+    try:
+        with guident_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            for name, table, query, params in HOT_QUERIES:
+                cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                seq_scans = _seq_scans(plan[0]["Plan"])
+                if table in seq_scans:
+                    ok = False
+                    logger.warning(f"⚠ Hot query '{name}' would use a sequential scan on {table}")
+                else:
+                    logger.debug(f"✓ Hot query '{name}' is index-backed")
+            conn.rollback()
+            cursor.close()
+
+    except Exception as e:
+        logger.error(f"Hot query plan check error: {str(e)}", exc_info=True)
+        return False
+
+    return ok
@@ -0,0 +1,187 @@
+"""
+In-process filter of email_message_ids already stored in invoice_emails.
+
+The filter answers "definitely new" locally; only possible hits go to
+Postgres. It is warmed from recent invoice_emails rows and updated on
+every insert made by this process, so it only knows messages received
+after its horizon. Anything older than the horizon is always checked in
+the database.
+
+Two Bloom filter generations are kept: when the current one reaches
+SEEN_FILTER_CAPACITY the previous one is dropped, and the horizon moves
+to the start of the generation that is kept. A message is inserted after
+it is received, so every message received since a generation started has
+been added to that generation or a newer one.
+
+The filter only learns this process's inserts, so it requires a single
+writer of invoice_emails (SEEN_FILTER_ENABLED is off by default). If an
+insert conflicts with a row the filter never saw, another writer exists
+and the filter is switched off for the rest of the process.
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from config.settings import (
+    SEEN_FILTER_ENABLED,
+    SEEN_FILTER_CAPACITY,
+    SEEN_FILTER_FALSE_POSITIVE_RATE,
+    SEEN_FILTER_WARM_DAYS,
+)
+from db.connections import guident_connection
+from utils.bloom_filter import BloomFilter
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Received times this close to the horizon are still checked in the DB (clock skew)
+HORIZON_SAFETY_MARGIN = timedelta(minutes=5)
+
+_lock = threading.Lock()
+_current: Optional[BloomFilter] = None
+_previous: Optional[BloomFilter] = None
+# Start of the current generation, and the oldest received time the filter covers
+_current_started: Optional[datetime] = None
+_horizon: Optional[datetime] = None
+# Ids marked while the warm-up query streams (its snapshot may miss them)
+_warmup_buffer: Optional[List[str]] = None
+
+
+def _new_filter() -> BloomFilter:
+    return BloomFilter(SEEN_FILTER_CAPACITY, SEEN_FILTER_FALSE_POSITIVE_RATE)
+
+
+def _parse_received(value: str) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+
+
+def warm_seen_filter() -> bool:
+    """Build the filter from invoice_emails received in the last SEEN_FILTER_WARM_DAYS."""
+    global _current, _previous, _current_started, _horizon, _warmup_buffer
+
+    if not SEEN_FILTER_ENABLED:
+        logger.info("Seen-message filter disabled")
+        return False
+
+    horizon = datetime.now(timezone.utc) - timedelta(days=SEEN_FILTER_WARM_DAYS)
+    bloom = _new_filter()
+    logger.info(
+        f"Warming seen-message filter from invoice_emails since {horizon:%Y-%m-%dT%H:%M:%SZ} | "
+        f"capacity={bloom.capacity}, error_rate={bloom.error_rate}, size={bloom.size_bytes} bytes"
+    )
+
+    with _lock:
+        _warmup_buffer = []
+
+    try:
+        with guident_connection() as conn:
+            # Server-side cursor - ids are streamed, never held as one list
+            cursor = conn.cursor(name="seen_filter_warmup")
+            cursor.itersize = 10000
+            cursor.execute(
+                "SELECT email_message_id FROM invoice_emails WHERE received_at >= %s",
+                (horizon,)
+            )
+            for (email_message_id,) in cursor:
+                if email_message_id:
+                    bloom.add(email_message_id)
+            cursor.close()
+            conn.commit()
+    except Exception as e:
+        logger.error(f"Seen-message filter warm-up failed: {str(e)}", exc_info=True)
+        with _lock:
+            _warmup_buffer = None
+        return False
+
+    if bloom.count > bloom.capacity:
+        logger.warning(
+            f"⚠ Seen-message filter holds {bloom.count} ids, above its capacity of "
+            f"{bloom.capacity} - more lookups will fall through to the DB"
+        )
+
+    with _lock:
+        buffered, _warmup_buffer = _warmup_buffer or [], None
+        for email_message_id in buffered:
+            bloom.add(email_message_id)
+        _current, _previous = bloom, None
+        _current_started = horizon
+        _horizon = horizon
+
+    logger.info(f"✓ Seen-message filter ready | ids={bloom.count}, marked during warm-up={len(buffered)}")
+    return True
+
+
+def mark_seen(email_message_id: str) -> None:
+    """Record an id that is now stored in invoice_emails."""
+    global _current, _previous, _current_started, _horizon
+
+    if not email_message_id:
+        return
+    email_message_id = email_message_id[:255]
+
+    with _lock:
+        if _current is None:
+            if _warmup_buffer is not None:
+                _warmup_buffer.append(email_message_id)
+            return
+        if _current.count >= _current.capacity:
+            now = datetime.now(timezone.utc)
+            _previous, _current = _current, _new_filter()
+            _horizon, _current_started = _current_started, now
+            logger.info(f"Seen-message filter rotated | horizon={_horizon:%Y-%m-%dT%H:%M:%SZ}")
+        _current.add(email_message_id)
+
+
+def note_insert_conflict(email_message_id: str) -> None:
+    """
+    An insert found the row already stored. Unless this process stored it
+    (it is in the filter), another writer exists and "definitely new" can
+    no longer be trusted - every id goes back to the DB check.
+    """
+    global _current, _previous, _warmup_buffer
+
+    if not email_message_id:
+        return
+    key = email_message_id[:255]
+    with _lock:
+        if _current is None or key in _current or (_previous is not None and key in _previous):
+            return
+        _current, _previous, _warmup_buffer = None, None, None
+    logger.error(
+        f"✗ Seen-message filter disabled - email {key[:30]}... was stored by another writer "
+        f"(SEEN_FILTER_ENABLED needs a single scanner instance)"
+    )
+
+
+def split_by_seen_filter(messages: List[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+    """
+    Split a page into ids that are definitely new and ids to check in Postgres.
+
+    Returns:
+        tuple: (definitely new ids, ids that need the DB duplicate check)
+    """
+    ids = [m.get("id") for m in messages]
+
+    with _lock:
+        if _current is None:
+            return [], ids
+
+        trusted_since = _horizon + HORIZON_SAFETY_MARGIN
+        definitely_new, to_check = [], []
+        for message, email_id in zip(messages, ids):
+            received = _parse_received(message.get("receivedDateTime", ""))
+            key = email_id[:255]
+            if (received is not None and received >= trusted_since
+                    and key not in _current
+                    and (_previous is None or key not in _previous)):
+                definitely_new.append(email_id)
+            else:
+                to_check.append(email_id)
+
+    logger.debug(
+        f"Seen-message filter: {len(definitely_new)} definitely new, "
+        f"{len(to_check)} to check in DB"
+    )
+    return definitely_new, to_check
@@ -1,55 +1,349 @@
 import base64
-from aws.push_s3 import upload_attachment_to_s3
-from db.insert_document import insert_document_to_database
-from config.settings import GRAPH_API_ENDPOINT
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from aws.content_store import store_attachment, store_attachment_stream
+from utils.document_type import MIME_EXTENSION_TO_DOC_TYPE
+from config.settings import (
+    GRAPH_API_ENDPOINT,
+    ATTACHMENT_STREAM_THRESHOLD_BYTES,
+    ATTACHMENT_BATCH_MAX_BYTES,
+    ATTACHMENT_WORKERS,
+    ATTACHMENT_WORKERS_PER_EMAIL,
+)
+from graph.batch import execute_batch
+from graph.client import get_data
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+FILE_ATTACHMENT_TYPE = "#microsoft.graph.fileAttachment"
 
-def process_attachments(session, user_email, folder_id, email_id, work_id, attachments=None):
+# Attachment listings request metadata only; bytes are fetched per attachment
+ATTACHMENT_METADATA_SELECT = "id,name,contentType,size,isInline"
+
+# Read size for streamed downloads (S3 parts are assembled from these chunks)
+ATTACHMENT_STREAM_CHUNK_BYTES = 1024 * 1024
+
+# Decode/upload workers shared by all emails (ATTACHMENT_WORKERS in total)
+_attachment_executor: Optional[ThreadPoolExecutor] = None
+_attachment_executor_lock = threading.Lock()
+
+
+def _get_attachment_executor() -> ThreadPoolExecutor:
+    global _attachment_executor
+    with _attachment_executor_lock:
+        if _attachment_executor is None:
+            _attachment_executor = ThreadPoolExecutor(
+                max_workers=max(1, ATTACHMENT_WORKERS),
+                thread_name_prefix="attachment"
+            )
+        return _attachment_executor
+
+
+def fetch_attachments_batch(session, user_email, folder_id,
+                            email_ids: List[str]) -> Dict[str, Optional[List[Dict]]]:
+    """
+    Fetch attachment metadata for many emails through Graph $batch (20 emails per call).
+
+    Args:
+        session: Graph API session
+        user_email: Email account
+        folder_id: Mail folder ID
+        email_ids: Email message IDs to resolve
+
+    Returns:
+        dict: email_id -> list of attachment metadata, or None when the batch item
+              failed (process_attachments then fetches that email itself)
+    """
+    if not email_ids:
+        return {}
+
+    logger.info(f"Fetching attachments via $batch | emails={len(email_ids)}")
+
+    batch_requests = [
+        {
+            "id": str(idx),
+            "method": "GET",
+            "url": f"{_attachments_path(user_email, folder_id, email_id)}?$select={ATTACHMENT_METADATA_SELECT}"
+        }
+        for idx, email_id in enumerate(email_ids)
+    ]
+
+    results: Dict[str, Optional[List[Dict]]] = {email_id: None for email_id in email_ids}
+    try:
+        responses = execute_batch(session, batch_requests)
+    except Exception as e:
+        logger.error(f"✗ Attachment $batch failed | Error: {str(e)}", exc_info=True)
+        return results
+
+    failed = 0
+    for idx, email_id in enumerate(email_ids):
+        item = responses.get(str(idx))
+        if item and item.get("status") == 200:
+            results[email_id] = (item.get("body") or {}).get("value", [])
+        else:
+            failed += 1
+            logger.warning(
+                f"⚠ Attachment batch item failed | email_id={email_id[:30]}..., "
+                f"status={item.get('status') if item else None}"
+            )
+
+    logger.info(
+        f"✓ Attachment $batch complete | emails={len(email_ids)}, failed={failed}"
+    )
+    return results
+
+
+def _attachments_path(user_email, folder_id, email_id) -> str:
+    """Attachments collection of a message, relative to GRAPH_API_ENDPOINT."""
+    return f"/users/{user_email}/mailFolders/{folder_id}/messages/{email_id}/attachments"
+
+
+def _is_file_attachment(attachment: Dict) -> bool:
+    """Only file attachments carry bytes; item/reference attachments do not."""
+    return attachment.get("@odata.type", FILE_ATTACHMENT_TYPE) == FILE_ATTACHMENT_TYPE
+
+
+def _is_supported_document(attachment: Dict) -> bool:
+    """Same extension check get_document_type_from_filename applies on insert."""
+    return Path(attachment.get("name") or "").suffix.lower() in MIME_EXTENSION_TO_DOC_TYPE
+
+
+def _should_stream(attachment: Dict) -> bool:
+    return (attachment.get("size") or 0) > ATTACHMENT_STREAM_THRESHOLD_BYTES
+
+
+def _content_groups(attachments: List[Dict]) -> List[List[Dict]]:
+    """
+    Split attachments into $batch groups of at most ATTACHMENT_BATCH_MAX_BYTES
+    (reported size; an attachment above the budget forms its own group).
+    """
+    groups: List[List[Dict]] = []
+    group_bytes = 0
+    for attachment in attachments:
+        size = attachment.get("size") or 0
+        if not groups or group_bytes + size > ATTACHMENT_BATCH_MAX_BYTES:
+            groups.append([])
+            group_bytes = 0
+        groups[-1].append(attachment)
+        group_bytes += size
+    return groups
+
+
+def _fetch_attachment_contents(session, user_email, folder_id, email_id,
+                               attachment_ids: List[str]) -> Dict[str, str]:
+    """
+    Fetch contentBytes for the given attachments of one email via $batch,
+    falling back to a direct GET for items the batch could not serve.
+
+    Returns:
+        dict: attachment_id -> base64 contentBytes (items that still failed are omitted)
     """
-    Process and upload attachments for an email.
+    if not attachment_ids:
+        return {}
+
+    path = _attachments_path(user_email, folder_id, email_id)
+    batch_requests = [
+        {"id": str(idx), "method": "GET", "url": f"{path}/{attachment_id}"}
+        for idx, attachment_id in enumerate(attachment_ids)
+    ]
+
+    contents: Dict[str, str] = {}
+    try:
+        responses = execute_batch(session, batch_requests)
+    except Exception as e:
+        logger.error(
+            f"✗ Attachment content $batch failed | email_id={email_id[:30]}... | "
+            f"Error: {str(e)}",
+            exc_info=True
+        )
+        responses = {}
+
+    for idx, attachment_id in enumerate(attachment_ids):
+        item = responses.get(str(idx))
+        if item and item.get("status") == 200:
+            content_bytes = (item.get("body") or {}).get("contentBytes")
+            if content_bytes:
+                contents[attachment_id] = content_bytes
+                continue
+
+        # Fall back to a direct GET for items the batch could not serve
+        try:
+            url = f"{GRAPH_API_ENDPOINT}{path}/{attachment_id}"
+            content_bytes = get_data(session, url).get("contentBytes")
+            if content_bytes:
+                contents[attachment_id] = content_bytes
+        except Exception as e:
+            logger.error(
+                f"✗ Failed to fetch attachment content | email_id={email_id[:30]}..., "
+                f"attachment_id={attachment_id[:30]}... | Error: {str(e)}"
+            )
+
+    return contents
+
+
+def _stream_attachment_to_s3(session, user_email, folder_id, email_id,
+                             attachment: Dict) -> Optional[Dict[str, Any]]:
+    """
+    Stream raw attachment bytes from /$value into S3, hashing them on the way.
+    Memory stays at a few multipart parts regardless of the attachment size.
+    """
+    value_url = (
+        f"{GRAPH_API_ENDPOINT}{_attachments_path(user_email, folder_id, email_id)}"
+        f"/{attachment.get('id')}/$value"
+    )
+    logger.debug(f"Attachment stream URL: {value_url}")
+
+    with session.get(value_url, stream=True, timeout=(10, 300)) as response:
+        response.raise_for_status()
+        return store_attachment_stream(
+            response.iter_content(chunk_size=ATTACHMENT_STREAM_CHUNK_BYTES),
+            attachment.get("name"),
+            email_id,
+            attachment.get("contentType")
+        )
+
+
+def _upload_attachment(session, user_email, folder_id, email_id, attachment: Dict,
+                       content_bytes: Optional[str], stream: bool) -> Optional[Dict[str, Any]]:
+    """Decode (or stream) and store one attachment; None when it failed."""
+    att_name = attachment.get("name", "<unnamed>")
+    att_size = attachment.get("size", 0)
+    try:
+        if stream:
+            # Large file - stream straight into a multipart upload
+            logger.debug(f"Streaming to S3: {att_name} ({att_size} bytes)")
+            stored = _stream_attachment_to_s3(
+                session, user_email, folder_id, email_id, attachment
+            )
+        else:
+            # Decode and upload to S3
+            logger.debug(f"Decoding and uploading: {att_name}")
+            att_data = base64.b64decode(content_bytes)
+            
+            stored = store_attachment(
+                att_data,
+                attachment.get("name"),
+                email_id,
+                attachment.get("contentType")
+            )
+        
+        if not stored:
+            logger.error(f"✗ S3 upload failed: {att_name}")
+            return None
+        
+        logger.debug(f"✓ S3 uploaded: {att_name} → {stored['s3_url']}")
+        
+        return {
+            "file_name": attachment.get("name"),
+            "file_size": attachment.get("size"),
+            "content_type": attachment.get("contentType"),
+            "s3_url": stored["s3_url"],
+            "content_sha256": stored["content_sha256"],
+        }
+    
+    except Exception as e:
+        logger.error(
+            f"✗ Failed to process attachment: {att_name} | "
+            f"Error: {str(e)}",
+            exc_info=True
+        )
+        return None
+
+
+def _run_uploads(session, user_email, folder_id, email_id,
+                 uploads: List[Tuple[Dict, Optional[str], bool]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Run _upload_attachment for each (attachment, content_bytes, stream) on
+    the shared pool, at most ATTACHMENT_WORKERS_PER_EMAIL at a time for this
+    email. Results come back in input order.
+    """
+    per_email = max(1, ATTACHMENT_WORKERS_PER_EMAIL)
+    if len(uploads) <= 1 or per_email == 1:
+        return [_upload_attachment(session, user_email, folder_id, email_id, *u) for u in uploads]
+    
+    executor = _get_attachment_executor()
+    slots = threading.BoundedSemaphore(per_email)
+    futures: List[Future] = []
+    for upload in uploads:
+        slots.acquire()
+        future = executor.submit(_upload_attachment, session, user_email, folder_id, email_id, *upload)
+        future.add_done_callback(lambda _: slots.release())
+        futures.append(future)
+    
+    return [future.result() for future in futures]
+
+
+def process_attachments(session, user_email, folder_id, email_id, attachments=None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Upload the attachments of an email to S3.
+    
+    Small attachments are fetched in $batch calls of at most
+    ATTACHMENT_BATCH_MAX_BYTES and uploaded with put_object, one group at
+    a time; attachments above ATTACHMENT_STREAM_THRESHOLD_BYTES are
+    streamed from /$value into a parallel S3 multipart upload. Unsupported file
+    types are skipped before anything is downloaded. Attachments are
+    decoded and uploaded in parallel (ATTACHMENT_WORKERS_PER_EMAIL at a
+    time, ATTACHMENT_WORKERS overall) and returned in attachment order.
+    Content already stored is reused when S3_CONTENT_ADDRESSED is on.
+    Document rows are written by the caller, together with the email, in
+    one transaction.
     
     Args:
         session: Graph API session
         user_email: Email account
         folder_id: Mail folder ID
         email_id: Email message ID
-        work_id: Work ID from database
-        attachments: Ignored - always fetches from API
+        attachments: Attachment metadata already resolved (expanded in the listing or
+                     fetched by fetch_attachments_batch); when None it is fetched from the API
     
     Returns:
-        int: Number of successfully uploaded attachments
+        list: Uploaded documents - dicts with file_name, file_size, content_type, s3_url,
+              content_sha256. None when the attachments or the content of a
+              supported file attachment could not be fetched - the email must
+              then fail, so a later scan retries it instead of storing it
+              without its documents.
     """
-    uploaded_count = 0
-    
-    # ✅ ALWAYS fetch attachments from Graph API
-    # The initial message list doesn't include full attachment data
-    logger.debug(
-        f"Fetching attachments from Graph API | "
-        f"email_id={email_id[:30]}..., work_id={work_id}"
-    )
+    documents: List[Dict[str, Any]] = []
     
     try:
-        # Fetch attachment details from Graph API
-        att_url = f"{GRAPH_API_ENDPOINT}/users/{user_email}/mailFolders/{folder_id}/messages/{email_id}/attachments"
-        logger.debug(f"Attachment API URL: {att_url}")
-        
-        att_response = session.get(att_url)
-        att_response.raise_for_status()
-        
-        attachment_values = att_response.json().get("value", [])
+        if attachments is not None:
+            attachment_values = attachments
+        else:
+            # The initial message list doesn't include attachment data
+            logger.debug(
+                f"Fetching attachments from Graph API | "
+                f"email_id={email_id[:30]}..."
+            )
+            att_url = f"{GRAPH_API_ENDPOINT}{_attachments_path(user_email, folder_id, email_id)}"
+            logger.debug(f"Attachment API URL: {att_url}")
+            
+            att_response = session.get(att_url, params={"$select": ATTACHMENT_METADATA_SELECT})
+            att_response.raise_for_status()
+            
+            attachment_values = att_response.json().get("value", [])
         
         if not attachment_values:
             logger.info(f"No attachments found via API | email_id={email_id[:30]}...")
-            return uploaded_count
+            return documents
+        
+        # hasAttachments is also set for signature images - nothing to fetch then
+        if all(a.get("isInline") for a in attachment_values):
+            logger.info(
+                f"⏭ Only inline attachments ({len(attachment_values)}) | "
+                f"email_id={email_id[:30]}..."
+            )
+            return documents
         
         logger.info(
-            f"Fetched {len(attachment_values)} attachment(s) from Graph API | "
-            f"email_id={email_id[:30]}..., work_id={work_id}"
+            f"Processing {len(attachment_values)} attachment(s) | "
+            f"email_id={email_id[:30]}..."
         )
         
+        uploads = []
+        to_fetch = []
         for idx, attachment in enumerate(attachment_values, 1):
             att_name = attachment.get("name", "<unnamed>")
             att_type = attachment.get("contentType", "<unknown>")
@@ -65,74 +359,70 @@ def process_attachments(session, user_email, folder_id, email_id, work_id, attac
                 logger.debug(f"⏭ Skipping inline attachment: {att_name}")
                 continue
             
+            # Unsupported types would be rejected by invoice_documents - don't download them
+            if not _is_supported_document(attachment):
+                logger.warning(f"⏭ Skipping unsupported attachment type: {att_name}")
+                continue
+            
+            stream = _is_file_attachment(attachment) and _should_stream(attachment)
+            
             # Check for content bytes
             content_bytes = attachment.get("contentBytes")
-            if not content_bytes:
+            if content_bytes or stream:
+                uploads.append((idx, (attachment, content_bytes, stream)))
+            elif _is_file_attachment(attachment):
+                # Listings carry metadata only - bytes are fetched below
+                to_fetch.append((idx, attachment))
+            else:
+                # Item/reference attachments carry no bytes
                 logger.warning(
                     f"⚠ No content bytes for attachment: {att_name} | "
                     f"email_id={email_id[:30]}..."
                 )
-                continue
-            
-            try:
-                # Decode and upload to S3
-                logger.debug(f"Decoding and uploading: {att_name}")
-                att_data = base64.b64decode(content_bytes)
-                
-                s3_url = upload_attachment_to_s3(
-                    att_data,
-                    attachment.get("name"),
-                    email_id,
-                    attachment.get("contentType")
-                )
-                
-                if not s3_url:
-                    logger.error(f"✗ S3 upload failed: {att_name}")
-                    continue
-                
-                logger.debug(f"✓ S3 uploaded: {att_name} → {s3_url}")
-                
-                # Insert into database
-                doc_id = insert_document_to_database(
-                    work_id,
-                    attachment.get("name"),
-                    attachment.get("size"),
-                    attachment.get("contentType"),
-                    s3_url
-                )
-                
-                if doc_id:
-                    uploaded_count += 1
-                    logger.info(
-                        f"✓ Attachment stored | "
-                        f"doc_id={doc_id}, name='{att_name}', "
-                        f"size={att_size}, work_id={work_id}"
-                    )
-                else:
-                    logger.error(
-                        f"✗ DB insert failed for attachment: {att_name} | "
-                        f"work_id={work_id}"
-                    )
-            
-            except Exception as e:
+        
+        stored_by_index: Dict[int, Optional[Dict[str, Any]]] = {}
+        index_of = {id(attachment): idx for idx, attachment in to_fetch}
+        
+        # Small files are fetched in $batch groups within ATTACHMENT_BATCH_MAX_BYTES;
+        # each group is uploaded before the next is fetched, so only one group's
+        # contents are held at a time
+        for group in _content_groups([attachment for _, attachment in to_fetch]):
+            contents = _fetch_attachment_contents(
+                session, user_email, folder_id, email_id, [a.get("id") for a in group]
+            )
+            missing_content = [a.get("name", "<unnamed>") for a in group if a.get("id") not in contents]
+            if missing_content:
                 logger.error(
-                    f"✗ Failed to process attachment: {att_name} | "
-                    f"Error: {str(e)}",
-                    exc_info=True
+                    f"✗ Attachment content unavailable, email will be retried | "
+                    f"email_id={email_id[:30]}..., attachments={missing_content}"
                 )
-                continue
+                return None
+            group_uploads = [(a, contents.pop(a.get("id")), False) for a in group]
+            for attachment, stored in zip(group, _run_uploads(session, user_email, folder_id, email_id, group_uploads)):
+                stored_by_index[index_of[id(attachment)]] = stored
+            # Release this group's bytes before the next group is fetched
+            del group_uploads
+        
+        # Streamed files and bytes that came with the listing
+        for (idx, _), stored in zip(uploads, _run_uploads(
+                session, user_email, folder_id, email_id, [u for _, u in uploads])):
+            stored_by_index[idx] = stored
+        
+        # Keep attachment order
+        documents = [stored for _, stored in sorted(stored_by_index.items()) if stored]
         
         logger.info(
             f"✓ Attachment processing complete | "
-            f"work_id={work_id}, uploaded={uploaded_count}/{len(attachment_values)}"
+            f"email_id={email_id[:30]}..., uploaded={len(documents)}/{len(attachment_values)}"
         )
     
     except Exception as e:
         logger.error(
             f"✗ Attachment processing error | "
-            f"email_id={email_id[:30]}..., work_id={work_id} | "
+            f"email_id={email_id[:30]}... | "
             f"Error: {str(e)}",
             exc_info=True
         )
+        return None
     
-    return uploaded_count
\ No newline at end of file
+    return documents
\ No newline at end of file
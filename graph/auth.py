@@ -1,45 +1,98 @@
 # graph/auth.py
 import msal
 import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from config.settings import GRAPH_TOKEN_CACHE_PATH, GRAPH_TOKEN_REFRESH_MARGIN_SECONDS
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+GRAPH_SCOPES = ["https://graph.microsoft.com/.default"]
 
-def get_graph_access_token(   client_id: str,
-    client_secret: str,
-    tenant_id: str) -> str:
+# MSAL serves its cached app token until fewer than 5 minutes are left, so
+# refreshing earlier than that would only get the same token back
+MSAL_REFRESH_WINDOW_SECONDS = 300
+
+# One provider per (tenant_id, client_id), shared by every scan in the process
+_providers: Dict[Tuple[str, str], "GraphTokenProvider"] = {}
+_providers_lock = threading.Lock()
+
+
+class GraphTokenProvider:
     """
-    Acquire Microsoft Graph API access token using client credentials.
+    Process-wide Graph token source for a single app registration.
+
+    Keeps one MSAL ConfidentialClientApplication, serves the cached token
+    and re-acquires it GRAPH_TOKEN_REFRESH_MARGIN_SECONDS (at most
+    MSAL_REFRESH_WINDOW_SECONDS) before expiry.
+    When GRAPH_TOKEN_CACHE_PATH is set the MSAL cache is persisted to disk
+    so restarts reuse a still-valid token.
     """
-    logger.info("Starting Microsoft Graph authentication")
 
-    try:
-        logger.debug(
-            "Initializing MSAL ConfidentialClientApplication "
-            f"(tenant_id={tenant_id})"
-        )
-        
+    def __init__(self, client_id: str, client_secret: str, tenant_id: str,
+                 cache_path: Optional[str] = None,
+                 refresh_margin_seconds: int = GRAPH_TOKEN_REFRESH_MARGIN_SECONDS):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.tenant_id = tenant_id
+        self.cache_path = cache_path
+        self.refresh_margin_seconds = min(refresh_margin_seconds, MSAL_REFRESH_WINDOW_SECONDS)
+        if refresh_margin_seconds > MSAL_REFRESH_WINDOW_SECONDS:
+            logger.warning(
+                f"⚠ Graph token refresh margin {refresh_margin_seconds}s capped at "
+                f"{MSAL_REFRESH_WINDOW_SECONDS}s (MSAL does not renew app tokens earlier)"
+            )
+
+        self._lock = threading.Lock()
+        self._access_token: Optional[str] = None
+        self._expires_at = 0.0
+
+        self._cache = msal.SerializableTokenCache()
+        self._load_cache()
+
         # Check if SSL verification should be disabled
         verify_ssl = os.getenv("VERIFY_SSL", "true").lower() in ('true', '1', 'yes')
-        
-        # Create HTTP client configuration
-        http_client_config = {}
         if not verify_ssl:
             logger.warning("SSL verification disabled for Microsoft Graph API")
-            http_client_config = {"verify": False}
 
-        app = msal.ConfidentialClientApplication(
+        logger.debug(
+            "Initializing MSAL ConfidentialClientApplication "
+            f"(tenant_id={tenant_id})"
+        )
+        self._app = msal.ConfidentialClientApplication(
             client_id,
             authority=f"https://login.microsoftonline.com/{tenant_id}",
             client_credential=client_secret,
+            token_cache=self._cache,
             verify=verify_ssl
         )
 
+    def get_token(self) -> str:
+        """Return a valid access token, refreshing it shortly before expiry."""
+        if self._is_fresh():
+            return self._access_token
+
+        with self._lock:
+            # Another thread may have refreshed while we waited
+            if self._is_fresh():
+                return self._access_token
+            return self._acquire()
+
+    def invalidate(self) -> None:
+        """Drop the in-memory token so the next call goes back to MSAL."""
+        with self._lock:
+            self._access_token = None
+            self._expires_at = 0.0
+        logger.info(f"Graph access token invalidated (tenant_id={self.tenant_id})")
+
+    def _is_fresh(self) -> bool:
+        return bool(self._access_token) and time.time() < self._expires_at - self.refresh_margin_seconds
+
+    def _acquire(self) -> str:
         logger.debug("Requesting Graph API access token")
-        result = app.acquire_token_for_client(
-            scopes=["https://graph.microsoft.com/.default"]
-        )
+        result = self._app.acquire_token_for_client(scopes=GRAPH_SCOPES)
 
         if "access_token" not in result:
             error = result.get("error")
@@ -51,8 +104,80 @@ def get_graph_access_token(   client_id: str,
             )
             raise RuntimeError("Graph authentication failed")
 
-        logger.info("Graph access token acquired successfully")
-        return result["access_token"]
+        changed = result["access_token"] != self._access_token
+        self._access_token = result["access_token"]
+        self._expires_at = time.time() + int(result.get("expires_in", 0))
+        self._save_cache()
+
+        source = result.get("token_source", "identity_provider")
+        message = (
+            "Graph access token acquired successfully | "
+            f"source={source}, expires_in={result.get('expires_in')}s"
+        )
+        if changed:
+            logger.info(message)
+        else:
+            logger.debug(message)
+        return self._access_token
+
+    def _load_cache(self) -> None:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r") as f:
+                self._cache.deserialize(f.read())
+            logger.debug(f"Graph token cache loaded from {self.cache_path}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load Graph token cache from {self.cache_path}: {str(e)}")
+
+    def _save_cache(self) -> None:
+        if not self.cache_path or not self._cache.has_state_changed:
+            return
+        try:
+            tmp_path = f"{self.cache_path}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(self._cache.serialize())
+            os.replace(tmp_path, self.cache_path)
+            self._cache.has_state_changed = False
+            logger.debug(f"Graph token cache persisted to {self.cache_path}")
+        except OSError as e:
+            logger.warning(f"Could not persist Graph token cache to {self.cache_path}: {str(e)}")
+
+
+def get_token_provider(client_id: str,
+                       client_secret: str,
+                       tenant_id: str) -> GraphTokenProvider:
+    """
+    Return the shared token provider for (tenant_id, client_id).
+    A changed client secret (rotation) replaces the cached provider.
+    """
+    key = (tenant_id, client_id)
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None or provider.client_secret != client_secret:
+            logger.info(f"Creating Graph token provider (tenant_id={tenant_id})")
+            provider = GraphTokenProvider(
+                client_id,
+                client_secret,
+                tenant_id,
+                cache_path=GRAPH_TOKEN_CACHE_PATH
+            )
+            _providers[key] = provider
+        return provider
+
+
+def get_graph_access_token(   client_id: str,
+    client_secret: str,
+    tenant_id: str) -> str:
+    """
+    Acquire Microsoft Graph API access token using client credentials.
+    Served from the shared provider, so repeated calls do not hit the token endpoint.
+    """
+    logger.info("Starting Microsoft Graph authentication")
+
+    try:
+        return get_token_provider(client_id, client_secret, tenant_id).get_token()
 
     except Exception as e:
         logger.error("Graph authentication exception occurred", exc_info=True)
@@ -0,0 +1,89 @@
+import time
+from typing import Any, Dict, List
+from config.settings import GRAPH_API_ENDPOINT, GRAPH_BATCH_MAX_RETRIES
+from graph.transport import IDEMPOTENT_METHODS, THROTTLE_STATUSES, compute_backoff, get_concurrency_limiter
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Graph JSON batching accepts at most 20 requests per $batch call
+GRAPH_BATCH_LIMIT = 20
+
+# Per-item statuses worth retrying
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _retry_after_seconds(item: Dict[str, Any], attempt: int) -> float:
+    """Delay requested by a throttled batch item, falling back to jittered backoff."""
+    headers = {k.lower(): v for k, v in (item.get("headers") or {}).items()}
+    return compute_backoff(attempt, headers.get("retry-after"))
+
+
+def execute_batch(session, requests_list: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Execute Graph requests through JSON $batch, 20 per call.
+
+    Args:
+        session: Graph API session
+        requests_list: Items like {"id": "1", "method": "GET", "url": "/users/..."}
+                       with URLs relative to GRAPH_API_ENDPOINT
+
+    Returns:
+        dict: Request id -> batch response item ({"id", "status", "headers", "body"}).
+              Items that still failed after retries keep their last response.
+    """
+    batch_url = f"{GRAPH_API_ENDPOINT}/$batch"
+    responses: Dict[str, Dict[str, Any]] = {}
+
+    for start in range(0, len(requests_list), GRAPH_BATCH_LIMIT):
+        pending = requests_list[start:start + GRAPH_BATCH_LIMIT]
+        attempt = 0
+
+        while pending:
+            logger.debug(
+                f"Graph $batch request | items={len(pending)}, attempt={attempt + 1}"
+            )
+            # A batch of reads can be resent as a whole
+            response = session.post(
+                batch_url,
+                json={"requests": pending},
+                idempotent=all(item.get("method", "GET").upper() in IDEMPOTENT_METHODS for item in pending)
+            )
+            response.raise_for_status()
+
+            by_id = {item["id"]: item for item in pending}
+            retry = []
+            delay = 0.0
+            throttled = False
+
+            for item in response.json().get("responses", []):
+                item_id = item.get("id")
+                responses[item_id] = item
+                if item.get("status") in RETRYABLE_STATUSES and item_id in by_id:
+                    retry.append(by_id[item_id])
+                    delay = max(delay, _retry_after_seconds(item, attempt))
+                    throttled = throttled or item.get("status") in THROTTLE_STATUSES
+
+            if not retry:
+                break
+
+            # Throttling inside the batch counts against the shared window too
+            if throttled:
+                get_concurrency_limiter().on_throttle()
+
+            attempt += 1
+            if attempt > GRAPH_BATCH_MAX_RETRIES:
+                logger.warning(
+                    f"Graph $batch giving up on {len(retry)} item(s) after "
+                    f"{GRAPH_BATCH_MAX_RETRIES} retries"
+                )
+                break
+
+            logger.warning(
+                f"Graph $batch retrying {len(retry)} item(s) in {delay:.1f}s "
+                f"(attempt {attempt}/{GRAPH_BATCH_MAX_RETRIES})"
+            )
+            time.sleep(delay)
+            pending = retry
+
+    return responses
@@ -1,21 +1,67 @@
 import requests
 import os
 from typing import Dict, Any, Optional
+from graph.transport import GraphSession
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
 
-def get_session(access_token: str) -> requests.Session:
+class GraphTokenAuth(requests.auth.AuthBase):
+    """
+    Attach the current Graph token to every request.
+
+    The token is read from the provider per request, so a long-lived session
+    picks up refreshed tokens. A 401 invalidates the token and the request
+    is replayed once with a fresh one.
+    """
+
+    def __init__(self, token_provider):
+        self.token_provider = token_provider
+
+    def __call__(self, request):
+        request.headers["Authorization"] = f"Bearer {self.token_provider.get_token()}"
+        request.register_hook("response", self.handle_401)
+        return request
+
+    def handle_401(self, response, **kwargs):
+        if response.status_code != 401 or getattr(response.request, "_graph_token_retried", False):
+            return response
+
+        logger.warning(f"Graph API returned 401, refreshing token | url={response.request.url}")
+        self.token_provider.invalidate()
+
+        # Release the connection before replaying the request
+        response.content
+        response.close()
+
+        retry_request = response.request.copy()
+        retry_request._graph_token_retried = True
+        retry_request.headers["Authorization"] = f"Bearer {self.token_provider.get_token()}"
+
+        retry_response = response.connection.send(retry_request, **kwargs)
+        retry_response.history.append(response)
+        retry_response.request = retry_request
+        return retry_response
+
+
+def get_session(access_token: Optional[str] = None, token_provider=None) -> requests.Session:
     """
     Create a requests session with Graph API authorization headers.
+
+    Pass token_provider (see graph.auth.get_token_provider) to keep the
+    session valid across token refreshes; access_token pins a single token.
+    Requests go through the throttling-aware GraphSession transport.
     """
     logger.debug("Creating Graph API session")
 
-    session = requests.Session()
-    session.headers.update({
-        "Authorization": f"Bearer {access_token}"
-    })
+    session = GraphSession()
+    if token_provider is not None:
+        session.auth = GraphTokenAuth(token_provider)
+    else:
+        session.headers.update({
+            "Authorization": f"Bearer {access_token}"
+        })
     
     # Check if SSL verification should be disabled
     verify_ssl = os.getenv("VERIFY_SSL", "true").lower() in ('true', '1', 'yes')
@@ -44,7 +90,7 @@ def get_data(
     )
 
     try:
-        response = session.get(url, params=params, timeout=30)
+        response = session.get(url, params=params)
         response.raise_for_status()
 
         logger.debug(
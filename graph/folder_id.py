@@ -1,58 +1,154 @@
+import threading
+import time
+from typing import Dict, List, Tuple
+from graph.batch import execute_batch
 from graph.client import get_data
-from config.settings import GRAPH_API_ENDPOINT
+from config.settings import GRAPH_API_ENDPOINT, FOLDER_CACHE_TTL_SECONDS
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+FOLDER_SELECT = "id,displayName,childFolderCount"
+FOLDER_PAGE_SIZE = 100
 
-def get_folder_id(session, user_email: str, folder_name: str) -> str:
+# user_email -> (expires_at, {folder key -> folder_id})
+_folder_cache: Dict[str, Tuple[float, Dict[str, str]]] = {}
+_folder_cache_lock = threading.Lock()
+
+
+def _folder_key(name: str) -> str:
+    # Outlook folder names are case-insensitive among siblings
+    return name.strip().strip("/").casefold()
+
+
+def _collect_pages(session, data: Dict) -> List[Dict]:
+    """Return folders from a response, following @odata.nextLink."""
+    folders = list(data.get("value", []))
+    next_link = data.get("@odata.nextLink")
+    while next_link:
+        data = get_data(session, next_link)
+        folders.extend(data.get("value", []))
+        next_link = data.get("@odata.nextLink")
+    return folders
+
+
+def _walk_folder_tree(session, user_email: str) -> Dict[str, str]:
     """
-    Resolve Microsoft Graph mail folder ID by folder name.
+    Walk the full mail folder tree breadth-first.
+    Child listings of one level are fetched together through $batch.
+
+    Returns:
+        dict: keys are full paths ("inbox/invoices/2026") and bare names
+              (first match in breadth-first order, so top level wins) -> folder_id
     """
+    url = f"{GRAPH_API_ENDPOINT}/users/{user_email}/mailFolders"
+    logger.debug(f"Fetching top-level mail folders | url={url}")
+    data = get_data(session, url, params={"$select": FOLDER_SELECT, "$top": str(FOLDER_PAGE_SIZE)})
 
-    logger.info(
-        "Resolving mail folder ID | "
-        f"user={user_email}, folder='{folder_name}'"
-    )
+    folder_map: Dict[str, str] = {}
+    level = [("", folder) for folder in _collect_pages(session, data)]
+    folder_count = 0
 
-    try:
-        #  Check top-level mail folders
-        url = f"{GRAPH_API_ENDPOINT}/users/{user_email}/mailFolders"
-        logger.debug(f"Fetching top-level mail folders | url={url}")
+    while level:
+        parents = []
+        for parent_path, folder in level:
+            folder_count += 1
+            name = folder.get("displayName") or ""
+            path = f"{parent_path}/{name}" if parent_path else name
+            folder_map.setdefault(_folder_key(path), folder.get("id"))
+            folder_map.setdefault(_folder_key(name), folder.get("id"))
+            if folder.get("childFolderCount"):
+                parents.append((path, folder.get("id")))
 
-        data = get_data(session, url)
-        folders = data.get("value", [])
+        if not parents:
+            break
 
-        logger.debug(f"Top-level folders fetched | count={len(folders)}")
+        batch_requests = [
+            {
+                "id": str(idx),
+                "method": "GET",
+                "url": (
+                    f"/users/{user_email}/mailFolders/{folder_id}/childFolders"
+                    f"?$select={FOLDER_SELECT}&$top={FOLDER_PAGE_SIZE}"
+                )
+            }
+            for idx, (_, folder_id) in enumerate(parents)
+        ]
+        responses = execute_batch(session, batch_requests)
 
-        for folder in folders:
-            if folder.get("displayName") == folder_name:
-                folder_id = folder.get("id")
-                logger.info(
-                    f"Folder found at top level | "
-                    f"folder='{folder_name}', folder_id={folder_id}"
+        level = []
+        for idx, (path, folder_id) in enumerate(parents):
+            item = responses.get(str(idx))
+            if item and item.get("status") == 200:
+                children = _collect_pages(session, item.get("body") or {})
+            else:
+                # Fall back to a direct call for children the batch could not serve
+                child_url = f"{GRAPH_API_ENDPOINT}/users/{user_email}/mailFolders/{folder_id}/childFolders"
+                children = _collect_pages(
+                    session,
+                    get_data(session, child_url, params={"$select": FOLDER_SELECT, "$top": str(FOLDER_PAGE_SIZE)})
                 )
-                return folder_id
+            level.extend((path, child) for child in children)
 
-        # Fallback: check inbox child folders
-        url = f"{GRAPH_API_ENDPOINT}/users/{user_email}/mailFolders/inbox/childFolders"
-        logger.debug(f"Fetching inbox child folders | url={url}")
+    logger.info(f"Mail folder tree loaded | user={user_email}, folders={folder_count}")
+    return folder_map
 
-        data = get_data(session, url)
-        child_folders = data.get("value", [])
 
-        logger.debug(f"Inbox child folders fetched | count={len(child_folders)}")
+def invalidate_folder_cache(user_email: str = None) -> None:
+    """Drop cached folder ids for one mailbox (or all mailboxes)."""
+    with _folder_cache_lock:
+        if user_email is None:
+            _folder_cache.clear()
+        else:
+            _folder_cache.pop(user_email.casefold(), None)
 
-        for folder in child_folders:
-            if folder.get("displayName") == folder_name:
-                folder_id = folder.get("id")
-                logger.info(
-                    f"Folder found in inbox child folders | "
-                    f"folder='{folder_name}', folder_id={folder_id}"
-                )
-                return folder_id
 
-        
+def _cached_folder_map(session, user_email: str, refresh: bool = False) -> Dict[str, str]:
+    cache_key = user_email.casefold()
+    with _folder_cache_lock:
+        cached = _folder_cache.get(cache_key)
+    if cached and not refresh and cached[0] > time.time():
+        return cached[1]
+
+    folder_map = _walk_folder_tree(session, user_email)
+    with _folder_cache_lock:
+        _folder_cache[cache_key] = (time.time() + FOLDER_CACHE_TTL_SECONDS, folder_map)
+    return folder_map
+
+
+def get_folder_id(session, user_email: str, folder_name: str) -> str:
+    """
+    Resolve Microsoft Graph mail folder ID by folder name or path.
+
+    Accepts a display name ("Invoices") or a path ("Inbox/Invoices/2026").
+    The folder tree is cached per mailbox for FOLDER_CACHE_TTL_SECONDS;
+    a miss reloads the tree once before failing.
+    """
+
+    logger.info(
+        "Resolving mail folder ID | "
+        f"user={user_email}, folder='{folder_name}'"
+    )
+
+    try:
+        key = _folder_key(folder_name)
+
+        folder_id = _cached_folder_map(session, user_email).get(key)
+        if folder_id:
+            logger.info(
+                f"Folder resolved | folder='{folder_name}', folder_id={folder_id}"
+            )
+            return folder_id
+
+        # Miss - the tree may have changed since it was cached
+        logger.debug(f"Folder cache miss, reloading folder tree | folder='{folder_name}'")
+        folder_id = _cached_folder_map(session, user_email, refresh=True).get(key)
+        if folder_id:
+            logger.info(
+                f"Folder resolved after refresh | folder='{folder_name}', folder_id={folder_id}"
+            )
+            return folder_id
+
         logger.error(
             f"Mail folder not found | user={user_email}, folder='{folder_name}'"
         )
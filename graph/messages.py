@@ -0,0 +1,172 @@
+from typing import Any, Dict, List
+from config.settings import (
+    GRAPH_API_ENDPOINT,
+    GRAPH_EXPAND_ATTACHMENTS,
+    GRAPH_MESSAGE_SELECT,
+    GRAPH_MESSAGE_PAGE_SIZE,
+)
+from graph.batch import execute_batch
+from graph.client import get_data
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Graph's maximum $top for message listing
+GRAPH_MAX_PAGE_SIZE = 1000
+
+# Fields the pipeline reads from a listed message (bodies are fetched lazily)
+DEFAULT_MESSAGE_SELECT_FIELDS = [
+    "id",
+    "subject",
+    "sender",
+    "toRecipients",
+    "ccRecipients",
+    "receivedDateTime",
+    "conversationId",
+    "hasAttachments",
+    "internetMessageId",
+]
+
+# Attachment metadata expanded into listed messages - never contentBytes
+ATTACHMENT_EXPAND = "attachments($select=id,name,size,contentType,isInline)"
+
+
+def get_message_select_fields() -> List[str]:
+    """Projection for message listing, overridable with GRAPH_MESSAGE_SELECT."""
+    if GRAPH_MESSAGE_SELECT:
+        return [f.strip() for f in GRAPH_MESSAGE_SELECT.split(",") if f.strip()]
+    return DEFAULT_MESSAGE_SELECT_FIELDS
+
+
+def get_message_page_size() -> int:
+    """Listing page size, clamped to Graph's allowed range."""
+    return max(1, min(GRAPH_MESSAGE_PAGE_SIZE, GRAPH_MAX_PAGE_SIZE))
+
+
+def _add_attachment_expand(params: Dict[str, str]) -> Dict[str, str]:
+    if GRAPH_EXPAND_ATTACHMENTS:
+        params["$expand"] = ATTACHMENT_EXPAND
+    return params
+
+
+def build_message_list_params(filter_param: str) -> Dict[str, str]:
+    """
+    Build query parameters for listing messages in a folder.
+    Only the projected fields are requested, at the configured page size,
+    with attachment metadata expanded into each message.
+    """
+    params = _add_attachment_expand({
+        "$filter": filter_param,
+        # Oldest first, so pages can be checkpointed as a contiguous watermark
+        "$orderby": "receivedDateTime asc",
+        "$select": ",".join(get_message_select_fields()),
+        "$top": str(get_message_page_size()),
+    })
+    logger.debug(f"Message list params: {params}")
+    return params
+
+
+def build_delta_params(filter_param: str) -> Dict[str, str]:
+    """
+    Query parameters for the first round of messages/delta.
+    Delta only accepts a receivedDateTime filter and ignores $top. It does
+    not support $expand either, so attachment metadata of delta pages is
+    resolved by fetch_attachments_batch.
+    """
+    params = {
+        "$filter": filter_param,
+        "$select": ",".join(get_message_select_fields()),
+    }
+    logger.debug(f"Message delta params: {params}")
+    return params
+
+
+def build_delta_headers() -> Dict[str, str]:
+    """Delta pages are sized with the odata.maxpagesize preference."""
+    return {"Prefer": f"odata.maxpagesize={get_message_page_size()}"}
+
+
+def fetch_messages_by_id(session, user_email: str,
+                         email_ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    Fetch projected messages by id through Graph $batch (used by push mode).
+    parentFolderId is added so attachments can be resolved per folder.
+    Messages that could not be fetched (e.g. already deleted) are skipped.
+    """
+    if not email_ids:
+        return []
+
+    query = f"$select={','.join(get_message_select_fields() + ['parentFolderId'])}"
+    if GRAPH_EXPAND_ATTACHMENTS:
+        query += f"&$expand={ATTACHMENT_EXPAND}"
+    batch_requests = [
+        {
+            "id": str(idx),
+            "method": "GET",
+            "url": f"/users/{user_email}/messages/{email_id}?{query}"
+        }
+        for idx, email_id in enumerate(email_ids)
+    ]
+
+    responses = execute_batch(session, batch_requests)
+
+    messages = []
+    for idx, email_id in enumerate(email_ids):
+        item = responses.get(str(idx))
+        if item and item.get("status") == 200:
+            messages.append(item.get("body") or {})
+        else:
+            logger.warning(
+                f"⚠ Notified message not fetched | email_id={email_id[:30]}..., "
+                f"status={item.get('status') if item else None}"
+            )
+    return messages
+
+
+def fetch_message_bodies(session, user_email: str,
+                         email_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch the body of each message through Graph $batch.
+    Called only for messages that passed the duplicate check.
+
+    Returns:
+        dict: email_id -> Graph body object ({"contentType", "content"})
+    """
+    if not email_ids:
+        return {}
+
+    logger.info(f"Fetching message bodies via $batch | emails={len(email_ids)}")
+
+    batch_requests = [
+        {
+            "id": str(idx),
+            "method": "GET",
+            "url": f"/users/{user_email}/messages/{email_id}?$select=body"
+        }
+        for idx, email_id in enumerate(email_ids)
+    ]
+
+    bodies: Dict[str, Dict[str, Any]] = {}
+    try:
+        responses = execute_batch(session, batch_requests)
+    except Exception as e:
+        logger.error(f"✗ Message body $batch failed | Error: {str(e)}", exc_info=True)
+        responses = {}
+
+    for idx, email_id in enumerate(email_ids):
+        item = responses.get(str(idx))
+        if item and item.get("status") == 200:
+            bodies[email_id] = (item.get("body") or {}).get("body") or {}
+            continue
+
+        # Fall back to a direct GET for items the batch could not serve
+        try:
+            url = f"{GRAPH_API_ENDPOINT}/users/{user_email}/messages/{email_id}"
+            bodies[email_id] = get_data(session, url, params={"$select": "body"}).get("body") or {}
+        except Exception as e:
+            logger.error(
+                f"✗ Failed to fetch message body | email_id={email_id[:30]}... | "
+                f"Error: {str(e)}"
+            )
+
+    return bodies
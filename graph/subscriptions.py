@@ -0,0 +1,215 @@
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from config.settings import (
+    GRAPH_API_ENDPOINT,
+    GRAPH_NOTIFICATION_URL,
+    GRAPH_NOTIFICATION_CLIENT_STATE,
+    GRAPH_SUBSCRIPTION_LIFETIME_MINUTES,
+    GRAPH_SUBSCRIPTION_RENEW_BEFORE_MINUTES,
+)
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# subscription_id -> {"id", "user_email", "folder_name", "folder_id", "expires_at"}
+_subscriptions: Dict[str, Dict[str, Any]] = {}
+_subscriptions_lock = threading.Lock()
+
+
+def _expiration() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(minutes=GRAPH_SUBSCRIPTION_LIFETIME_MINUTES)
+
+
+def _format_time(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+
+
+def _parse_time(value: str) -> datetime:
+    # Graph returns up to 7 fractional digits - seconds are precise enough
+    return datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+
+
+def _resource(user_email: str, folder_id: str) -> str:
+    return f"users/{user_email}/mailFolders('{folder_id}')/messages"
+
+
+def get_subscription(subscription_id: str) -> Optional[Dict[str, Any]]:
+    """Return the tracked subscription for an id, if this process created it."""
+    with _subscriptions_lock:
+        return _subscriptions.get(subscription_id)
+
+
+def create_subscription(session, user_email: str, folder_name: str, folder_id: str) -> Dict[str, Any]:
+    """Subscribe to new messages in a mail folder."""
+    expires_at = _expiration()
+    payload = {
+        "changeType": "created",
+        "notificationUrl": GRAPH_NOTIFICATION_URL,
+        "lifecycleNotificationUrl": GRAPH_NOTIFICATION_URL,
+        "resource": _resource(user_email, folder_id),
+        "expirationDateTime": _format_time(expires_at),
+        "clientState": GRAPH_NOTIFICATION_CLIENT_STATE,
+    }
+    logger.info(
+        f"Creating Graph subscription | user={user_email}, folder='{folder_name}', "
+        f"expires={payload['expirationDateTime']}"
+    )
+
+    response = session.post(f"{GRAPH_API_ENDPOINT}/subscriptions", json=payload)
+    response.raise_for_status()
+    data = response.json()
+
+    subscription = {
+        "id": data["id"],
+        "user_email": user_email,
+        "folder_name": folder_name,
+        "folder_id": folder_id,
+        "expires_at": expires_at,
+    }
+    with _subscriptions_lock:
+        _subscriptions[data["id"]] = subscription
+
+    logger.info(f"✓ Graph subscription created | subscription_id={data['id']}")
+    return subscription
+
+
+def renew_subscription(session, subscription: Dict[str, Any]) -> Dict[str, Any]:
+    """Extend a subscription's expirationDateTime."""
+    expires_at = _expiration()
+    response = session.patch(
+        f"{GRAPH_API_ENDPOINT}/subscriptions/{subscription['id']}",
+        json={"expirationDateTime": _format_time(expires_at)},
+        # Sets an absolute expiry, so resending it is harmless
+        idempotent=True
+    )
+    response.raise_for_status()
+
+    with _subscriptions_lock:
+        subscription["expires_at"] = expires_at
+    logger.info(
+        f"✓ Graph subscription renewed | subscription_id={subscription['id']}, "
+        f"expires={_format_time(expires_at)}"
+    )
+    return subscription
+
+
+def forget_subscription(subscription_id: str) -> None:
+    with _subscriptions_lock:
+        _subscriptions.pop(subscription_id, None)
+
+
+def ensure_subscription(session, user_email: str, folder_name: str, folder_id: str) -> Dict[str, Any]:
+    """
+    Make sure a live subscription exists for the mailbox folder.
+    Renews it when it expires within GRAPH_SUBSCRIPTION_RENEW_BEFORE_MINUTES
+    and recreates it when Graph no longer knows it.
+    """
+    with _subscriptions_lock:
+        existing = next(
+            (s for s in _subscriptions.values()
+             if s["user_email"] == user_email and s["folder_name"] == folder_name),
+            None
+        )
+
+    if existing is None:
+        return create_subscription(session, user_email, folder_name, folder_id)
+
+    renew_at = existing["expires_at"] - timedelta(minutes=GRAPH_SUBSCRIPTION_RENEW_BEFORE_MINUTES)
+    if datetime.now(timezone.utc) < renew_at:
+        return existing
+
+    try:
+        return renew_subscription(session, existing)
+    except Exception as e:
+        logger.warning(
+            f"Subscription renewal failed, recreating | subscription_id={existing['id']} | "
+            f"Error: {str(e)}"
+        )
+        forget_subscription(existing["id"])
+        return create_subscription(session, user_email, folder_name, folder_id)
+
+
+def list_remote_subscriptions(session) -> List[Dict[str, Any]]:
+    """Graph subscriptions of this app that notify our GRAPH_NOTIFICATION_URL."""
+    subscriptions = []
+    url = f"{GRAPH_API_ENDPOINT}/subscriptions"
+    while url:
+        response = session.get(url)
+        response.raise_for_status()
+        data = response.json()
+        subscriptions.extend(
+            s for s in data.get("value", [])
+            if s.get("notificationUrl") == GRAPH_NOTIFICATION_URL
+        )
+        url = data.get("@odata.nextLink")
+    return subscriptions
+
+
+def delete_subscription(session, subscription_id: str) -> None:
+    """Delete a subscription; one Graph no longer knows counts as deleted."""
+    response = session.delete(f"{GRAPH_API_ENDPOINT}/subscriptions/{subscription_id}")
+    if response.status_code != 404:
+        response.raise_for_status()
+    forget_subscription(subscription_id)
+    logger.info(f"✓ Graph subscription deleted | subscription_id={subscription_id}")
+
+
+def sync_subscriptions(session, folders: List[Tuple[str, str, str]]) -> None:
+    """
+    Reconcile Graph subscriptions with the watched (user_email, folder_name,
+    folder_id) folders, then make sure each folder has a live subscription.
+
+    Subscriptions outlive the process, so a restart or another replica
+    adopts the existing one instead of creating another. Per folder the
+    subscription expiring last is kept (ties by id, so every replica keeps
+    the same one); duplicates and subscriptions for folders no longer
+    watched are deleted.
+    """
+    wanted = {_resource(user, folder_id).lower(): (user, folder_name, folder_id)
+              for user, folder_name, folder_id in folders}
+
+    by_resource: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for remote in list_remote_subscriptions(session):
+        by_resource[(remote.get("resource") or "").lower()].append(remote)
+
+    adopted = set()
+    for resource, remotes in by_resource.items():
+        remotes.sort(key=lambda r: (r.get("expirationDateTime") or "", r["id"]), reverse=True)
+        keep = remotes[0] if resource in wanted else None
+        for stale in remotes[1 if keep else 0:]:
+            try:
+                delete_subscription(session, stale["id"])
+            except Exception as e:
+                logger.warning(
+                    f"Failed to delete stale subscription | subscription_id={stale['id']} | Error: {str(e)}"
+                )
+        if keep:
+            user_email, folder_name, folder_id = wanted[resource]
+            adopted.add(keep["id"])
+            with _subscriptions_lock:
+                _subscriptions[keep["id"]] = {
+                    "id": keep["id"],
+                    "user_email": user_email,
+                    "folder_name": folder_name,
+                    "folder_id": folder_id,
+                    "expires_at": _parse_time(keep["expirationDateTime"]),
+                }
+
+    # Locally tracked subscriptions Graph no longer has (expired, removed)
+    with _subscriptions_lock:
+        for subscription_id in [i for i in _subscriptions if i not in adopted]:
+            del _subscriptions[subscription_id]
+
+    if adopted:
+        logger.info(f"Adopted {len(adopted)} existing Graph subscription(s)")
+
+    for user_email, folder_name, folder_id in folders:
+        try:
+            ensure_subscription(session, user_email, folder_name, folder_id)
+        except Exception as e:
+            logger.error(
+                f"Subscription maintenance failed for {user_email}/{folder_name}: {str(e)}",
+                exc_info=True
+            )
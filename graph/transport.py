@@ -0,0 +1,194 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from config.settings import (
+    GRAPH_MAX_RETRIES,
+    GRAPH_BACKOFF_BASE_SECONDS,
+    GRAPH_BACKOFF_MAX_SECONDS,
+    GRAPH_RETRY_AFTER_MAX_SECONDS,
+    GRAPH_CONNECT_TIMEOUT_SECONDS,
+    GRAPH_READ_TIMEOUT_SECONDS,
+    GRAPH_CONCURRENCY_INITIAL,
+    GRAPH_CONCURRENCY_MIN,
+    GRAPH_CONCURRENCY_MAX,
+)
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Statuses that signal throttling and shrink the concurrency window
+THROTTLE_STATUSES = {429, 503}
+
+# Statuses retried by the transport
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Methods resent after a 5xx or a timeout - the failed attempt may already
+# have been applied, so other methods (e.g. creating a subscription) are only
+# retried when Graph rejected them: 429, or 503 with Retry-After
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def compute_backoff(attempt: int, retry_after=None) -> float:
+    """
+    Honor Retry-After in full when given (cutting it short only draws more
+    throttling), otherwise full-jitter exponential backoff.
+    """
+    delay = parse_retry_after(retry_after)
+    if delay is not None:
+        return min(delay, GRAPH_RETRY_AFTER_MAX_SECONDS)
+    ceiling = min(GRAPH_BACKOFF_MAX_SECONDS, GRAPH_BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on in-flight Graph requests.
+
+    Each successful response grows the window by 1/limit (about +1 per
+    round of requests); a throttling response halves it, at most once per
+    second so one burst of 429s does not collapse the window to the minimum.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        with self._condition:
+            if self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                self._condition.notify_all()
+
+    def on_throttle(self) -> None:
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_decrease < 1.0:
+                return
+            self._last_decrease = now
+            previous = self.limit
+            self.limit = max(float(self.minimum), self.limit / 2)
+            logger.warning(
+                f"Graph throttling detected - concurrency limit {previous:.1f} -> {self.limit:.1f}"
+            )
+
+
+# One window for the whole process: Graph throttles per app and mailbox
+_limiter = AdaptiveConcurrencyLimiter(
+    GRAPH_CONCURRENCY_INITIAL,
+    GRAPH_CONCURRENCY_MIN,
+    GRAPH_CONCURRENCY_MAX
+)
+
+
+def get_concurrency_limiter() -> AdaptiveConcurrencyLimiter:
+    return _limiter
+
+
+class GraphSession(requests.Session):
+    """
+    requests.Session used for every Graph call.
+
+    Adds a default (connect, read) timeout, retries 429/5xx and connection
+    errors with Retry-After or jittered exponential backoff, and gates
+    requests through the shared AIMD concurrency limiter. Non-idempotent
+    methods are not resent after a 5xx or a read timeout unless the caller
+    passes idempotent=True.
+    """
+
+    def __init__(self, limiter: AdaptiveConcurrencyLimiter = None):
+        super().__init__()
+        self.limiter = limiter or _limiter
+        self.max_retries = GRAPH_MAX_RETRIES
+
+        # Keep enough pooled connections for the largest concurrency window
+        adapter = HTTPAdapter(pool_maxsize=max(10, GRAPH_CONCURRENCY_MAX))
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, *args, idempotent: Optional[bool] = None, **kwargs):
+        kwargs.setdefault("timeout", (GRAPH_CONNECT_TIMEOUT_SECONDS, GRAPH_READ_TIMEOUT_SECONDS))
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # A connect timeout means nothing was sent
+                unsent = isinstance(e, requests.exceptions.ConnectTimeout)
+                if attempt >= self.max_retries or not (idempotent or unsent):
+                    raise
+                response = None
+                error = e
+            finally:
+                self.limiter.release()
+
+            if response is None:
+                delay = compute_backoff(attempt)
+                logger.warning(
+                    f"Graph request error, retrying in {delay:.1f}s "
+                    f"(attempt {attempt + 1}/{self.max_retries}) | "
+                    f"method={method}, url={url} | Error: {str(error)}"
+                )
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if response.status_code in THROTTLE_STATUSES:
+                self.limiter.on_throttle()
+            elif response.status_code < 400:
+                self.limiter.on_success()
+
+            if response.status_code not in RETRYABLE_STATUSES or attempt >= self.max_retries:
+                return response
+            if not idempotent and not (
+                response.status_code == 429
+                or (response.status_code == 503 and "Retry-After" in response.headers)
+            ):
+                return response
+
+            delay = compute_backoff(attempt, response.headers.get("Retry-After"))
+            logger.warning(
+                f"Graph API returned {response.status_code}, retrying in {delay:.1f}s "
+                f"(attempt {attempt + 1}/{self.max_retries}) | method={method}, url={url}"
+            )
+            response.close()
+            time.sleep(delay)
+            attempt += 1
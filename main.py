@@ -4,16 +4,36 @@ Email Scanner Service - FastAPI Web Service
 Fetches emails based on database config and pushes to SQS
 """
 
+import asyncio
 import sys
-import threading
-import time
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 import uvicorn
 from bootstrap.startup import check_config
-from bootstrap.configuration_store import CONFIG
+from bootstrap.configuration_store import (
+    get_mailboxes, get_scan_interval_minutes, start_config_listener, stop_config_listener
+)
 from service.fetch_email import fetch_new_emails_from_graph
+from service.async_fetch_email import fetch_new_emails_async
+from service.push_ingest import enqueue_notifications, notification_worker
 from aws.check_sqs import ensure_sqs_queue_exists
-from config.settings import CLIENT_ID, CLIENT_SECRET, TENANT_ID, SCHEDULER_INTERVAL_MINUTES
+from aws.push_s3 import abort_stale_multipart_uploads
+from aws.push_sqs import close_sqs_publishers
+from db.connections import close_db_pools, get_pool_metrics
+from db.partitions import ensure_invoice_email_partitions, migrate_invoice_emails_to_partitions
+from db.scan_history import prune_scan_history
+from db.seen_messages import warm_seen_filter
+from graph.auth import get_token_provider
+from graph.client import get_session
+from graph.folder_id import get_folder_id
+from graph.subscriptions import forget_subscription, sync_subscriptions
+from config.settings import (
+    CLIENT_ID, CLIENT_SECRET, TENANT_ID, SCAN_FOLDER_NAME, SCAN_ENGINE,
+    PUSH_MODE_ENABLED, PUSH_SAFETY_POLL_INTERVAL_MINUTES, GRAPH_NOTIFICATION_URL,
+    GRAPH_NOTIFICATION_CLIENT_STATE, GRAPH_SUBSCRIPTION_CHECK_MINUTES, SCAN_HISTORY_RETENTION_DAYS,
+    INVOICE_EMAILS_PARTITIONING, PARTITION_MONTHS_AHEAD, SHUTDOWN_GRACE_SECONDS
+)
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -23,42 +43,144 @@ app = FastAPI(title="Email Scanner Service", version="1.0.0")
 
 # Scheduler state
 scheduler_running = False
-scheduler_thread = None
+scheduler_task = None
+scheduler_wakeup = None
 sqs_queue_url = None
 
+# Fire-and-forget tasks, e.g. scans started via /scan (kept referenced until done)
+background_scans = set()
 
-def scan_emails():
-    """Core email scanning logic - kept from original implementation."""
-    try:
-        logger.info("Starting email scan...")
-        fetch_new_emails_from_graph(
-            folder_name="Inbox",
-            user_email="sprintaptest1@mindsprint.com",
-            client_id=CLIENT_ID,
-            client_secret=CLIENT_SECRET,
-            tenant_id=TENANT_ID,
-            sqs_queue_url=sqs_queue_url
-        )
-        logger.info("Email scan completed successfully")
-        return {"status": "success", "message": "Email scan completed"}
-    except Exception as e:
-        logger.error(f"Scan failed: {e}")
-        return {"status": "error", "message": str(e)}
+# Push mode background tasks
+push_tasks = []
 
+# Long-running maintenance loops (cancelled on shutdown)
+maintenance_tasks = []
 
-def scheduler_job():
-    """Background scheduler that runs email scans periodically."""
-    global scheduler_running
-    logger.info(f"Scheduler started - running every {SCHEDULER_INTERVAL_MINUTES} minutes")
+# invoice_emails partitions are checked this often
+PARTITION_CHECK_INTERVAL_SECONDS = 24 * 60 * 60
+
+
+def poll_interval_minutes() -> int:
+    """Polling interval; push mode keeps polling only as a low-frequency safety net."""
+    return PUSH_SAFETY_POLL_INTERVAL_MINUTES if PUSH_MODE_ENABLED else get_scan_interval_minutes()
+
+
+def spawn_background(coro):
+    """Run a coroutine fire-and-forget, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    background_scans.add(task)
+    task.add_done_callback(background_scans.discard)
+
+
+def start_background_scan():
+    spawn_background(scan_emails())
+
+
+async def scan_mailbox(user_email: str):
+    """Scan one configured mailbox."""
+    scan_kwargs = dict(
+        folder_name=SCAN_FOLDER_NAME,
+        user_email=user_email,
+        client_id=CLIENT_ID,
+        client_secret=CLIENT_SECRET,
+        tenant_id=TENANT_ID,
+        sqs_queue_url=sqs_queue_url
+    )
+    if SCAN_ENGINE == "sync":
+        await asyncio.to_thread(fetch_new_emails_from_graph, **scan_kwargs)
+    else:
+        await fetch_new_emails_async(**scan_kwargs)
+
+
+async def scan_emails():
+    """Core email scanning logic - runs on the FastAPI event loop."""
+    # Read from the cached tenant config - no tenant DB round trip per scan
+    mailboxes = get_mailboxes()
+    if not mailboxes:
+        logger.error("Scan skipped - no mailboxes configured")
+        return {"status": "error", "message": "No mailboxes configured"}
+
+    failed = []
+    logger.info(f"Starting email scan (engine={SCAN_ENGINE}, mailboxes={len(mailboxes)})...")
+    for user_email in mailboxes:
+        try:
+            await scan_mailbox(user_email)
+        except Exception as e:
+            logger.error(f"Scan failed for {user_email}: {e}")
+            failed.append(user_email)
+
+    if failed:
+        return {"status": "error", "message": f"Scan failed for: {', '.join(failed)}"}
+    logger.info("Email scan completed successfully")
+    return {"status": "success", "message": "Email scan completed"}
+
+
+async def scheduler_job():
+    """Background scheduler task that runs email scans periodically."""
+    logger.info(f"Scheduler started - running every {poll_interval_minutes()} minutes")
     
     while scheduler_running:
-        scan_emails()
+        await scan_emails()
+        await asyncio.to_thread(prune_scan_history, SCAN_HISTORY_RETENTION_DAYS)
         if scheduler_running:  # Check again before sleeping
-            time.sleep(SCHEDULER_INTERVAL_MINUTES * 60)
+            try:
+                # Woken early by /scheduler/stop
+                await asyncio.wait_for(scheduler_wakeup.wait(), timeout=poll_interval_minutes() * 60)
+            except asyncio.TimeoutError:
+                pass
+            scheduler_wakeup.clear()
     
     logger.info("Scheduler stopped")
 
 
+def _ensure_push_subscription():
+    token_provider = get_token_provider(CLIENT_ID, CLIENT_SECRET, TENANT_ID)
+    session = get_session(token_provider=token_provider)
+    folders = []
+    for user_email in get_mailboxes():
+        try:
+            folders.append((user_email, SCAN_FOLDER_NAME, get_folder_id(session, user_email, SCAN_FOLDER_NAME)))
+        except Exception as e:
+            logger.error(f"Folder lookup failed for {user_email}: {e}", exc_info=True)
+    # Reuses subscriptions left by earlier runs or other replicas, deletes extras
+    sync_subscriptions(session, folders)
+
+
+async def subscription_job():
+    """Create the Graph subscription and keep renewing it."""
+    while True:
+        try:
+            await asyncio.to_thread(_ensure_push_subscription)
+        except Exception as e:
+            logger.error(f"Subscription maintenance failed: {e}", exc_info=True)
+        await asyncio.sleep(GRAPH_SUBSCRIPTION_CHECK_MINUTES * 60)
+
+
+async def partition_job():
+    """Convert invoice_emails to monthly partitions once, then keep future months created."""
+    if not await asyncio.to_thread(migrate_invoice_emails_to_partitions):
+        logger.error("invoice_emails stays unpartitioned - partition maintenance disabled")
+        return
+    while True:
+        try:
+            await asyncio.to_thread(ensure_invoice_email_partitions, PARTITION_MONTHS_AHEAD)
+        except Exception as e:
+            logger.error(f"Partition maintenance failed: {e}", exc_info=True)
+        await asyncio.sleep(PARTITION_CHECK_INTERVAL_SECONDS)
+
+
+def start_push_mode():
+    """Start the notification worker and subscription manager."""
+    if not GRAPH_NOTIFICATION_URL or not GRAPH_NOTIFICATION_CLIENT_STATE:
+        logger.error("Push mode needs GRAPH_NOTIFICATION_URL and GRAPH_NOTIFICATION_CLIENT_STATE - staying in polling mode")
+        return
+    push_tasks.append(asyncio.create_task(
+        notification_worker(CLIENT_ID, CLIENT_SECRET, TENANT_ID, sqs_queue_url)
+    ))
+    push_tasks.append(asyncio.create_task(subscription_job()))
+    logger.info(f"Push mode enabled - safety-net polling every {PUSH_SAFETY_POLL_INTERVAL_MINUTES} minutes")
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize service on startup."""
@@ -71,9 +193,62 @@ async def startup_event():
         sys.exit(1)
     
     sqs_queue_url = ensure_sqs_queue_exists()
+
+    # Tenant config changes (NOTIFY or TTL) apply without a restart
+    start_config_listener()
+
+    # Scans fall back to DB duplicate checks until the filter is warm
+    spawn_background(asyncio.to_thread(warm_seen_filter))
+
+    # Parts of uploads interrupted by a crash are billed until aborted
+    spawn_background(asyncio.to_thread(abort_stale_multipart_uploads))
+
+    if INVOICE_EMAILS_PARTITIONING:
+        maintenance_tasks.append(asyncio.create_task(partition_job()))
+
+    if PUSH_MODE_ENABLED:
+        start_push_mode()
+
     logger.info("Service initialized and ready")
 
 
+async def _stop_background_tasks():
+    """Let running scans finish (up to SHUTDOWN_GRACE_SECONDS), cancel everything else."""
+    global scheduler_running
+
+    scheduler_running = False
+    if scheduler_wakeup is not None:
+        scheduler_wakeup.set()
+
+    loops = [t for t in push_tasks + maintenance_tasks if not t.done()]
+    for task in loops:
+        task.cancel()
+
+    scans = [t for t in [scheduler_task, *background_scans] if t is not None and not t.done()]
+    if scans:
+        logger.info(f"Waiting up to {SHUTDOWN_GRACE_SECONDS:.0f}s for {len(scans)} running scan task(s)")
+        _, pending = await asyncio.wait(scans, timeout=SHUTDOWN_GRACE_SECONDS)
+        if pending:
+            logger.warning(f"⚠ Cancelling {len(pending)} scan task(s) still running at shutdown")
+            for task in pending:
+                task.cancel()
+
+    await asyncio.gather(*loops, *scans, return_exceptions=True)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background work, then release pooled resources."""
+    stop_config_listener()
+    # Scans publish to SQS and use the DB pools, so they stop first
+    await _stop_background_tasks()
+    # Buffered work_ids are sent before the DB pools go away; joining the
+    # publisher threads blocks, so it runs off the event loop
+    await asyncio.to_thread(close_sqs_publishers)
+    close_db_pools()
+    logger.info("Email Scanner Service stopped")
+
+
 @app.get("/")
 async def health_check():
     """Health check endpoint."""
@@ -81,7 +256,9 @@ async def health_check():
         "service": "Email Scanner Service",
         "status": "running",
         "scheduler_status": "running" if scheduler_running else "stopped",
-        "scheduler_interval_minutes": SCHEDULER_INTERVAL_MINUTES
+        "scheduler_interval_minutes": poll_interval_minutes(),
+        "push_mode": PUSH_MODE_ENABLED,
+        "db_pools": get_pool_metrics()
     }
 
 
@@ -90,9 +267,8 @@ async def trigger_immediate_scan():
     """Trigger an immediate one-time email scan (fire-and-forget)."""
     logger.info("Immediate scan triggered via API")
     
-    # Run scan in background thread (fire-and-forget)
-    scan_thread = threading.Thread(target=scan_emails, daemon=True)
-    scan_thread.start()
+    # Run scan as a background task on the event loop (fire-and-forget)
+    start_background_scan()
     
     return {
         "status": "success",
@@ -100,22 +276,55 @@ async def trigger_immediate_scan():
     }
 
 
+@app.post("/notifications")
+async def graph_notifications(request: Request, validationToken: Optional[str] = None):
+    """
+    Graph change notification webhook.
+    Answers subscription validation and queues notified messages for processing.
+    """
+    # Subscription validation handshake - echo the token as plain text
+    if validationToken is not None:
+        logger.info("Graph subscription validation request received")
+        return PlainTextResponse(validationToken)
+
+    payload = await request.json()
+    queued, lifecycle_events = enqueue_notifications(payload)
+
+    for event in lifecycle_events:
+        lifecycle_event = event.get("lifecycleEvent")
+        logger.warning(
+            f"Graph lifecycle notification | event={lifecycle_event}, "
+            f"subscription_id={event.get('subscriptionId')}"
+        )
+        if lifecycle_event == "missed":
+            # Notifications were dropped - let a poll catch up
+            start_background_scan()
+        elif lifecycle_event in ("subscriptionRemoved", "reauthorizationRequired"):
+            forget_subscription(event.get("subscriptionId"))
+            spawn_background(asyncio.to_thread(_ensure_push_subscription))
+
+    # Graph expects a 2xx within a few seconds; processing happens in the worker
+    return Response(status_code=202)
+
+
 @app.post("/scheduler/start")
 async def start_scheduler():
     """Start the email scanning scheduler."""
-    global scheduler_running, scheduler_thread
+    global scheduler_running, scheduler_task, scheduler_wakeup
     
     if scheduler_running:
         return {"status": "already_running", "message": "Scheduler is already running"}
     
     scheduler_running = True
-    scheduler_thread = threading.Thread(target=scheduler_job, daemon=True)
-    scheduler_thread.start()
+    # A stopped task may still be finishing its last scan - let it carry on
+    if scheduler_task is None or scheduler_task.done():
+        scheduler_wakeup = asyncio.Event()
+        scheduler_task = asyncio.create_task(scheduler_job())
     
-    logger.info(f"Scheduler started - interval: {SCHEDULER_INTERVAL_MINUTES} minutes")
+    logger.info(f"Scheduler started - interval: {poll_interval_minutes()} minutes")
     return {
         "status": "success",
-        "message": f"Scheduler started with {SCHEDULER_INTERVAL_MINUTES} minute interval"
+        "message": f"Scheduler started with {poll_interval_minutes()} minute interval"
     }
 
 
@@ -128,6 +337,7 @@ async def stop_scheduler():
         return {"status": "not_running", "message": "Scheduler is not running"}
     
     scheduler_running = False
+    scheduler_wakeup.set()
     logger.info("Scheduler stop requested")
     
     return {"status": "success", "message": "Scheduler stopped"}
@@ -138,7 +348,7 @@ async def get_scheduler_status():
     """Get the current scheduler status."""
     return {
         "running": scheduler_running,
-        "interval_minutes": SCHEDULER_INTERVAL_MINUTES,
+        "interval_minutes": poll_interval_minutes(),
         "status": "running" if scheduler_running else "stopped"
     }
 
@@ -0,0 +1,154 @@
+import asyncio
+import functools
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+from config.settings import SCAN_MAX_CONCURRENCY
+from graph.auth import get_token_provider
+from graph.client import get_session
+from graph.folder_id import get_folder_id
+from service.scan_steps import (
+    checkpoint_page,
+    finish_new_email,
+    iter_message_pages,
+    log_scan_summary,
+    new_scan_state,
+    prepare_new_email,
+    publish_stored_emails,
+    record_email_result,
+    save_scan_state,
+    select_new_messages,
+    store_new_emails,
+)
+from utils.logger import get_logger
+from utils.scan_name import build_scan_name
+
+logger = get_logger(__name__)
+
+
+async def _run_blocking(executor: ThreadPoolExecutor, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+
+async def fetch_new_emails_async(
+    folder_name: str = "Inbox",
+    user_email: str = None,
+    client_id: str = "",
+    client_secret: str = "",
+    tenant_id: str = "",
+    sqs_queue_url: str = None,
+    max_concurrency: int = SCAN_MAX_CONCURRENCY
+) -> List[Dict[str, Any]]:
+    """
+    Asyncio scan engine - same steps, counters and scanner state as
+    fetch_new_emails_from_graph, but up to max_concurrency new messages
+    of a page are processed at the same time. Each scan runs its blocking
+    Graph/DB/S3/SQS steps on its own pool, sized so max_concurrency
+    messages can be in flight next to the page-level steps - concurrent
+    mailbox scans do not starve each other.
+
+    Args:
+        folder_name: Mail folder to scan
+        user_email: Email account to scan
+        client_id: Azure AD client ID
+        client_secret: Azure AD client secret
+        tenant_id: Azure AD tenant ID
+        sqs_queue_url: SQS Queue URL for pushing work_ids
+        max_concurrency: Messages processed concurrently
+    """
+
+    if not user_email:
+        logger.error("user_email required")
+        return []
+
+    if not sqs_queue_url:
+        logger.error("sqs_queue_url required")
+        return []
+
+    scanner_id = str(uuid.uuid4())
+    entity_id = str(uuid.uuid4())
+    scan_name = build_scan_name(user_email, folder_name)
+
+    logger.info(
+        f"Starting async email scan | user={user_email}, folder={folder_name}, "
+        f"scanner_id={scanner_id}, scan_name={scan_name}, concurrency={max_concurrency}"
+    )
+
+    results: List[Dict[str, Any]] = []
+    scan_start_time = time.perf_counter()
+    state = new_scan_state()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, max_concurrency) + 2,
+        thread_name_prefix="scan-worker"
+    )
+    run_blocking = functools.partial(_run_blocking, executor)
+
+    async def prepare(message, body, attachments):
+        async with semaphore:
+            return await run_blocking(
+                prepare_new_email,
+                session, user_email, folder_id, message, body, attachments
+            )
+
+    async def finish(prepared):
+        async with semaphore:
+            return await run_blocking(finish_new_email, prepared, sqs_queue_url)
+
+    try:
+        # Authenticate
+        token_provider = get_token_provider(client_id, client_secret, tenant_id)
+        session = get_session(token_provider=token_provider)
+        folder_id = await run_blocking(get_folder_id, session, user_email, folder_name)
+
+        pages = iter_message_pages(session, user_email, folder_id, folder_name, scan_name, state)
+
+        while True:
+            data = await run_blocking(next, pages, None)
+            if data is None:
+                break
+
+            new_messages, page_bodies, page_attachments = await run_blocking(
+                select_new_messages, session, user_email, folder_id, data.get("value", []), state
+            )
+
+            # Attachments upload concurrently, the page is stored in one bulk
+            # transaction, then work_ids are pushed in SQS batches; gather keeps
+            # page order, so results match the sync engine
+            prepared_emails = await asyncio.gather(*(
+                prepare(m, page_bodies.get(m.get("id")), page_attachments.get(m.get("id")))
+                for m in new_messages
+            ))
+            await run_blocking(store_new_emails, prepared_emails, entity_id)
+            publish_stored_emails(prepared_emails, sqs_queue_url)
+            page_results = await asyncio.gather(*(finish(p) for p in prepared_emails))
+            for result in page_results:
+                record_email_result(state, results, result)
+
+            # Durable progress - a crash from here on resumes after this page
+            await run_blocking(
+                checkpoint_page, state, scanner_id, entity_id, user_email, folder_name, data, page_results
+            )
+
+        await run_blocking(save_scan_state, state, scanner_id, entity_id, user_email, folder_name, 'success')
+
+        log_scan_summary(state, scan_name, scan_start_time)
+
+        return results
+
+    except Exception as e:
+        scan_latency = time.perf_counter() - scan_start_time
+        logger.error(
+            f"✗ Scan failed | scan_name={scan_name}, "
+            f"latency={scan_latency:.2f}s | Error: {str(e)}",
+            exc_info=True
+        )
+
+        await run_blocking(save_scan_state, state, scanner_id, entity_id, user_email, folder_name, 'error')
+
+        return []
+
+    finally:
+        executor.shutdown(wait=False)
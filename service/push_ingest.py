@@ -0,0 +1,180 @@
+"""
+Push-mode ingestion: Graph change notifications name new messages,
+which are fetched by id and run through the same scan steps as polling.
+
+Push processing never moves the scanner watermark or deltaLink, so the
+low-frequency safety-net poll still sees (and de-duplicates) anything a
+dropped notification would otherwise have hidden.
+"""
+import asyncio
+import hmac
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from config.settings import GRAPH_NOTIFICATION_CLIENT_STATE, PUSH_BATCH_SIZE
+from graph.auth import get_token_provider
+from graph.client import get_session
+from graph.messages import fetch_messages_by_id
+from graph.subscriptions import get_subscription
+from service.scan_steps import (
+    new_scan_state,
+    process_new_page,
+    record_email_result,
+    select_new_messages,
+)
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# (user, message_id) pairs waiting for targeted fetch-and-process
+_notification_queue: Optional[asyncio.Queue] = None
+
+
+def get_notification_queue() -> asyncio.Queue:
+    """Queue bound to the running event loop (created on first use)."""
+    global _notification_queue
+    if _notification_queue is None:
+        _notification_queue = asyncio.Queue()
+    return _notification_queue
+
+
+def _valid_client_state(notification: Dict[str, Any]) -> bool:
+    expected = GRAPH_NOTIFICATION_CLIENT_STATE or ""
+    received = notification.get("clientState") or ""
+    return bool(expected) and hmac.compare_digest(expected, received)
+
+
+def _notification_user(notification: Dict[str, Any]) -> Optional[str]:
+    """Mailbox of a notification: from our subscription, else from its resource path."""
+    subscription = get_subscription(notification.get("subscriptionId", ""))
+    if subscription:
+        return subscription["user_email"]
+    # resource looks like "Users/{user-id}/Messages/{message-id}"
+    parts = (notification.get("resource") or "").split("/")
+    if len(parts) >= 2 and parts[0].lower() == "users":
+        return parts[1]
+    return None
+
+
+def parse_notifications(payload: Dict[str, Any]) -> Tuple[List[Tuple[str, str]], List[Dict[str, Any]]]:
+    """
+    Validate a Graph notification payload.
+
+    Returns:
+        tuple: ([(user, message_id), ...] for created messages,
+                [lifecycle notifications])
+    """
+    messages: List[Tuple[str, str]] = []
+    lifecycle: List[Dict[str, Any]] = []
+
+    for notification in payload.get("value", []):
+        if not _valid_client_state(notification):
+            logger.warning(
+                f"Rejected notification with invalid clientState | "
+                f"subscription_id={notification.get('subscriptionId')}"
+            )
+            continue
+
+        if notification.get("lifecycleEvent"):
+            lifecycle.append(notification)
+            continue
+
+        message_id = (notification.get("resourceData") or {}).get("id")
+        user = _notification_user(notification)
+        if notification.get("changeType") != "created" or not message_id or not user:
+            logger.debug(f"Ignoring notification: {notification.get('changeType')} {notification.get('resource')}")
+            continue
+
+        messages.append((user, message_id))
+
+    return messages, lifecycle
+
+
+def enqueue_notifications(payload: Dict[str, Any]) -> Tuple[int, List[Dict[str, Any]]]:
+    """Queue the messages named by a notification payload; returns (queued, lifecycle events)."""
+    messages, lifecycle = parse_notifications(payload)
+    queue = get_notification_queue()
+    for item in messages:
+        queue.put_nowait(item)
+    if messages:
+        logger.info(f"Queued {len(messages)} notified message(s) | pending={queue.qsize()}")
+    return len(messages), lifecycle
+
+
+def process_notified_messages(user_email: str, email_ids: List[str],
+                              client_id: str, client_secret: str, tenant_id: str,
+                              sqs_queue_url: str) -> List[Dict[str, Any]]:
+    """Fetch notified messages by id and store them like a scan would."""
+    start_time = time.perf_counter()
+    entity_id = str(uuid.uuid4())
+    state = new_scan_state()
+    results: List[Dict[str, Any]] = []
+
+    token_provider = get_token_provider(client_id, client_secret, tenant_id)
+    session = get_session(token_provider=token_provider)
+
+    messages = fetch_messages_by_id(session, user_email, email_ids)
+
+    # Attachments are resolved per folder, so group by parent folder
+    by_folder: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for message in messages:
+        by_folder[message.get("parentFolderId")].append(message)
+
+    for folder_id, folder_messages in by_folder.items():
+        new_messages, page_bodies, page_attachments = select_new_messages(
+            session, user_email, folder_id, folder_messages, state
+        )
+        folder_results = process_new_page(
+            session,
+            user_email,
+            folder_id,
+            new_messages,
+            page_bodies,
+            page_attachments,
+            entity_id,
+            sqs_queue_url
+        )
+        for result in folder_results:
+            record_email_result(state, results, result)
+
+    logger.info(
+        f"✓ Push batch processed | user={user_email}, notified={len(email_ids)}, "
+        f"fetched={len(messages)}, new={state['new_emails']}, "
+        f"duplicates={state['duplicates_skipped']}, failed={state['failed_emails']}, "
+        f"latency={time.perf_counter() - start_time:.2f}s"
+    )
+    return results
+
+
+async def notification_worker(client_id: str, client_secret: str, tenant_id: str,
+                              sqs_queue_url: str) -> None:
+    """Drain the notification queue in batches of up to PUSH_BATCH_SIZE messages."""
+    queue = get_notification_queue()
+    logger.info("Push notification worker started")
+
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < PUSH_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+
+        by_user: Dict[str, List[str]] = defaultdict(list)
+        for user, message_id in batch:
+            if message_id not in by_user[user]:
+                by_user[user].append(message_id)
+
+        for user, email_ids in by_user.items():
+            try:
+                await asyncio.to_thread(
+                    process_notified_messages,
+                    user, email_ids, client_id, client_secret, tenant_id, sqs_queue_url
+                )
+            except Exception as e:
+                logger.error(
+                    f"✗ Push batch failed | user={user}, messages={len(email_ids)} | "
+                    f"Error: {str(e)}",
+                    exc_info=True
+                )
+
+        for _ in batch:
+            queue.task_done()
@@ -0,0 +1,593 @@
+"""
+Scan steps shared by the sync (service.fetch_email) and asyncio
+(service.async_fetch_email) scan engines.
+
+Each step is a plain blocking function; the engines only differ in how
+they schedule them. Counters live in the scan state dict returned by
+new_scan_state() and are only updated through record_email_result(),
+so both engines report identical numbers.
+"""
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from aws.push_sqs import publish_work_id
+from config.settings import GRAPH_API_ENDPOINT, GRAPH_SYNC_MODE, SCAN_EMAIL_MAX_ATTEMPTS
+from db.check_email import check_emails_exist
+from db.delta_link import get_delta_link_from_db
+from db.email_failures import record_email_failures
+from db.fetch_last_timestamp import get_last_processed_timestamp_from_db
+from db.insert_email import insert_email_with_documents, insert_emails_with_documents
+from db.seen_messages import mark_seen, note_insert_conflict, split_by_seen_filter
+from db.scan_checkpoint import RESUMABLE_STATUSES, get_scan_resume_state, save_scan_checkpoint
+from db.update_scanner import update_scanner_state_in_db
+from graph.attachments import fetch_attachments_batch, process_attachments
+from graph.messages import (
+    build_delta_headers,
+    build_delta_params,
+    build_message_list_params,
+    fetch_message_bodies,
+)
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def new_scan_state() -> Dict[str, Any]:
+    """Counters and watermark of a single scan."""
+    return {
+        "page_count": 0,
+        "new_emails": 0,
+        "duplicates_skipped": 0,
+        "attachments_uploaded": 0,
+        "sqs_sent": 0,
+        "failed_emails": 0,
+        "last_timestamp": None,
+        "last_email_id": None,
+        "new_delta_link": None,
+        # nextLink after the last fully processed delta page
+        "resume_link": None,
+        # Newest message of a delta round - delta pages are not ordered by
+        # receivedDateTime, so it only becomes the watermark once the round completes
+        "round_timestamp": None,
+        "round_email_id": None,
+        # Set by the first failed email - the watermark stops before it
+        "watermark_blocked": False,
+    }
+
+
+def _build_listing_request(user_email: str, folder_id: str, folder_name: str, delta_mode: bool,
+                           resuming: bool = False):
+    """
+    Build the first listing request from the last processed timestamp
+    (minus a 30 minute overlap, none when resuming an interrupted
+    non-delta scan, whose watermark only covers fully processed messages).
+    Returns (url, params, headers).
+    """
+    last_fetch = get_last_processed_timestamp_from_db(user_email, folder_name)
+    if not last_fetch:
+        last_fetch = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        resuming = False
+
+    overlap = timedelta(0) if resuming and not delta_mode else timedelta(minutes=30)
+    dt = datetime.fromisoformat(last_fetch.replace('Z', '+00:00')) - overlap
+    filter_param = f"receivedDateTime ge {dt.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+
+    base_url = f"{GRAPH_API_ENDPOINT}/users/{user_email}/mailFolders/{folder_id}/messages"
+    if delta_mode:
+        return f"{base_url}/delta", build_delta_params(filter_param), build_delta_headers()
+    return base_url, build_message_list_params(filter_param), None
+
+
+def iter_message_pages(session, user_email: str, folder_id: str, folder_name: str,
+                       scan_name: str, state: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield listing pages for a mailbox folder.
+
+    Delta sync resumes from the stored deltaLink; the timestamp filter is
+    only used for the first round or when the stored link has expired.
+    An interrupted scan continues from its last checkpoint: the stored
+    nextLink of its delta round, or its watermark (without overlap
+    outside delta mode).
+    The final deltaLink is kept in state["new_delta_link"].
+    """
+    delta_mode = GRAPH_SYNC_MODE == "delta"
+    resume_state = get_scan_resume_state(user_email, folder_name) or {}
+    resuming = resume_state.get("status") in RESUMABLE_STATUSES
+    resume_link = resume_state.get("resume_link") if delta_mode and resuming else None
+    delta_link = resume_link or (get_delta_link_from_db(user_email, folder_name) if delta_mode else None)
+
+    if resume_link:
+        logger.info(f"Resuming interrupted delta round from checkpoint | scan_name={scan_name}")
+        base_url, params, headers = delta_link, None, build_delta_headers()
+    elif delta_link:
+        logger.info(f"Resuming delta sync from stored deltaLink | scan_name={scan_name}")
+        base_url, params, headers = delta_link, None, build_delta_headers()
+    else:
+        if resuming:
+            logger.info(f"Resuming interrupted scan from its watermark | scan_name={scan_name}")
+        base_url, params, headers = _build_listing_request(
+            user_email, folder_id, folder_name, delta_mode, resuming
+        )
+
+    url = base_url
+
+    while url:
+        state["page_count"] += 1
+        response = session.get(url, params=params if url == base_url else None, headers=headers)
+
+        # Expired sync state - start a fresh delta round from the timestamp filter
+        if response.status_code == 410 and delta_link and url == delta_link:
+            logger.warning(
+                f"Stored deltaLink expired, falling back to timestamp filter | "
+                f"scan_name={scan_name}"
+            )
+            delta_link = None
+            state["page_count"] = 0
+            base_url, params, headers = _build_listing_request(
+                user_email, folder_id, folder_name, delta_mode, resuming
+            )
+            url = base_url
+            continue
+
+        response.raise_for_status()
+        data = response.json()
+
+        yield data
+
+        url = data.get("@odata.nextLink")
+        state["new_delta_link"] = data.get("@odata.deltaLink", state["new_delta_link"])
+
+
+def select_new_messages(session, user_email: str, folder_id: str,
+                        messages: List[Dict[str, Any]],
+                        state: Dict[str, Any]) -> Tuple[List[Dict], Dict[str, Dict], Dict[str, Optional[List[Dict]]]]:
+    """
+    Filter and de-duplicate one listing page, then resolve bodies and
+    attachment metadata for the new messages through $batch.
+
+    Returns:
+        tuple: (new messages, email_id -> body, email_id -> attachments)
+    """
+    candidates = []
+    page_ids = set()
+    for message in messages:
+        try:
+            # Delta rounds also report deletions - nothing to ingest
+            if "@removed" in message:
+                continue
+
+            subject = message.get("subject", "")
+
+            # Skip RE: and FW: emails
+            if re.search(r'^(RE:|FW:)', subject, re.IGNORECASE):
+                continue
+
+            email_id = message.get("id")
+
+            # A page can list the same message twice (e.g. delta changes)
+            if email_id in page_ids:
+                continue
+            page_ids.add(email_id)
+
+            candidates.append(message)
+
+        except Exception as e:
+            logger.error(
+                f"Message parsing failed | Error: {str(e)}",
+                exc_info=True
+            )
+            continue
+
+    # ✅ SINGLE DUPLICATE CHECK - one query for the whole page, skipping
+    # ids the in-memory filter already knows to be new
+    _, to_check = split_by_seen_filter(candidates)
+    # The page's received_at range prunes the lookup to the matching partitions
+    check_ids = set(to_check)
+    received_times = [m.get("receivedDateTime") for m in candidates if m.get("id") in check_ids]
+    if received_times and all(received_times):
+        existing_ids = check_emails_exist(to_check, min(received_times), max(received_times))
+    else:
+        existing_ids = check_emails_exist(to_check)
+    new_messages = []
+    for message in candidates:
+        if message.get("id") in existing_ids:
+            state["duplicates_skipped"] += 1
+            logger.debug(f"⏭ Duplicate email skipped: {message.get('id')[:30]}...")
+            continue
+        new_messages.append(message)
+
+    # Bodies are not part of the listing projection - fetch them for new mail only
+    page_bodies = fetch_message_bodies(
+        session,
+        user_email,
+        [m.get("id") for m in new_messages]
+    )
+
+    # Attachment metadata normally arrives expanded in the listing; only
+    # messages without it go through the per-page $batch lookup
+    page_attachments = {}
+    missing_metadata = []
+    for message in new_messages:
+        if not message.get("hasAttachments", False):
+            continue
+        if "attachments" in message:
+            page_attachments[message.get("id")] = message.pop("attachments")
+        else:
+            missing_metadata.append(message.get("id"))
+
+    page_attachments.update(
+        fetch_attachments_batch(session, user_email, folder_id, missing_metadata)
+    )
+
+    return new_messages, page_bodies, page_attachments
+
+
+def build_email_data(message: Dict[str, Any], body: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Map a Graph message to the email_data dict stored by db.insert_email."""
+    to_recipients = message.get("toRecipients", [])
+    recipient_emails = [
+        r.get("emailAddress", {}).get("address", "")
+        for r in to_recipients
+        if r.get("emailAddress", {}).get("address")
+    ]
+
+    return {
+        "graph_message": message,
+        "id": message.get("id"),
+        "conversation_id": message.get("conversationId", ""),
+        "subject": message.get("subject", ""),
+        "sender": message.get("sender", {}).get("emailAddress", {}).get("name", ""),
+        "sender_email": message.get("sender", {}).get("emailAddress", {}).get("address", ""),
+        "body": (body if body is not None else message.get("body", {})).get("content", ""),
+        "received_time": message.get("receivedDateTime", ""),
+        # ✅ FIX: Use hasAttachments flag from Graph API
+        "has_attachments": message.get("hasAttachments", False),
+        "attachment_count": 0,  # Set once attachments are uploaded
+        "recipient_mailbox": recipient_emails
+    }
+
+
+def prepare_new_email(session, user_email: str, folder_id: str,
+                      message: Dict[str, Any], body: Optional[Dict[str, Any]],
+                      attachments: Optional[List[Dict]]) -> Dict[str, Any]:
+    """
+    STEP 1 of a new email: build its row data and upload its attachments.
+    Nothing is written to the database yet.
+
+    Returns:
+        dict: {"message", "email_data", "documents", "start_time",
+               "work_id", "document_ids", "duplicate", "error"}
+    """
+    email_id = message.get("id")
+    prepared = {
+        "message": message,
+        "email_data": None,
+        "documents": [],
+        "start_time": time.perf_counter(),
+        "work_id": None,
+        "document_ids": [],
+        "duplicate": False,
+        "error": False,
+    }
+
+    try:
+        email_data = build_email_data(message, body)
+        prepared["email_data"] = email_data
+
+        # Upload ALL attachments if email has any (rows are written with the email)
+        if email_data["has_attachments"]:
+            logger.info(
+                f"Email flagged with attachments | email_id={email_id[:30]}..., "
+                f"using attachments resolved with the page..."
+            )
+
+            # None means the batch item failed - the function fetches them itself
+            documents = process_attachments(
+                session,
+                user_email,
+                folder_id,
+                email_id,
+                attachments
+            )
+            if documents is None:
+                # Attachment content could not be fetched - fail the email so
+                # the watermark stops before it and a later scan retries it
+                prepared["error"] = True
+                return prepared
+            prepared["documents"] = documents
+
+            if not prepared["documents"]:
+                logger.warning(
+                    f"⚠ No attachments uploaded | email_id={email_id[:30]}... "
+                    f"(hasAttachments=True but none stored)"
+                )
+        else:
+            logger.debug(f"No attachments to process | email_id={email_id[:30]}...")
+
+        email_data["attachment_count"] = len(prepared["documents"])
+
+    except Exception as e:
+        prepared["error"] = True
+        logger.error(
+            f"✗ Email preparation failed | email_id={email_id} | Error: {str(e)}",
+            exc_info=True
+        )
+
+    return prepared
+
+
+def store_new_emails(prepared_emails: List[Dict[str, Any]], entity_id: str) -> None:
+    """
+    STEP 2: store the prepared emails of a page and their documents with
+    one bulk transaction. Falls back to one transaction per email when the
+    bulk insert fails. Sets work_id / document_ids / duplicate in place.
+    """
+    ready = [p for p in prepared_emails if not p["error"]]
+    if not ready:
+        return
+
+    stored = insert_emails_with_documents(
+        [(p["email_data"], p["documents"]) for p in ready],
+        entity_id
+    )
+
+    if stored is None:
+        logger.warning(
+            f"⚠ Bulk page insert failed - falling back to per-email transactions | "
+            f"emails={len(ready)}"
+        )
+        for prepared in ready:
+            single = insert_email_with_documents(prepared["email_data"], entity_id, prepared["documents"])
+            if single and single[0] is None:
+                # Stored by someone else since the duplicate check
+                prepared["duplicate"] = True
+                note_insert_conflict(prepared["email_data"]["id"])
+            elif single:
+                prepared["work_id"], prepared["document_ids"] = single
+        return
+
+    for prepared in ready:
+        entry = stored.get(prepared["email_data"]["id"])
+        if entry:
+            prepared["work_id"], prepared["document_ids"] = entry
+        else:
+            # Stored by someone else since the duplicate check
+            prepared["duplicate"] = True
+            note_insert_conflict(prepared["email_data"]["id"])
+
+
+def publish_stored_emails(prepared_emails: List[Dict[str, Any]], sqs_queue_url: str) -> None:
+    """
+    Hand the work_ids of a stored page to the SQS batch publisher up front,
+    so they go out in SendMessageBatch calls of 10 instead of one by one.
+    finish_new_email waits for each result.
+    """
+    for prepared in prepared_emails:
+        if prepared["work_id"] and not prepared["error"] and not prepared["duplicate"]:
+            prepared["sqs_future"] = publish_work_id(prepared["work_id"], sqs_queue_url)
+
+
+def finish_new_email(prepared: Dict[str, Any], sqs_queue_url: str) -> Dict[str, Any]:
+    """
+    STEP 3: push the work_id of a stored email to SQS (batched - see
+    publish_stored_emails).
+
+    Returns:
+        dict: {"status": "processed" | "duplicate" | "failed", "email_id",
+               "email_data", "work_id", "attachments": stored count, "sqs_sent": bool}
+    """
+    message = prepared["message"]
+    email_id = message.get("id")
+    subject = message.get("subject", "")
+    result = {
+        "status": "failed",
+        "email_id": email_id,
+        "email_data": prepared["email_data"],
+        "work_id": None,
+        "attachments": 0,
+        "sqs_sent": False
+    }
+
+    if prepared["error"]:
+        return result
+
+    if prepared["duplicate"]:
+        logger.info(f"⏭ Email already stored, skipped: {email_id[:30]}...")
+        result["status"] = "duplicate"
+        return result
+
+    work_id = prepared["work_id"]
+    if not work_id:
+        logger.error(f"Failed to insert email: {email_id}")
+        return result
+
+    try:
+        email_attachments = len(prepared["document_ids"])
+        result["work_id"] = work_id
+        result["attachments"] = email_attachments
+        mark_seen(email_id)
+        logger.info(
+            f"Processing email | work_id={work_id}, email_id={email_id}, "
+            f"has_attachments={prepared['email_data']['has_attachments']}, "
+            f"attachments={email_attachments}, subject='{subject[:50]}...'"
+        )
+
+        # Push work_id to SQS
+        sqs_future = prepared.get("sqs_future") or publish_work_id(work_id, sqs_queue_url)
+        if sqs_future.result():
+            result["sqs_sent"] = True
+            logger.debug(f"✓ Pushed to SQS | work_id={work_id}")
+        else:
+            logger.warning(f"✗ Failed to push to SQS | work_id={work_id}")
+
+        # Calculate email processing time
+        email_latency_sec = time.perf_counter() - prepared["start_time"]
+
+        logger.info(
+            f"✓ Email processed successfully | work_id={work_id}, "
+            f"attachments={email_attachments}, latency={email_latency_sec:.2f}s"
+        )
+
+        result["status"] = "processed"
+        return result
+
+    except Exception as e:
+        email_latency = time.perf_counter() - prepared["start_time"]
+        logger.error(
+            f"✗ Email processing failed | email_id={email_id}, "
+            f"latency={email_latency:.2f}s | Error: {str(e)}",
+            exc_info=True
+        )
+        return result
+
+
+def process_new_page(session, user_email: str, folder_id: str,
+                     new_messages: List[Dict[str, Any]], bodies: Dict[str, Dict],
+                     attachments: Dict[str, Optional[List[Dict]]], entity_id: str,
+                     sqs_queue_url: str) -> List[Dict[str, Any]]:
+    """
+    Process the new messages of one page one after another: upload
+    attachments, store the page in one bulk transaction, push to SQS.
+
+    Returns:
+        list: finish_new_email results in page order
+    """
+    prepared_emails = [
+        prepare_new_email(
+            session,
+            user_email,
+            folder_id,
+            message,
+            bodies.get(message.get("id")),
+            attachments.get(message.get("id"))
+        )
+        for message in new_messages
+    ]
+    store_new_emails(prepared_emails, entity_id)
+    publish_stored_emails(prepared_emails, sqs_queue_url)
+    return [finish_new_email(prepared, sqs_queue_url) for prepared in prepared_emails]
+
+
+def record_email_result(state: Dict[str, Any], results: List[Dict[str, Any]],
+                        result: Dict[str, Any]) -> None:
+    """Fold one finish_new_email result into the scan counters."""
+    if result["status"] == "duplicate":
+        state["duplicates_skipped"] += 1
+        return
+
+    if result["work_id"]:
+        state["new_emails"] += 1
+        state["attachments_uploaded"] += result["attachments"]
+        if result["sqs_sent"]:
+            state["sqs_sent"] += 1
+
+    if result["status"] == "processed":
+        results.append(result["email_data"])
+    else:
+        state["failed_emails"] += 1
+
+
+def _given_up_emails(user_email: str, folder_name: str, failed_ids: Set[str]) -> Set[str]:
+    """
+    Failed emails that have now failed SCAN_EMAIL_MAX_ATTEMPTS scans. They
+    no longer hold the watermark, so one permanently failing email does
+    not make every round replay from it.
+    """
+    if not failed_ids or SCAN_EMAIL_MAX_ATTEMPTS <= 0:
+        return set()
+    attempts = record_email_failures(user_email, folder_name, failed_ids)
+    given_up = {email_id for email_id, count in attempts.items() if count >= SCAN_EMAIL_MAX_ATTEMPTS}
+    for email_id in given_up:
+        logger.error(
+            f"✗ Giving up on email after {attempts[email_id]} failed scans | "
+            f"user={user_email}, folder={folder_name}, email_id={email_id}"
+        )
+    return given_up
+
+
+def checkpoint_page(state: Dict[str, Any], scanner_id: str, entity_id: str,
+                    user_email: str, folder_name: str, data: Dict[str, Any],
+                    page_results: List[Dict[str, Any]]) -> None:
+    """
+    Advance the watermark over a fully processed page and persist it.
+
+    Pages are listed oldest first, so the watermark is the newest message
+    up to which every message is done (stored, duplicate or skipped). The
+    first failed email freezes it for the rest of the scan, so a later run
+    picks that email up again - until it has failed SCAN_EMAIL_MAX_ATTEMPTS
+    scans, then it is given up on. Delta pages have no such order: there only
+    the page's nextLink is stored, so an interrupted round resumes after
+    this page, and the watermark moves when save_scan_state ends the round.
+    """
+    failed_ids = {r["email_id"] for r in page_results if r["status"] == "failed"}
+    failed_ids -= _given_up_emails(user_email, folder_name, failed_ids)
+    delta_mode = GRAPH_SYNC_MODE == "delta"
+    timestamp_key, email_id_key = (
+        ("round_timestamp", "round_email_id") if delta_mode else ("last_timestamp", "last_email_id")
+    )
+
+    for message in data.get("value", []):
+        if state["watermark_blocked"]:
+            break
+        if "@removed" in message:
+            continue
+
+        email_id = message.get("id")
+        if email_id in failed_ids:
+            state["watermark_blocked"] = True
+            logger.warning(
+                f"⚠ Watermark held before failed email | email_id={email_id[:30]}..., "
+                f"watermark={state['last_timestamp']}"
+            )
+            break
+
+        received_time = message.get("receivedDateTime", "")
+        if received_time and (not state[timestamp_key] or received_time >= state[timestamp_key]):
+            state[timestamp_key] = received_time
+            state[email_id_key] = email_id
+
+    if delta_mode and not state["watermark_blocked"]:
+        state["resume_link"] = data.get("@odata.nextLink")
+
+    if state["last_timestamp"] or state["resume_link"]:
+        save_scan_checkpoint(
+            scanner_id, entity_id, user_email, folder_name,
+            state["last_timestamp"], state["last_email_id"], state["resume_link"]
+        )
+
+
+def save_scan_state(state: Dict[str, Any], scanner_id: str, entity_id: str,
+                    user_email: str, folder_name: str, status: str) -> None:
+    """
+    Persist the final scan status and watermark, and the deltaLink on
+    success. A round with a failed email keeps the previous deltaLink so
+    the next round replays it (stored messages are de-duplicated); only a
+    completed round moves the watermark in delta mode.
+    """
+    round_complete = status == 'success' and not state["watermark_blocked"]
+    new_delta_link = state["new_delta_link"] if round_complete else None
+    if round_complete and state["round_timestamp"]:
+        state["last_timestamp"] = state["round_timestamp"]
+        state["last_email_id"] = state["round_email_id"]
+    # Written even without a watermark (nothing stored yet, or a failure
+    # before the first one), so the status, history row and deltaLink are kept
+    update_scanner_state_in_db(
+        scanner_id, entity_id, user_email,
+        state["last_timestamp"], state["last_email_id"], state["new_emails"], status,
+        folder_name=folder_name,
+        delta_link=new_delta_link
+    )
+
+
+def log_scan_summary(state: Dict[str, Any], scan_name: str, scan_start_time: float) -> None:
+    # Calculate total scan time
+    scan_latency = time.perf_counter() - scan_start_time
+
+    logger.info(
+        f"✓ Scan completed | scan_name={scan_name} | "
+        f"new={state['new_emails']}, duplicates={state['duplicates_skipped']}, "
+        f"attachments={state['attachments_uploaded']}, sqs_sent={state['sqs_sent']}, "
+        f"failed={state['failed_emails']}, pages={state['page_count']}, "
+        f"latency={scan_latency:.2f}s"
+    )
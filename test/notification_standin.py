@@ -0,0 +1,70 @@
+"""
+Local stand-in for Microsoft Graph change notifications.
+
+POSTs a subscription validation request and a "created" notification for
+the given message ids to the service's /notifications endpoint, so push
+mode can be exercised without a public webhook URL.
+
+Usage:
+    PYTHONPATH=. python test/notification_standin.py <user_email> <message_id> [<message_id> ...]
+
+(run from the repo root; "python -m test..." would pick up the standard library test package)
+"""
+import json
+import sys
+import uuid
+import requests
+from config.settings import GRAPH_NOTIFICATION_CLIENT_STATE
+
+SERVICE_URL = "http://localhost:8080/notifications"
+
+
+def send_validation() -> bool:
+    """Mimic the validation handshake Graph performs on subscription creation."""
+    token = f"validation-{uuid.uuid4()}"
+    response = requests.post(SERVICE_URL, params={"validationToken": token}, timeout=10)
+    ok = response.status_code == 200 and response.text == token
+    print(f"{'✓' if ok else '❌'} Validation handshake -> {response.status_code} {response.text[:60]}")
+    return ok
+
+
+def send_notification(user_email: str, message_ids) -> bool:
+    """POST a change notification naming the given messages."""
+    payload = {
+        "value": [
+            {
+                "subscriptionId": "local-standin",
+                "clientState": GRAPH_NOTIFICATION_CLIENT_STATE,
+                "changeType": "created",
+                "resource": f"Users/{user_email}/Messages/{message_id}",
+                "resourceData": {
+                    "@odata.type": "#Microsoft.Graph.Message",
+                    "id": message_id
+                }
+            }
+            for message_id in message_ids
+        ]
+    }
+    response = requests.post(SERVICE_URL, json=payload, timeout=10)
+    ok = response.status_code == 202
+    print(f"{'✓' if ok else '❌'} Notification for {len(message_ids)} message(s) -> {response.status_code}")
+    print(json.dumps(payload, indent=2))
+    return ok
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        return 1
+    if not GRAPH_NOTIFICATION_CLIENT_STATE:
+        print("❌ GRAPH_NOTIFICATION_CLIENT_STATE is not configured")
+        return 1
+
+    user_email, message_ids = sys.argv[1], sys.argv[2:]
+    if send_validation() and send_notification(user_email, message_ids):
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())